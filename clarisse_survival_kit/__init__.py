@@ -1,10 +1,9 @@
 import sys
 import os
+import time
 import logging
-import datetime
-import site
-import platform
 
+startup_start = time.time()
 sys.dont_write_bytecode = True
 
 logging_filename = 'clarisse_survival_kit.log'
@@ -14,11 +13,11 @@ settings_path = ''
 
 def get_isotropix_user_path():
     clarisse_dir = None
-    if platform.system().lower() == "windows":
+    if sys.platform.startswith("win"):
         clarisse_dir = os.path.join(os.getenv('APPDATA'), "Isotropix\\")
-    elif platform.system().lower().startswith("linux"):
+    elif sys.platform.startswith("linux"):
         clarisse_dir = os.path.join(os.path.expanduser("~"), ".isotropix/")
-    elif platform.system().lower() == "darwin":
+    elif sys.platform == "darwin":
         homedir = os.path.expanduser('~')
         clarisse_dir = homedir + '/Library/Preferences/Isotropix/'
     return clarisse_dir
@@ -34,43 +33,24 @@ if user_path:
         init_file = open(init_path, 'w+')
         init_file.close()
 
-    log_level = logging.ERROR
     settings_path = os.path.join(user_path, settings_filename)
     if not os.path.isfile(settings_path):
         settings_file = open(settings_path, 'w+')
         settings_file.close()
-    else:
-        try:
-            from user_settings import LOG_LEVEL
-            log_level = LOG_LEVEL
-        except ImportError:
-            pass
-
-    log_path = os.path.join(user_path, logging_filename)
-    if os.path.isfile(log_path):
-        with open(log_path, "w") as log_file:
-            log_file.truncate()
     try:
-        from user_settings import PACKAGE_PATH
-        os.environ["CSK_PACKAGE_PATH"] = PACKAGE_PATH
+        import user_settings
     except ImportError:
-        sitepackages_folders = site.getsitepackages() + [site.getusersitepackages()]
-        for sitepackages_folder in sitepackages_folders:
-            if os.path.isdir(sitepackages_folder):
-                sub_folders = os.listdir(sitepackages_folder)
-                for sub_folder in sub_folders:
-                    folder_path = os.path.normpath(os.path.join(sitepackages_folder, sub_folder))
-                    if os.path.isdir(folder_path):
-                        if sub_folder == 'clarisse_survival_kit':
-                            print("Found CSK package location on disk")
-                            settings_file = open(settings_path, 'a')
-                            settings_file.write('\nPACKAGE_PATH = r"%s"' % folder_path)
-                            os.environ["CSK_PACKAGE_PATH"] = folder_path
-                            settings_file.close()
+        user_settings = None
+    log_level = getattr(user_settings, 'LOG_LEVEL', logging.ERROR)
+    # The package location is taken from this file unless PACKAGE_PATH is set in the user settings.
+    os.environ["CSK_PACKAGE_PATH"] = getattr(user_settings, 'PACKAGE_PATH', None) or \
+        os.path.dirname(os.path.abspath(__file__))
 
-    logging.basicConfig(filename=log_path, level=log_level, format='%(message)s')
-    log_start = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    log_path = os.path.join(user_path, logging_filename)
+    # The log is started fresh when the package is loaded.
+    logging.basicConfig(filename=log_path, filemode='w', level=log_level, format='%(message)s')
     logging.debug("--------------------------------------")
-    logging.debug("Log start: " + log_start)
+    logging.debug("Log start: " + time.strftime('%Y-%m-%d %H:%M:%S'))
+    logging.debug("Package loaded in %.1fms" % ((time.time() - startup_start) * 1000))
 else:
     print("Could not generate log or user settings!!!")
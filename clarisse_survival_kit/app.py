@@ -1,10 +1,12 @@
 from clarisse_survival_kit.selectors import *
 from clarisse_survival_kit.utility import *
 from clarisse_survival_kit.surface import Surface
+from clarisse_survival_kit.profiling import profiled, profile_phase
 import importlib
 import time
 
 
+@profiled('import')
 def import_controller(asset_directory, selected_provider=None, **kwargs):
     """Imports a surface, atlas or object."""
     logging.debug("Importing asset...")
@@ -15,13 +17,26 @@ def import_controller(asset_directory, selected_provider=None, **kwargs):
     if selected_provider:
         provider_names = [PROVIDERS[PROVIDERS.index(selected_provider)]]
 
+    # Indexed assets that didn't change on disk are imported straight from the library manifest. The manifest module
+    # pulls in sqlite3 so it's only imported when needed.
+    from clarisse_survival_kit.manifest import find_manifest_asset
+    with profile_phase('scan'):
+        manifest_asset = find_manifest_asset(asset_directory)
     asset = None
     for provider_name in provider_names:
         logging.debug("Checking if provider matches inspection: " + provider_name)
         provider = importlib.import_module('clarisse_survival_kit.providers.' + provider_name)
-        report = provider.inspect_asset(asset_directory)
+        plan = None
+        with profile_phase('scan'):
+            if manifest_asset and manifest_asset['provider'] == provider_name:
+                logging.debug("Asset found in library manifest.")
+                plan = provider.get_plan_from_manifest(manifest_asset, resolution=kwargs.get('resolution'),
+                                                       lod=kwargs.get('lod'))
+                report = plan['report']
+            else:
+                report = provider.inspect_asset(asset_directory)
         if report:
-            asset = provider.import_asset(asset_directory, report=report, **kwargs)
+            asset = provider.import_asset(asset_directory, report=report, plan=plan, **kwargs)
             break
         else:
             logging.debug('Provider %s did not pass inspection' % provider_name)
@@ -31,6 +46,17 @@ def import_controller(asset_directory, selected_provider=None, **kwargs):
     return asset
 
 
+def get_surface_from_descriptor(ctx, **kwargs):
+    """Returns the surface of the context if it has a valid descriptor, otherwise None. The scene isn't changed."""
+    ix = get_ix(kwargs.get("ix"))
+    surface = Surface(ix)
+    if not surface.load_descriptor(ctx):
+        return None
+    surface.ctx = ctx
+    surface.name = os.path.basename(str(ctx))
+    return surface
+
+
 def moisten_surface(ctx,
                     height_blend=True,
                     fractal_blend=False,
@@ -50,14 +76,16 @@ def moisten_surface(ctx,
     if not check_context(ctx, ix=ix):
         return None
     surface_name = os.path.basename(str(ctx))
-    ctx_members = get_items(ctx, ix=ix)
-
-    mtl = None
-    diffuse_tx = None
-    specular_tx = None
-    roughness_tx = None
-    disp = None
-    disp_tx = None
+    # Surfaces with a descriptor don't need their context crawled.
+    surface = get_surface_from_descriptor(ctx, ix=ix)
+    ctx_members = get_items(ctx, ix=ix) if not surface else []
+
+    mtl = surface.mtl if surface else None
+    diffuse_tx = surface.get('diffuse') if surface else None
+    specular_tx = surface.get('specular') if surface else None
+    roughness_tx = surface.get('roughness', fallback='gloss') if surface else None
+    disp = surface.get('displacement_map') if surface else None
+    disp_tx = surface.get('displacement') if surface else None
     for ctx_member in ctx_members:
         if ctx_member.get_contextual_name().endswith(DIFFUSE_SUFFIX):
             diffuse_tx = ctx_member
@@ -89,37 +117,17 @@ def moisten_surface(ctx,
                                           "Global", str(ctx))
 
     selectors_ctx = ix.cmds.CreateContext(MOISTURE_CTX, "Global", str(ctx))
-    # Setup fractal noise
-    fractal_selector = create_fractal_selector(selectors_ctx, surface_name, MOISTURE_SUFFIX, ix=ix)
-
-    # Setup slope gradient
-    slope_selector = create_slope_selector(selectors_ctx, surface_name, MOISTURE_SUFFIX, ix=ix)
-
-    # Setup scope
-    scope_selector = create_scope_selector(selectors_ctx, surface_name, MOISTURE_SUFFIX, ix=ix)
-
-    # Setup triplanar
-    triplanar_selector = create_triplanar_selector(selectors_ctx, surface_name, MOISTURE_SUFFIX, ix=ix)
-
-    # Setup AO
-    ao_selector = create_ao_selector(selectors_ctx, surface_name, MOISTURE_SUFFIX, ix=ix)
-
-    # Setup height blend
-    height_selector = create_height_selector(selectors_ctx, surface_name, MOISTURE_SUFFIX, ix=ix, invert=True)
-
     disp_selector = None
     # Setup displacement blend
     if disp and disp_tx:
         disp_selector = create_displacement_selector(disp_tx, selectors_ctx, surface_name, "_moisture", ix=ix)
 
     logging.debug("Assigning selectors")
-    multi_blend_tx.attrs.layer_1_label[0] = "Base intensity"
-    # Attach Ambient Occlusion blend
-    multi_blend_tx.attrs.enable_layer_2 = True
-    multi_blend_tx.attrs.layer_2_mode = 1
-    multi_blend_tx.attrs.layer_2_label[0] = "Ambient Occlusion Blend"
-    ix.cmds.SetTexture([str(multi_blend_tx) + ".layer_2_color"], str(ao_selector))
-    if not ao_blend: multi_blend_tx.attrs.enable_layer_2 = False
+    # Only the enabled selectors are created. The others can be added later with add_selectors.
+    setup_selector_layers(multi_blend_tx, selectors_ctx, surface_name, MOISTURE_SUFFIX, ix,
+                          enabled={'ao': ao_blend, 'height': height_blend, 'slope': slope_blend,
+                                   'triplanar': triplanar_blend, 'scope': scope_blend, 'fractal': fractal_blend},
+                          options={'height': {'invert': True}})
     # Attach displacement blend
     if disp_selector:
         multi_blend_tx.attrs.enable_layer_3 = True
@@ -127,36 +135,9 @@ def moisten_surface(ctx,
         multi_blend_tx.attrs.layer_3_mode = 1
         ix.cmds.SetTexture([str(multi_blend_tx) + ".layer_3_color"], str(disp_selector))
         if not displacement_blend: multi_blend_tx.attrs.enable_layer_3 = False
-    # Attach height blend
-    multi_blend_tx.attrs.enable_layer_4 = True
-    multi_blend_tx.attrs.layer_4_mode = 1
-    multi_blend_tx.attrs.layer_4_label[0] = "Height Blend"
-    ix.cmds.SetTexture([str(multi_blend_tx) + ".layer_4_color"], str(height_selector))
-    if not height_blend: multi_blend_tx.attrs.enable_layer_4 = False
-    # Attach slope blend
-    multi_blend_tx.attrs.enable_layer_5 = True
-    multi_blend_tx.attrs.layer_5_mode = 1
-    multi_blend_tx.attrs.layer_5_label[0] = "Slope Blend"
-    ix.cmds.SetTexture([str(multi_blend_tx) + ".layer_5_color"], str(slope_selector))
-    if not slope_blend: multi_blend_tx.attrs.enable_layer_5 = False
-    # Attach triplanar blend
-    multi_blend_tx.attrs.enable_layer_6 = True
-    multi_blend_tx.attrs.layer_6_mode = 1
-    multi_blend_tx.attrs.layer_6_label[0] = "Triplanar Blend"
-    ix.cmds.SetTexture([str(multi_blend_tx) + ".layer_6_color"], str(triplanar_selector))
-    if not triplanar_blend: multi_blend_tx.attrs.enable_layer_6 = False
-    # Attach scope blend
-    multi_blend_tx.attrs.enable_layer_7 = True
-    multi_blend_tx.attrs.layer_7_mode = 1
-    multi_blend_tx.attrs.layer_7_label[0] = "Scope Blend"
-    ix.cmds.SetTexture([str(multi_blend_tx) + ".layer_7_color"], str(scope_selector))
-    if not scope_blend: multi_blend_tx.attrs.enable_layer_7 = False
-    # Attach fractal blend
-    multi_blend_tx.attrs.enable_layer_8 = True
-    multi_blend_tx.attrs.layer_8_label[0] = "Fractal Blend"
-    multi_blend_tx.attrs.layer_8_mode = 4 if True in [ao_blend, height_blend, slope_blend, scope_blend] else 1
-    ix.cmds.SetTexture([str(multi_blend_tx) + ".layer_8_color"], str(fractal_selector))
-    if not fractal_blend: multi_blend_tx.attrs.enable_layer_8 = False
+
+    # The consumers of the three textures are looked up at once.
+    dependency_index = DependencyIndex(ix, [diffuse_tx, specular_tx, roughness_tx])
 
     # Setup diffuse blend
     logging.debug("Setup diffuse blend")
@@ -171,7 +152,8 @@ def moisten_surface(ctx,
     diffuse_blend_tx.attrs.mode = 7
     ix.cmds.SetTexture([str(diffuse_blend_tx) + ".mix"], str(multi_blend_tx))
 
-    replace_connections(diffuse_blend_tx, diffuse_tx, ignored_attributes=['runtime_materials', ], ix=ix)
+    replace_connections(diffuse_blend_tx, diffuse_tx, ignored_attributes=['runtime_materials', ],
+                        dependency_index=dependency_index, ix=ix)
     ix.cmds.SetTexture([str(diffuse_blend_tx) + ".input2"], str(diffuse_tx))
 
     # Setup specular blend
@@ -186,7 +168,8 @@ def moisten_surface(ctx,
     specular_blend_tx.attrs.input1[2] = specular_multiplier
     specular_blend_tx.attrs.mode = 8
 
-    replace_connections(specular_blend_tx, specular_tx, ignored_attributes=['runtime_materials', ], ix=ix)
+    replace_connections(specular_blend_tx, specular_tx, ignored_attributes=['runtime_materials', ],
+                        dependency_index=dependency_index, ix=ix)
     ix.cmds.SetTexture([str(specular_blend_tx) + ".input2"], str(specular_tx))
 
     # Setup roughness blend
@@ -201,7 +184,8 @@ def moisten_surface(ctx,
     roughness_blend_tx.attrs.input1[2] = roughness_multiplier
     roughness_blend_tx.attrs.mode = 7
 
-    replace_connections(roughness_blend_tx, roughness_tx, ignored_attributes=['runtime_materials', ], ix=ix)
+    replace_connections(roughness_blend_tx, roughness_tx, ignored_attributes=['runtime_materials', ],
+                        dependency_index=dependency_index, ix=ix)
     ix.cmds.SetTexture([str(roughness_blend_tx) + ".input2"], str(roughness_tx))
 
     # Setup IOR blend
@@ -230,9 +214,10 @@ def tint_surface(ctx, color, strength=.5, **kwargs):
     if not check_context(ctx, ix=ix):
         return None
 
-    ctx_members = get_items(ctx, ix=ix)
+    surface = get_surface_from_descriptor(ctx, ix=ix)
+    ctx_members = get_items(ctx, ix=ix) if not surface else []
     surface_name = os.path.basename(str(ctx))
-    mtl = None
+    mtl = surface.mtl if surface else None
     for ctx_member in ctx_members:
         if ctx_member.is_kindof("MaterialPhysicalStandard"):
             if ctx_member.is_local() or not mtl:
@@ -352,15 +337,18 @@ def replace_surface(ctx, surface_directory, selected_provider=None, **kwargs):
     surface.update_projection(projection=projection_type, uv_scale=uv_scale,
                               triplanar_blend=triplanar_blend, object_space=object_space, tile=True)
     surface.clean()
+    surface.save_descriptor()
     return surface
 
 
+@profiled('mix')
 def mix_surfaces(srf_ctxs, cover_ctx, mode="create", mix_name="mix" + MATERIAL_SUFFIX,
                  target_context=None, displacement_blend=True, height_blend=False,
                  ao_blend=False, fractal_blend=True, triplanar_blend=True,
                  slope_blend=True, scope_blend=True, assign_mtls=True, **kwargs):
     """Mixes one or multiple surfaces with a cover surface."""
     ix = get_ix(kwargs.get("ix"))
+    commands = CommandBuffer(ix)
     if not target_context:
         target_context = ix.application.get_working_context()
     if not check_context(target_context, ix=ix):
@@ -372,75 +360,30 @@ def mix_surfaces(srf_ctxs, cover_ctx, mode="create", mix_name="mix" + MATERIAL_S
         root_ctx = ix.cmds.CreateContext(mix_name, "Global", str(target_context))
         selectors_ctx = ix.cmds.CreateContext(MIX_SELECTORS_NAME, "Global", str(root_ctx))
 
-        cover_mtl = get_mtl_from_context(cover_ctx, ix=ix)
-        cover_disp = get_disp_from_context(cover_ctx, ix=ix)
+        cover_surface = get_surface_from_descriptor(cover_ctx, ix=ix)
+        if cover_surface:
+            cover_mtl = cover_surface.mtl
+            cover_disp = cover_surface.get('displacement_map')
+        else:
+            cover_mtl = get_mtl_from_context(cover_ctx, ix=ix)
+            cover_disp = get_disp_from_context(cover_ctx, ix=ix)
         cover_name = cover_ctx.get_name()
         logging.debug("Cover mtl: " + cover_name)
         logging.debug("Setting up common selectors...")
-        # Setup all common selectors
-        # Setup fractal noise
-        fractal_selector = create_fractal_selector(selectors_ctx, mix_name, MIX_SUFFIX, ix=ix)
-
-        # Setup slope gradient
-        slope_selector = create_slope_selector(selectors_ctx, mix_name, MIX_SUFFIX, ix=ix)
-
-        # Setup scope
-        scope_selector = create_scope_selector(selectors_ctx, mix_name, MIX_SUFFIX, ix=ix)
-
-        # Setup triplanar
-        triplanar_selector = create_triplanar_selector(selectors_ctx, mix_name, MIX_SUFFIX, ix=ix)
-
-        # Setup AO
-        ao_selector = create_ao_selector(selectors_ctx, mix_name, MIX_SUFFIX, ix=ix)
-
-        # Setup height blend
-        height_selector = create_height_selector(selectors_ctx, mix_name, MIX_SUFFIX, ix=ix)
-
-        # Put all selectors in a TextureMultiBlend
-        logging.debug("Generate master multi blend and attach selectors: ")
-        multi_blend_tx = ix.cmds.CreateObject(mix_name + MULTI_BLEND_SUFFIX, "TextureMultiBlend",
-                                              "Global", str(root_ctx))
-        multi_blend_tx.attrs.layer_1_label[0] = "Base intensity"
-        # Attach displacement blend
-        multi_blend_tx.attrs.enable_layer_2 = True
-        multi_blend_tx.attrs.layer_2_label[0] = "Displacement Blend"
-        multi_blend_tx.attrs.layer_2_mode = 1
-        # Attach Ambient Occlusion blend
-        multi_blend_tx.attrs.enable_layer_3 = True
-        multi_blend_tx.attrs.layer_3_mode = 1
-        multi_blend_tx.attrs.layer_3_label[0] = "Ambient Occlusion Blend"
-        ix.cmds.SetTexture([str(multi_blend_tx) + ".layer_3_color"], str(ao_selector))
-        if not ao_blend: multi_blend_tx.attrs.enable_layer_3 = False
-        # Attach height blend
-        multi_blend_tx.attrs.enable_layer_4 = True
-        multi_blend_tx.attrs.layer_4_mode = 1
-        multi_blend_tx.attrs.layer_4_label[0] = "Height Blend"
-        ix.cmds.SetTexture([str(multi_blend_tx) + ".layer_4_color"], str(height_selector))
-        if not height_blend: multi_blend_tx.attrs.enable_layer_4 = False
-        # Attach slope blend
-        multi_blend_tx.attrs.enable_layer_5 = True
-        multi_blend_tx.attrs.layer_5_mode = 1
-        multi_blend_tx.attrs.layer_5_label[0] = "Slope Blend"
-        ix.cmds.SetTexture([str(multi_blend_tx) + ".layer_5_color"], str(slope_selector))
-        if not slope_blend: multi_blend_tx.attrs.enable_layer_5 = False
-        # Attach triplanar blend
-        multi_blend_tx.attrs.enable_layer_6 = True
-        multi_blend_tx.attrs.layer_6_mode = 1
-        multi_blend_tx.attrs.layer_6_label[0] = "Triplanar Blend"
-        ix.cmds.SetTexture([str(multi_blend_tx) + ".layer_6_color"], str(triplanar_selector))
-        if not triplanar_blend: multi_blend_tx.attrs.enable_layer_6 = False
-        # Attach scope blend
-        multi_blend_tx.attrs.enable_layer_7 = True
-        multi_blend_tx.attrs.layer_7_mode = 1
-        multi_blend_tx.attrs.layer_7_label[0] = "Scope Blend"
-        ix.cmds.SetTexture([str(multi_blend_tx) + ".layer_7_color"], str(scope_selector))
-        if not scope_blend: multi_blend_tx.attrs.enable_layer_7 = False
-        # Attach fractal blend
-        multi_blend_tx.attrs.enable_layer_8 = True
-        multi_blend_tx.attrs.layer_8_label[0] = "Fractal Blend"
-        multi_blend_tx.attrs.layer_8_mode = 4 if True in [ao_blend, height_blend, slope_blend, scope_blend] else 1
-        ix.cmds.SetTexture([str(multi_blend_tx) + ".layer_8_color"], str(fractal_selector))
-        if not fractal_blend: multi_blend_tx.attrs.enable_layer_8 = False
+        with commands:
+            logging.debug("Generate master multi blend and attach selectors: ")
+            multi_blend_tx = ix.cmds.CreateObject(mix_name + MULTI_BLEND_SUFFIX, "TextureMultiBlend",
+                                                  "Global", str(root_ctx))
+            # Attach displacement blend
+            commands.set_value(str(multi_blend_tx) + ".enable_layer_2", True)
+            commands.set_value(str(multi_blend_tx) + ".layer_2_label[0]", "Displacement Blend")
+            commands.set_value(str(multi_blend_tx) + ".layer_2_mode", 1)
+            # Only the enabled selectors are created. The others can be added later with add_selectors.
+            setup_selector_layers(multi_blend_tx, selectors_ctx, mix_name, MIX_SUFFIX, ix,
+                                  enabled={'ao': ao_blend, 'height': height_blend, 'slope': slope_blend,
+                                           'triplanar': triplanar_blend, 'scope': scope_blend,
+                                           'fractal': fractal_blend},
+                                  layers=MIX_SELECTOR_LAYERS, commands=commands)
     elif mode == 'add':
         root_ctx = cover_ctx
         previous_blend_mtl = get_items(root_ctx, kind=['MaterialPhysicalBlend'], return_first_hit=True, ix=ix)
@@ -453,19 +396,26 @@ def mix_surfaces(srf_ctxs, cover_ctx, mode="create", mix_name="mix" + MATERIAL_S
         cover_ctx = cover_mtl.get_context()
         cover_name = cover_ctx.get_name()
         cover_disp = get_items(cover_ctx, kind=['Displacement'], return_first_hit=True, ix=ix)
+        selectors_ctx = ix.item_exists(str(root_ctx) + "/" + MIX_SELECTORS_NAME) or root_ctx
     else:
         logging.error("Can only create or add to mix.")
         return None
 
     # Set up each surface mix
+    cover_disp_nodes = None
     for srf_ctx in srf_ctxs:
         mix_srf_name = srf_ctx.get_name()
         logging.debug("Generating mix of base surface: " + mix_srf_name)
         mix_ctx = ix.cmds.CreateContext(mix_srf_name + MIX_SUFFIX, "Global", str(root_ctx))
         mix_selectors_ctx = ix.cmds.CreateContext("custom_selectors", "Global", str(mix_ctx))
 
-        base_mtl = get_mtl_from_context(srf_ctx, ix=ix)
-        base_disp = get_disp_from_context(srf_ctx, ix=ix)
+        base_surface = get_surface_from_descriptor(srf_ctx, ix=ix)
+        if base_surface:
+            base_mtl = base_surface.mtl
+            base_disp = base_surface.get('displacement_map')
+        else:
+            base_mtl = get_mtl_from_context(srf_ctx, ix=ix)
+            base_disp = get_disp_from_context(srf_ctx, ix=ix)
 
         has_displacement = base_disp and cover_disp
 
@@ -476,122 +426,67 @@ def mix_surfaces(srf_ctxs, cover_ctx, mode="create", mix_name="mix" + MATERIAL_S
         mix_multi_blend_tx = ix.get_item(moved_name)
         ix.cmds.RenameItem(str(mix_multi_blend_tx), mix_srf_name + MULTI_BLEND_SUFFIX)
         # Blend materials
-        mix_mtl = ix.cmds.CreateObject(mix_srf_name + MIX_SUFFIX + MATERIAL_SUFFIX, "MaterialPhysicalBlend", "Global",
-                                       str(mix_ctx))
-        ix.cmds.SetTexture([str(mix_mtl) + ".mix"], str(mix_multi_blend_tx))
-        ix.cmds.SetValue(str(mix_mtl) + ".input2", [str(base_mtl)])
-        ix.cmds.SetValue(str(mix_mtl) + ".input1", [str(cover_mtl)])
-
-        mix_disp = ''
-        if has_displacement:
-            logging.debug("Surface has displacement. Setting up unique selector...")
-            ix.cmds.LocalizeAttributes([str(mix_multi_blend_tx) + ".layer_2_color",
-                                        str(mix_multi_blend_tx) + ".enable_layer_2"], True)
-            # Setup displacements for height blending.
-            # Base surface
-            print("Setting up surface 1")
-            base_srf_height = base_disp.attrs.front_value[0]
-            base_disp_blend_offset_tx = ix.cmds.CreateObject(mix_srf_name + DISPLACEMENT_BLEND_OFFSET_SUFFIX,
-                                                             "TextureAdd", "Global", str(mix_selectors_ctx))
-            base_disp_tx_front_value = ix.get_item(str(base_disp) + ".front_value")
-            base_disp_tx = base_disp_tx_front_value.get_texture()
-            legacy_mode = False
-            if base_srf_height != 1:
-                print("Base surface height: " + str(base_srf_height))
-                base_disp_height_scale_tx = ix.cmds.CreateObject(mix_srf_name + DISPLACEMENT_HEIGHT_SCALE_SUFFIX,
-                                                                 "TextureMultiply", "Global", str(mix_selectors_ctx))
-                ix.cmds.SetTexture([str(base_disp_height_scale_tx) + ".input1"], str(base_disp_tx))
-
-                base_disp_height_scale_tx.attrs.input2[0] = base_srf_height
-                base_disp_height_scale_tx.attrs.input2[1] = base_srf_height
-                base_disp_height_scale_tx.attrs.input2[2] = base_srf_height
-                ix.cmds.SetTexture([str(base_disp_blend_offset_tx) + ".input1"], str(base_disp_height_scale_tx))
-                base_disp_offset_tx = ix.cmds.CreateObject(mix_srf_name + DISPLACEMENT_OFFSET_SUFFIX, "TextureAdd",
-                                                           "Global", str(mix_selectors_ctx))
-                base_disp_offset_tx.attrs.input2[0] = -0.5 * base_srf_height + 0.5
-                base_disp_offset_tx.attrs.input2[1] = -0.5 * base_srf_height + 0.5
-                base_disp_offset_tx.attrs.input2[2] = -0.5 * base_srf_height + 0.5
-                ix.cmds.SetTexture([str(base_disp_offset_tx) + ".input1"], str(base_disp_height_scale_tx))
-                legacy_mode = True
-            else:
-                base_disp_blend_offset_tx.attrs.input2[0] = 1
-                base_disp_blend_offset_tx.attrs.input2[1] = 1
-                base_disp_blend_offset_tx.attrs.input2[2] = 1
-                ix.cmds.SetTexture([str(base_disp_blend_offset_tx) + ".input1"], str(base_disp_tx))
-                base_disp_offset_tx = base_disp_tx
-
-            # Surface 2
-            print("Setting up surface 2")
-            cover_srf_height = cover_disp.attrs.front_value[0]
-
-            cover_disp_blend_offset_tx = ix.cmds.CreateObject(cover_name + DISPLACEMENT_BLEND_OFFSET_SUFFIX,
-                                                              "TextureAdd", "Global", str(mix_selectors_ctx))
-            cover_disp_tx_front_value = ix.get_item(str(cover_disp) + ".front_value")
-            cover_disp_tx = cover_disp_tx_front_value.get_texture()
-            if cover_srf_height != 1:
-                print("Surface 2 height: " + str(cover_srf_height))
-                cover_disp_height_scale_tx = ix.cmds.CreateObject(cover_name + DISPLACEMENT_HEIGHT_SCALE_SUFFIX,
-                                                                  "TextureMultiply", "Global", str(mix_selectors_ctx))
-                ix.cmds.SetTexture([str(cover_disp_height_scale_tx) + ".input1"], str(cover_disp_tx))
-                cover_disp_height_scale_tx.attrs.input2[0] = cover_srf_height
-                cover_disp_height_scale_tx.attrs.input2[1] = cover_srf_height
-                cover_disp_height_scale_tx.attrs.input2[2] = cover_srf_height
-                ix.cmds.SetTexture([str(cover_disp_blend_offset_tx) + ".input1"], str(cover_disp_height_scale_tx))
-                cover_disp_offset_tx = ix.cmds.CreateObject(cover_name + DISPLACEMENT_OFFSET_SUFFIX, "TextureAdd",
+        with commands:
+            mix_mtl = ix.cmds.CreateObject(mix_srf_name + MIX_SUFFIX + MATERIAL_SUFFIX, "MaterialPhysicalBlend",
+                                           "Global", str(mix_ctx))
+            commands.set_texture(str(mix_mtl) + ".mix", mix_multi_blend_tx)
+            commands.set_value(str(mix_mtl) + ".input2", base_mtl)
+            commands.set_value(str(mix_mtl) + ".input1", cover_mtl)
+
+            mix_disp = ''
+            if has_displacement:
+                logging.debug("Surface has displacement. Setting up unique selector...")
+                ix.cmds.LocalizeAttributes([str(mix_multi_blend_tx) + ".layer_2_color",
+                                            str(mix_multi_blend_tx) + ".enable_layer_2"], True)
+                # Setup displacements for height blending.
+                base_disp_blend_offset_tx, base_disp_offset_tx, legacy_mode = setup_displacement_normalization(
+                    base_disp, mix_selectors_ctx, mix_srf_name, ix, commands=commands)
+                # The cover surface is normalized once next to the selectors and shared by all mixed surfaces.
+                if not cover_disp_nodes:
+                    cover_disp_nodes = setup_displacement_normalization(cover_disp, selectors_ctx, cover_name, ix,
+                                                                        commands=commands)
+                cover_disp_blend_offset_tx, cover_disp_offset_tx, cover_legacy_mode = cover_disp_nodes
+                legacy_mode = legacy_mode or cover_legacy_mode
+
+                disp_branch_selector = ix.cmds.CreateObject(mix_srf_name + DISPLACEMENT_BRANCH_SUFFIX, "TextureBranch",
                                                             "Global", str(mix_selectors_ctx))
-                cover_disp_offset_tx.attrs.input2[0] = -0.5 * cover_srf_height + 0.5
-                cover_disp_offset_tx.attrs.input2[1] = -0.5 * cover_srf_height + 0.5
-                cover_disp_offset_tx.attrs.input2[2] = -0.5 * cover_srf_height + 0.5
-                ix.cmds.SetTexture([str(cover_disp_offset_tx) + ".input1"], str(cover_disp_height_scale_tx))
-                legacy_mode = True
-            else:
-                cover_disp_blend_offset_tx.attrs.input2[0] = 1
-                cover_disp_blend_offset_tx.attrs.input2[1] = 1
-                cover_disp_blend_offset_tx.attrs.input2[2] = 1
-                ix.cmds.SetTexture([str(cover_disp_blend_offset_tx) + ".input1"], str(cover_disp_tx))
-                cover_disp_offset_tx = cover_disp_tx
-
-            disp_branch_selector = ix.cmds.CreateObject(mix_srf_name + DISPLACEMENT_BRANCH_SUFFIX, "TextureBranch",
-                                                        "Global", str(mix_selectors_ctx))
-
-            ix.cmds.SetTexture([str(disp_branch_selector) + ".input_a"], str(base_disp_blend_offset_tx))
-            ix.cmds.SetTexture([str(disp_branch_selector) + ".input_b"], str(cover_disp_blend_offset_tx))
-            disp_branch_selector.attrs.mode = 2
-
-            # Hook to multiblend instance
-            ix.cmds.SetTexture([str(mix_multi_blend_tx) + ".layer_2_color"], str(disp_branch_selector))
-            if not displacement_blend: mix_multi_blend_tx.attrs.enable_layer_2 = False
-            # Finalize new Displacement map
-            disp_multi_blend_tx = ix.cmds.CreateObject(mix_srf_name + DISPLACEMENT_BLEND_SUFFIX,
-                                                       "TextureMultiBlend", "Global", str(mix_selectors_ctx))
-            ix.cmds.SetTexture([str(disp_multi_blend_tx) + ".layer_1_color"], str(base_disp_offset_tx))
-            disp_multi_blend_tx.attrs.enable_layer_2 = True
-            disp_multi_blend_tx.attrs.layer_2_label[0] = "Mix mode"
-            ix.cmds.SetTexture([str(disp_multi_blend_tx) + ".layer_2_color"], str(cover_disp_offset_tx))
-            ix.cmds.SetTexture([str(disp_multi_blend_tx) + ".layer_2_mix"], str(mix_multi_blend_tx))
-            disp_multi_blend_tx.attrs.enable_layer_3 = True
-            disp_multi_blend_tx.attrs.layer_3_label[0] = "Add mode"
-            ix.cmds.SetTexture([str(disp_multi_blend_tx) + ".layer_3_color"], str(cover_disp_offset_tx))
-            ix.cmds.SetTexture([str(disp_multi_blend_tx) + ".layer_3_mix"], str(mix_multi_blend_tx))
-            disp_multi_blend_tx.attrs.layer_3_mode = 6
-            disp_multi_blend_tx.attrs.enable_layer_3 = False
-
-            mix_disp = ix.cmds.CreateObject(mix_srf_name + DISPLACEMENT_MAP_SUFFIX, "Displacement",
-                                            "Global",
-                                            str(mix_ctx))
-            mix_disp.attrs.bound[0] = 1
-            mix_disp.attrs.bound[1] = 1
-            mix_disp.attrs.bound[2] = 1
-            mix_disp.attrs.front_value = 1
-            if legacy_mode:
-                mix_disp.attrs.front_offset = -0.5
-            ix.cmds.SetTexture([str(mix_disp) + ".front_value"], str(disp_multi_blend_tx))
+
+                commands.set_texture(str(disp_branch_selector) + ".input_a", base_disp_blend_offset_tx)
+                commands.set_texture(str(disp_branch_selector) + ".input_b", cover_disp_blend_offset_tx)
+                commands.set_value(str(disp_branch_selector) + ".mode", 2)
+
+                # Hook to multiblend instance
+                commands.set_texture(str(mix_multi_blend_tx) + ".layer_2_color", disp_branch_selector)
+                if not displacement_blend: commands.set_value(str(mix_multi_blend_tx) + ".enable_layer_2", False)
+                # Finalize new Displacement map
+                disp_multi_blend_tx = ix.cmds.CreateObject(mix_srf_name + DISPLACEMENT_BLEND_SUFFIX,
+                                                           "TextureMultiBlend", "Global", str(mix_selectors_ctx))
+                commands.set_texture(str(disp_multi_blend_tx) + ".layer_1_color", base_disp_offset_tx)
+                commands.set_value(str(disp_multi_blend_tx) + ".enable_layer_2", True)
+                commands.set_value(str(disp_multi_blend_tx) + ".layer_2_label[0]", "Mix mode")
+                commands.set_texture(str(disp_multi_blend_tx) + ".layer_2_color", cover_disp_offset_tx)
+                commands.set_texture(str(disp_multi_blend_tx) + ".layer_2_mix", mix_multi_blend_tx)
+                commands.set_value(str(disp_multi_blend_tx) + ".enable_layer_3", True)
+                commands.set_value(str(disp_multi_blend_tx) + ".layer_3_label[0]", "Add mode")
+                commands.set_texture(str(disp_multi_blend_tx) + ".layer_3_color", cover_disp_offset_tx)
+                commands.set_texture(str(disp_multi_blend_tx) + ".layer_3_mix", mix_multi_blend_tx)
+                commands.set_value(str(disp_multi_blend_tx) + ".layer_3_mode", 6)
+                commands.set_value(str(disp_multi_blend_tx) + ".enable_layer_3", False)
+
+                mix_disp = ix.cmds.CreateObject(mix_srf_name + DISPLACEMENT_MAP_SUFFIX, "Displacement",
+                                                "Global",
+                                                str(mix_ctx))
+                commands.set_values(str(mix_disp) + ".bound", [1] * 3)
+                commands.set_value(str(mix_disp) + ".front_value", 1)
+                if legacy_mode:
+                    commands.set_value(str(mix_disp) + ".front_offset", -0.5)
+                commands.set_texture(str(mix_disp) + ".front_value", disp_multi_blend_tx)
         if assign_mtls:
             mtls = get_all_mtls_from_context(srf_ctx, ix=ix)
             for mtl in mtls:
                 logging.debug("Material assignment...")
                 ix.selection.deselect_all()
-                ix.application.check_for_events()
+                pump_events(force=True, ix=ix)
                 ix.selection.select(mtl)
                 ix.application.select_next_outputs()
                 selection = [i for i in ix.selection]
@@ -607,7 +502,7 @@ def mix_surfaces(srf_ctxs, cover_ctx, mode="create", mix_name="mix" + MATERIAL_S
                                 if sel.attrs.displacements[j] == base_disp:
                                     ix.cmds.SetValues([str(sel) + ".displacements" + str([j])], [str(mix_disp)])
                 ix.selection.deselect_all()
-                ix.application.check_for_events()
+                pump_events(ix=ix)
                 logging.debug("... done material assignment.")
     logging.debug("Done mixing!!!")
     return root_ctx
@@ -688,89 +583,39 @@ def generate_decimated_pointcloud(geometry, ctx=None,
     pc_ctx = ix.cmds.CreateContext(POINTCLOUD_CTX, "Global", str(ctx))
     selectors_ctx = ix.cmds.CreateContext('selectors', "Global", str(pc_ctx))
     pc = ix.cmds.CreateObject(geo_name + POINTCLOUD_SUFFIX, pc_type, "Global", str(pc_ctx))
-    ix.application.check_for_events()
-    if pc_type == "GeometryPointCloud":
-        if use_density:
-            ix.cmds.SetValue(str(pc) + ".use_density", [str(1)])
-            ix.application.check_for_events()
-            ix.cmds.SetValue(str(pc) + ".density", [str(density)])
+    pump_events(ix=ix)
+    with CommandBuffer(ix) as commands:
+        if pc_type == "GeometryPointCloud":
+            if use_density:
+                commands.set_value(str(pc) + ".use_density", 1)
+                commands.set_value(str(pc) + ".density", density)
+            else:
+                commands.set_value(str(pc) + ".point_count", int(point_count))
         else:
-            pc.attrs.point_count = int(point_count)
-    else:
-        pc.attrs.point_count = int(point_count)
-
-    logging.debug("Parenting...")
-    ix.cmds.AddValues([str(pc) + ".constraints"], ["ConstraintParent"])
-    ix.application.check_for_events()
-    time.sleep(0.25)
-    ix.cmds.SetValues([str(pc.get_attribute('constraints').get_object().get_attribute('target'))], [str(geometry)])
-    ix.application.check_for_events()
-    logging.debug("Setting up multi blend and selectors...")
-    multi_blend_tx = ix.cmds.CreateObject(geo_name + DECIMATE_SUFFIX + MULTI_BLEND_SUFFIX, "TextureMultiBlend",
-                                          "Global", str(pc_ctx))
-    # Setup fractal noise
-    fractal_selector = create_fractal_selector(selectors_ctx, geo_name, DECIMATE_SUFFIX, ix=ix)
-
-    # Setup slope gradient
-    slope_selector = create_slope_selector(selectors_ctx, geo_name, DECIMATE_SUFFIX, ix=ix)
-
-    # Setup scope
-    scope_selector = create_scope_selector(selectors_ctx, geo_name, DECIMATE_SUFFIX, ix=ix)
-
-    # Setup triplanar
-    triplanar_selector = create_triplanar_selector(selectors_ctx, geo_name, DECIMATE_SUFFIX, ix=ix)
-
-    # Setup AO
-    ao_selector = create_ao_selector(selectors_ctx, geo_name, DECIMATE_SUFFIX, ix=ix)
-
-    # Setup height blend
-    height_selector = create_height_selector(selectors_ctx, geo_name, DECIMATE_SUFFIX, ix=ix)
-
-    multi_blend_tx.attrs.layer_1_label[0] = "Base intensity"
-    # Attach Ambient Occlusion blend
-    multi_blend_tx.attrs.enable_layer_2 = True
-    multi_blend_tx.attrs.layer_2_mode = 1
-    multi_blend_tx.attrs.layer_2_label[0] = "Ambient Occlusion Blend"
-    ix.cmds.SetTexture([str(multi_blend_tx) + ".layer_2_color"], str(ao_selector))
-    if not ao_blend: multi_blend_tx.attrs.enable_layer_2 = False
-    # Attach height blend
-    multi_blend_tx.attrs.enable_layer_4 = True
-    multi_blend_tx.attrs.layer_4_mode = 1
-    multi_blend_tx.attrs.layer_4_label[0] = "Height Blend"
-    ix.cmds.SetTexture([str(multi_blend_tx) + ".layer_4_color"], str(height_selector))
-    if not height_blend: multi_blend_tx.attrs.enable_layer_4 = False
-    # Attach slope blend
-    multi_blend_tx.attrs.enable_layer_5 = True
-    multi_blend_tx.attrs.layer_5_mode = 1
-    multi_blend_tx.attrs.layer_5_label[0] = "Slope Blend"
-    ix.cmds.SetTexture([str(multi_blend_tx) + ".layer_5_color"], str(slope_selector))
-    if not slope_blend: multi_blend_tx.attrs.enable_layer_5 = False
-    # Attach triplanar blend
-    multi_blend_tx.attrs.enable_layer_6 = True
-    multi_blend_tx.attrs.layer_6_mode = 1
-    multi_blend_tx.attrs.layer_6_label[0] = "Triplanar Blend"
-    ix.cmds.SetTexture([str(multi_blend_tx) + ".layer_6_color"], str(triplanar_selector))
-    if not triplanar_blend: multi_blend_tx.attrs.enable_layer_6 = False
-    # Attach scope blend
-    multi_blend_tx.attrs.enable_layer_7 = True
-    multi_blend_tx.attrs.layer_7_mode = 1
-    multi_blend_tx.attrs.layer_7_label[0] = "Scope Blend"
-    ix.cmds.SetTexture([str(multi_blend_tx) + ".layer_7_color"], str(scope_selector))
-    if not scope_blend: multi_blend_tx.attrs.enable_layer_7 = False
-    # Attach fractal blend
-    multi_blend_tx.attrs.enable_layer_8 = True
-    multi_blend_tx.attrs.layer_8_label[0] = "Fractal Blend"
-    multi_blend_tx.attrs.layer_8_mode = 4 if True in [ao_blend, height_blend, slope_blend, scope_blend] else 1
-    ix.cmds.SetTexture([str(multi_blend_tx) + ".layer_8_color"], str(fractal_selector))
-    if not fractal_blend: multi_blend_tx.attrs.enable_layer_8 = False
-
-    if pc_type == "GeometryPointCloud":
-        ix.cmds.SetValue(str(pc) + ".decimate_texture", [str(multi_blend_tx)])
-        ix.cmds.SetValue(str(multi_blend_tx) + ".invert", [str(1)])
-    else:
-        ix.cmds.SetValue(str(pc) + ".texture", [str(multi_blend_tx)])
+            commands.set_value(str(pc) + ".point_count", int(point_count))
+
+        logging.debug("Parenting...")
+        ix.cmds.AddValues([str(pc) + ".constraints"], ["ConstraintParent"])
+        pump_events(force=True, ix=ix)
+        time.sleep(0.25)
+        ix.cmds.SetValues([str(pc.get_attribute('constraints').get_object().get_attribute('target'))], [str(geometry)])
+        pump_events(ix=ix)
+        logging.debug("Setting up multi blend and selectors...")
+        multi_blend_tx = ix.cmds.CreateObject(geo_name + DECIMATE_SUFFIX + MULTI_BLEND_SUFFIX, "TextureMultiBlend",
+                                              "Global", str(pc_ctx))
+        # Only the enabled selectors are created. The others can be added later with add_selectors.
+        setup_selector_layers(multi_blend_tx, selectors_ctx, geo_name, DECIMATE_SUFFIX, ix,
+                              enabled={'ao': ao_blend, 'height': height_blend, 'slope': slope_blend,
+                                       'triplanar': triplanar_blend, 'scope': scope_blend, 'fractal': fractal_blend},
+                              commands=commands)
+
+        if pc_type == "GeometryPointCloud":
+            commands.set_value(str(pc) + ".decimate_texture", multi_blend_tx)
+            commands.set_value(str(multi_blend_tx) + ".invert", 1)
+        else:
+            commands.set_value(str(pc) + ".texture", multi_blend_tx)
 
-    ix.cmds.SetValue(str(pc) + ".geometry", [str(geometry)])
+        commands.set_value(str(pc) + ".geometry", geometry)
     logging.debug("Done generating point cloud!!!")
     return pc
 
@@ -793,71 +638,58 @@ def mask_blend_nodes(blend_nodes, ctx=None, mix_name='mix',
 
     selectors_ctx = ix.cmds.CreateContext(MIX_SELECTORS_NAME, "Global", str(ctx))
 
-    multi_blend_tx = ix.cmds.CreateObject(mix_name + MULTI_BLEND_SUFFIX, "TextureMultiBlend",
-                                          "Global", str(ctx))
-    # Setup fractal noise
-    fractal_selector = create_fractal_selector(selectors_ctx, mix_name, MIX_SUFFIX, ix=ix)
-
-    # Setup slope gradient
-    slope_selector = create_slope_selector(selectors_ctx, mix_name, MIX_SUFFIX, ix=ix)
-
-    # Setup scope
-    scope_selector = create_scope_selector(selectors_ctx, mix_name, MIX_SUFFIX, ix=ix)
-
-    # Setup triplanar
-    triplanar_selector = create_triplanar_selector(selectors_ctx, mix_name, MIX_SUFFIX, ix=ix)
-
-    # Setup AO
-    ao_selector = create_ao_selector(selectors_ctx, mix_name, MIX_SUFFIX, ix=ix)
-
-    # Setup height blend
-    height_selector = create_height_selector(selectors_ctx, mix_name, MIX_SUFFIX, ix=ix)
-
-    multi_blend_tx.attrs.layer_1_label[0] = "Base intensity"
-    # Attach Ambient Occlusion blend
-    multi_blend_tx.attrs.enable_layer_2 = True
-    multi_blend_tx.attrs.layer_2_mode = 1
-    multi_blend_tx.attrs.layer_2_label[0] = "Ambient Occlusion Blend"
-    ix.cmds.SetTexture([str(multi_blend_tx) + ".layer_2_color"], str(ao_selector))
-    if not ao_blend: multi_blend_tx.attrs.enable_layer_2 = False
-    # Attach height blend
-    multi_blend_tx.attrs.enable_layer_4 = True
-    multi_blend_tx.attrs.layer_4_mode = 1
-    multi_blend_tx.attrs.layer_4_label[0] = "Height Blend"
-    ix.cmds.SetTexture([str(multi_blend_tx) + ".layer_4_color"], str(height_selector))
-    if not height_blend: multi_blend_tx.attrs.enable_layer_4 = False
-    # Attach slope blend
-    multi_blend_tx.attrs.enable_layer_5 = True
-    multi_blend_tx.attrs.layer_5_mode = 1
-    multi_blend_tx.attrs.layer_5_label[0] = "Slope Blend"
-    ix.cmds.SetTexture([str(multi_blend_tx) + ".layer_5_color"], str(slope_selector))
-    if not slope_blend: multi_blend_tx.attrs.enable_layer_5 = False
-    # Attach triplanar blend
-    multi_blend_tx.attrs.enable_layer_6 = True
-    multi_blend_tx.attrs.layer_6_mode = 1
-    multi_blend_tx.attrs.layer_6_label[0] = "Triplanar Blend"
-    ix.cmds.SetTexture([str(multi_blend_tx) + ".layer_6_color"], str(triplanar_selector))
-    if not triplanar_blend: multi_blend_tx.attrs.enable_layer_6 = False
-    # Attach scope blend
-    multi_blend_tx.attrs.enable_layer_7 = True
-    multi_blend_tx.attrs.layer_7_mode = 1
-    multi_blend_tx.attrs.layer_7_label[0] = "Scope Blend"
-    ix.cmds.SetTexture([str(multi_blend_tx) + ".layer_7_color"], str(scope_selector))
-    if not scope_blend: multi_blend_tx.attrs.enable_layer_7 = False
-    # Attach fractal blend
-    multi_blend_tx.attrs.enable_layer_8 = True
-    multi_blend_tx.attrs.layer_8_label[0] = "Fractal Blend"
-    multi_blend_tx.attrs.layer_8_mode = 4 if True in [ao_blend, height_blend, slope_blend, scope_blend] else 1
-    ix.cmds.SetTexture([str(multi_blend_tx) + ".layer_8_color"], str(fractal_selector))
-    if not fractal_blend: multi_blend_tx.attrs.enable_layer_8 = False
-
-    for blend_node in blend_nodes:
-        ix.cmds.SetTexture([str(blend_node) + ".mix"], str(multi_blend_tx))
+    with CommandBuffer(ix) as commands:
+        multi_blend_tx = ix.cmds.CreateObject(mix_name + MULTI_BLEND_SUFFIX, "TextureMultiBlend",
+                                              "Global", str(ctx))
+        # Only the enabled selectors are created. The others can be added later with add_selectors.
+        setup_selector_layers(multi_blend_tx, selectors_ctx, mix_name, MIX_SUFFIX, ix,
+                              enabled={'ao': ao_blend, 'height': height_blend, 'slope': slope_blend,
+                                       'triplanar': triplanar_blend, 'scope': scope_blend, 'fractal': fractal_blend},
+                              commands=commands)
+
+        for blend_node in blend_nodes:
+            commands.set_texture(str(blend_node) + ".mix", multi_blend_tx)
 
     logging.debug("Done adding selectors!!!")
     return multi_blend_tx
 
 
+def add_selectors(multi_blend_tx, enabled, **kwargs):
+    """Adds the enabled selectors to the TextureMultiBlend of a mix, mask, moisture or point cloud. Selectors that
+    weren't created with it are created next to the existing ones, the others are enabled again."""
+    ix = get_ix(kwargs.get("ix"))
+    layers = get_selector_layers(multi_blend_tx)
+    if not layers:
+        ix.log_warning("No selector layers found in: " + str(multi_blend_tx))
+        return []
+    ctx = multi_blend_tx.get_context()
+    selectors_ctx = None
+    for layer in layers.values():
+        selector_tx = ix.get_item(str(multi_blend_tx) + ".layer_%i_color" % layer).get_texture()
+        if selector_tx:
+            selectors_ctx = selector_tx.get_context()
+            break
+    if not selectors_ctx:
+        selectors_ctx = ix.item_exists(str(ctx) + "/" + MIX_SELECTORS_NAME) or \
+                        ix.item_exists(str(ctx) + "/" + MOISTURE_CTX) or ctx
+    name = multi_blend_tx.get_contextual_name()
+    if name.endswith(MULTI_BLEND_SUFFIX):
+        name = name[:-len(MULTI_BLEND_SUFFIX)]
+    # The multi blends of mixes and masks are named without the suffix of their selectors.
+    if not name.endswith((MOISTURE_SUFFIX, DECIMATE_SUFFIX)):
+        name += MIX_SUFFIX
+    # Moisture selects the low areas, like in moisten_surface.
+    options = {'height': {'invert': True}} if name.endswith(MOISTURE_SUFFIX) else {}
+    selectors = []
+    with CommandBuffer(ix) as commands:
+        for selector, layer in layers.items():
+            if enabled.get(selector):
+                selectors.append(add_selector_layer(multi_blend_tx, selector, selectors_ctx, name, "", ix,
+                                                    layers=layers, options=options.get(selector), commands=commands))
+    logging.debug("Done adding selectors!!!")
+    return selectors
+
+
 def create_tiled_terrain(divisions_x, divisions_y, ctx=None, tile_flip_x=False, tile_flip_y=False,
                          tile_pattern=r".*_x(?P<tile_x>\d+)_y(?P<tile_y>\d+)\.", **kwargs):
     """Generates a tiled displaced terrain from the selected heightmap."""
@@ -947,8 +779,12 @@ def create_tiled_terrain(divisions_x, divisions_y, ctx=None, tile_flip_x=False,
 
     terrain_root_ctrl = ix.cmds.CombineItems(tiles, str(terrain_ctx))
     ix.cmds.RenameItem(str(terrain_root_ctrl), 'terrain_master_ctrl')
-    ix.cmds.SetValue(str(terrain_root_ctrl) + ".display_pickable", ['0'])
-    ix.cmds.SetValue(str(terrain_root_ctrl) + ".highlight_mode", ['1'])
+    commands = CommandBuffer(ix)
+    commands.set_value(str(terrain_root_ctrl) + ".display_pickable", 0)
+    commands.set_value(str(terrain_root_ctrl) + ".highlight_mode", 1)
+    for tile in tiles:
+        commands.set_value(str(tile) + ".unseen_by_renderer", 1)
+    commands.flush()
     # Proxy switch boolean
     # ix.cmds.CreateCustomAttribute([str(terrain_root_ctrl)], "show_tiles", 0,
     #                               ["container", "vhint", "group", "count", "allow_expression"],
@@ -963,9 +799,8 @@ def create_tiled_terrain(divisions_x, divisions_y, ctx=None, tile_flip_x=False,
     # ix.cmds.SetValue(str(terrain_root_ctrl) + ".lod_radius", ['1024'])
 
     # terrain_root_ctrl = ix.cmds.CreateObject("terrain_master_ctrl", "Locator", "Global", str(terrain_ctx))
-    ix.application.check_for_events()
+    pump_events(ix=ix)
     for tile in tiles:
-        ix.cmds.SetValue(str(tile) + ".unseen_by_renderer", ['1'])
         ix.cmds.LockAttributes([str(tile) + ".translate"], True)
         ix.cmds.LockAttributes([str(tile) + ".rotate"], True)
         ix.cmds.LockAttributes([str(tile) + ".scale"], True)
@@ -992,6 +827,7 @@ def create_tiled_terrain(divisions_x, divisions_y, ctx=None, tile_flip_x=False,
     return terrain_root_ctrl
 
 
+@profiled('terrain')
 def create_terrain(heightmap_file, terrain_name='terrain', ctx=None,
                    dimensions=('2048', '2048', '400'),
                    stream=True,
@@ -1036,184 +872,144 @@ def create_terrain(heightmap_file, terrain_name='terrain', ctx=None,
             spans_x = int(float(dimensions[0]) / (dimensions[1]) * spans)
             proxy_spans_x = int(float(dimensions[0]) / (dimensions[1]) * proxy_spans)
 
+    commands = CommandBuffer(ix)
     terrain_geo = ix.cmds.CreateObject("terrain_geo", "GeometryPolygrid", "Global", str(terrain_ctx))
-    ix.cmds.SetValue(str(terrain_geo) + ".displacement_adaptive_span_count", [str(adaptive_spans)])
-    ix.cmds.SetValue(str(terrain_geo) + ".size[0]", [str(dimensions[0])])
-    ix.cmds.SetValue(str(terrain_geo) + ".size[1]", [str(dimensions[1])])
-    ix.cmds.SetValue(str(terrain_geo) + ".spans[0]", [str(spans_x)])
-    ix.cmds.SetValue(str(terrain_geo) + ".spans[1]", [str(spans_y)])
-    ix.cmds.SetValue(str(terrain_geo) + ".unseen_by_renderer", [str(1)])
-    ix.cmds.SetValue(str(terrain_geo) + ".display_visible", [str(0)])
+    # The proxy instance localizes the current values of the terrain so they are sent before instancing.
+    with commands:
+        commands.set_value(str(terrain_geo) + ".displacement_adaptive_span_count", adaptive_spans)
+        commands.set_values(str(terrain_geo) + ".size", dimensions[:2])
+        commands.set_values(str(terrain_geo) + ".spans", [spans_x, spans_y])
+        commands.set_value(str(terrain_geo) + ".unseen_by_renderer", 1)
+        commands.set_value(str(terrain_geo) + ".display_visible", 0)
     terrain_geo_items.append(terrain_geo)
 
     if generate_proxy:
         proxy_geo = ix.cmds.Instantiate([str(terrain_geo)])[0]
         ix.cmds.LocalizeAttributes([str(proxy_geo) + ".displacement_adaptive_span_count", str(proxy_geo) + ".spans"],
                                    True)
-        ix.cmds.SetValue(str(proxy_geo) + ".displacement_adaptive_span_count", [str(int(proxy_adaptive_spans))])
-        ix.cmds.SetValue(str(proxy_geo) + ".spans[0]", [str(proxy_spans_x)])
-        ix.cmds.SetValue(str(proxy_geo) + ".spans[1]", [str(proxy_spans_y)])
-        ix.application.check_for_events()
+        with commands:
+            commands.set_value(str(proxy_geo) + ".displacement_adaptive_span_count", int(proxy_adaptive_spans))
+            commands.set_values(str(proxy_geo) + ".spans", [proxy_spans_x, proxy_spans_y])
+        pump_events(ix=ix)
         ix.cmds.RenameItem(str(proxy_geo), 'proxy_geo')
-        ix.application.check_for_events()
+        pump_events(ix=ix)
         terrain_geo_items.append(proxy_geo)
     else:
         proxy_geo = None
     reorder_tx = None
 
-    if stream:
-        tx = ix.cmds.CreateObject('heightmap', "TextureStreamedMapFile", "Global", str(terrain_ctx))
-        if displacement_mode == 0:
-            reorder_tx = ix.cmds.CreateObject('heightmap' + SINGLE_CHANNEL_SUFFIX, "TextureReorder",
-                                              "Global", str(terrain_ctx))
-            ix.cmds.SetValue(str(reorder_tx) + ".channel_order[0]", ["rrr1"])
-            ix.cmds.SetTexture([str(reorder_tx) + ".input"], str(tx))
-        attrs = ix.api.CoreStringArray(6)
-        attrs[0] = str(tx) + ".interpolation_mode"
-        attrs[1] = str(tx) + ".mipmap_mode"
-        attrs[2] = str(tx) + ".u_repeat_mode"
-        attrs[3] = str(tx) + ".v_repeat_mode"
-        attrs[4] = str(tx) + ".use_raw_data"
-        attrs[5] = str(tx) + ".filename"
-        values = ix.api.CoreStringArray(6)
-        values[0] = str(3)
-        values[1] = str(3)
-        values[2] = str(2 if repeat == 'edge' else 3)
-        values[3] = str(2 if repeat == 'edge' else 3)
-        values[4] = str(1)
-        values[5] = r'{}'.format(heightmap_file)
-        ix.cmds.SetValues(attrs, values)
-    else:
-        tx = ix.cmds.CreateObject('heightmap', "TextureMapFile", "Global", str(terrain_ctx))
-        attrs = ix.api.CoreStringArray(5)
-        attrs[0] = str(tx) + ".single_channel_file_behavior"
-        attrs[1] = str(tx) + ".u_repeat_mode"
-        attrs[2] = str(tx) + ".v_repeat_mode"
-        attrs[3] = str(tx) + ".use_raw_data"
-        attrs[4] = str(tx) + ".filename"
-        values = ix.api.CoreStringArray(5)
-        values[0] = str(1)
-        values[1] = str(1 if repeat == 'edge' else 0)
-        values[2] = str(1 if repeat == 'edge' else 0)
-        values[3] = str(1)
-        values[4] = r'{}'.format(heightmap_file)
-        ix.cmds.SetValues(attrs, values)
-
-    # set projection scale
-    if 1 not in [u_scale, v_scale]:
-        attrs = ix.api.CoreStringArray(4)
-        attrs[0] = str(tx) + ".uv_translate[0]"
-        attrs[1] = str(tx) + ".uv_translate[1]"
-        attrs[2] = str(tx) + ".uv_scale[0]"
-        attrs[3] = str(tx) + ".uv_scale[1]"
-        values = ix.api.CoreStringArray(4)
-        values[0] = str(u_offset)
-        values[1] = str(v_offset)
-        values[2] = str(u_scale)
-        values[3] = str(v_scale)
-        ix.cmds.SetValues(attrs, values)
+    with commands:
+        if stream:
+            tx = ix.cmds.CreateObject('heightmap', "TextureStreamedMapFile", "Global", str(terrain_ctx))
+            if displacement_mode == 0:
+                reorder_tx = ix.cmds.CreateObject('heightmap' + SINGLE_CHANNEL_SUFFIX, "TextureReorder",
+                                                  "Global", str(terrain_ctx))
+                commands.set_value(str(reorder_tx) + ".channel_order[0]", "rrr1")
+                commands.set_texture(str(reorder_tx) + ".input", tx)
+            commands.set_value(str(tx) + ".interpolation_mode", 3)
+            commands.set_value(str(tx) + ".mipmap_mode", 3)
+            commands.set_value(str(tx) + ".u_repeat_mode", 2 if repeat == 'edge' else 3)
+            commands.set_value(str(tx) + ".v_repeat_mode", 2 if repeat == 'edge' else 3)
+            commands.set_value(str(tx) + ".use_raw_data", 1)
+            commands.set_value(str(tx) + ".filename", r'{}'.format(heightmap_file))
+        else:
+            tx = ix.cmds.CreateObject('heightmap', "TextureMapFile", "Global", str(terrain_ctx))
+            commands.set_value(str(tx) + ".single_channel_file_behavior", 1)
+            commands.set_value(str(tx) + ".u_repeat_mode", 1 if repeat == 'edge' else 0)
+            commands.set_value(str(tx) + ".v_repeat_mode", 1 if repeat == 'edge' else 0)
+            commands.set_value(str(tx) + ".use_raw_data", 1)
+            commands.set_value(str(tx) + ".filename", r'{}'.format(heightmap_file))
+
+        # set projection scale
+        if 1 not in [u_scale, v_scale]:
+            commands.set_values(str(tx) + ".uv_translate", [u_offset, v_offset])
+            commands.set_values(str(tx) + ".uv_scale", [u_scale, v_scale])
 
     if animated:
+        # Sequences are detected from the filename so it must be set first.
         ix.cmds.SetValue(str(tx) + ".sequence_mode", [str(1)])
         tx.call_action("detect_sequence")
-        ix.application.check_for_events()
-        ix.cmds.SetValue(str(tx) + ".pre_behavior", [str(2)])
-        ix.cmds.SetValue(str(tx) + ".post_behavior", [str(2)])
+        pump_events(force=True, ix=ix)
 
     disp = ix.cmds.CreateObject(terrain_name + DISPLACEMENT_MAP_SUFFIX, "Displacement",
                                 "Global", str(terrain_ctx))
-    attrs = ix.api.CoreStringArray(6)
-    attrs[0] = str(disp) + ".bound[0]"
-    attrs[1] = str(disp) + ".bound[1]"
-    attrs[2] = str(disp) + ".bound[2]"
-    attrs[3] = str(disp) + ".front_value"
-    attrs[4] = str(disp) + ".front_offset"
-    attrs[5] = str(disp) + ".front_direction"
-    values = ix.api.CoreStringArray(6)
-    values[0] = str(dimensions[2] * 1.1)
-    values[1] = str(dimensions[2] * 1.1)
-    values[2] = str(dimensions[2] * 1.1)
-    values[3] = str(dimensions[2])
-    values[4] = str(-0.5 if use_midpoint else 0)
-    values[5] = str(displacement_mode)
-    ix.cmds.SetValues(attrs, values)
-    ix.application.check_for_events()
-    ix.cmds.SetTexture([str(disp) + ".front_value"], str(reorder_tx if reorder_tx else tx))
+    with commands:
+        if animated:
+            commands.set_value(str(tx) + ".pre_behavior", 2)
+            commands.set_value(str(tx) + ".post_behavior", 2)
+        commands.set_values(str(disp) + ".bound", [dimensions[2] * 1.1] * 3)
+        commands.set_value(str(disp) + ".front_value", dimensions[2])
+        commands.set_value(str(disp) + ".front_offset", -0.5 if use_midpoint else 0)
+        commands.set_value(str(disp) + ".front_direction", displacement_mode)
+        commands.set_texture(str(disp) + ".front_value", reorder_tx if reorder_tx else tx)
 
     if generate_proxy:
         switcher_grp = ix.cmds.CreateObject(terrain_name + GROUP_SUFFIX, "Group", "Global", str(terrain_ctx))
         terrain_ctrl = ix.cmds.CombineItems([str(switcher_grp)], str(terrain_ctx))
         ix.cmds.RenameItem(str(terrain_ctrl), 'terrain_ctrl')
-        attrs = ix.api.CoreStringArray(3)
-        attrs[0] = str(terrain_ctrl) + ".translate_offset[0]"
-        attrs[1] = str(terrain_ctrl) + ".translate_offset[1]"
-        attrs[2] = str(terrain_ctrl) + ".translate_offset[2]"
-        values = ix.api.CoreStringArray(3)
-        values[0] = str(position[0])
-        values[1] = str(position[1])
-        values[2] = str(position[2])
-        ix.cmds.SetValues(attrs, values)
-
-        # Proxy switch boolean
-        ix.cmds.CreateCustomAttribute([str(terrain_ctrl)], "proxy", 0,
-                                      ["container", "vhint", "group", "count", "allow_expression"],
-                                      ["CONTAINER_SINGLE", "VISUAL_HINT_DEFAULT", "Terrain", "1", "0"])
-        # ix.cmds.CreateCustomAttribute([str(terrain_ctrl)], "proxy_control_by_lod", 0,
-        #                               ["container", "vhint", "group", "count", "allow_expression"],
-        #                               ["CONTAINER_SINGLE", "VISUAL_HINT_DEFAULT", "Terrain", "1", "0"])
-        # Heightmap filename
-        ix.cmds.CreateCustomAttribute([str(terrain_ctrl)], "filename", 4,
-                                      ["container", "vhint", "group", "count", "allow_expression"],
-                                      ["CONTAINER_SINGLE", "VISUAL_HINT_DEFAULT", "Terrain", "1", "0"])
-        # Width
-        ix.cmds.CreateCustomAttribute([str(terrain_ctrl)], "terrain_width", 2,
-                                      ["container", "vhint", "group", "count", "allow_expression"],
-                                      ["CONTAINER_SINGLE", "VISUAL_HINT_DEFAULT", "Terrain", "1", "0"])
-        # Length
-        ix.cmds.CreateCustomAttribute([str(terrain_ctrl)], "terrain_length", 2,
-                                      ["container", "vhint", "group", "count", "allow_expression"],
-                                      ["CONTAINER_SINGLE", "VISUAL_HINT_DEFAULT", "Terrain", "1", "0"])
-        # Height
-        ix.cmds.CreateCustomAttribute([str(terrain_ctrl)], "terrain_height", 2,
-                                      ["container", "vhint", "group", "count", "allow_expression"],
-                                      ["CONTAINER_SINGLE", "VISUAL_HINT_DEFAULT", "Terrain", "1", "0"])
-        # Displacement spans
-        ix.cmds.CreateCustomAttribute([str(terrain_ctrl)], "adaptive_spans", 1,
-                                      ["container", "vhint", "group", "count", "allow_expression"],
-                                      ["CONTAINER_SINGLE", "VISUAL_HINT_DEFAULT", "Terrain", "1", "0"])
-        # Polygrid spans
-        ix.cmds.CreateCustomAttribute([str(terrain_ctrl)], "spans_x", 1,
-                                      ["container", "vhint", "group", "count", "allow_expression"],
-                                      ["CONTAINER_SINGLE", "VISUAL_HINT_DEFAULT", "Terrain", "1", "0"])
-        ix.cmds.CreateCustomAttribute([str(terrain_ctrl)], "spans_y", 1,
-                                      ["container", "vhint", "group", "count", "allow_expression"],
-                                      ["CONTAINER_SINGLE", "VISUAL_HINT_DEFAULT", "Terrain", "1", "0"])
-        # Proxy adaptive spans
-        ix.cmds.CreateCustomAttribute([str(terrain_ctrl)], "proxy_adaptive_spans", 1,
-                                      ["container", "vhint", "group", "count", "allow_expression"],
-                                      ["CONTAINER_SINGLE", "VISUAL_HINT_DEFAULT", "Terrain", "1", "0"])
-        # Proxy spans
-        ix.cmds.CreateCustomAttribute([str(terrain_ctrl)], "proxy_spans_x", 1,
-                                      ["container", "vhint", "group", "count", "allow_expression"],
-                                      ["CONTAINER_SINGLE", "VISUAL_HINT_DEFAULT", "Terrain", "1", "0"])
-        ix.cmds.CreateCustomAttribute([str(terrain_ctrl)], "proxy_spans_y", 1,
-                                      ["container", "vhint", "group", "count", "allow_expression"],
-                                      ["CONTAINER_SINGLE", "VISUAL_HINT_DEFAULT", "Terrain", "1", "0"])
-
-        ix.cmds.SetValue(str(terrain_ctrl) + ".proxy", [str(1)])
-        # ix.cmds.SetValue(str(terrain_ctrl) + ".proxy_control_by_lod", [str(0)])
-        ix.cmds.SetValue(str(terrain_ctrl) + ".filename", [heightmap_file])
-        ix.cmds.SetValue(str(terrain_ctrl) + ".terrain_width", [str(dimensions[0])])
-        ix.cmds.SetValue(str(terrain_ctrl) + ".terrain_length", [str(dimensions[1])])
-        ix.cmds.SetValue(str(terrain_ctrl) + ".terrain_height", [str(dimensions[2])])
-        ix.cmds.SetValue(str(terrain_ctrl) + ".adaptive_spans", [str(adaptive_spans)])
-        ix.cmds.SetValue(str(terrain_ctrl) + ".spans_x", [str(spans_x)])
-        ix.cmds.SetValue(str(terrain_ctrl) + ".spans_y", [str(spans_y)])
-        ix.cmds.SetValue(str(terrain_ctrl) + ".proxy_adaptive_spans", [str(int(proxy_adaptive_spans))])
-        ix.cmds.SetValue(str(terrain_ctrl) + ".proxy_spans_x", [str(int(proxy_spans_x))])
-        ix.cmds.SetValue(str(terrain_ctrl) + ".proxy_spans_y", [str(int(proxy_spans_y))])
-
-        ix.application.check_for_events()
+        with commands:
+            commands.set_values(str(terrain_ctrl) + ".translate_offset", position)
+
+            # Proxy switch boolean
+            ix.cmds.CreateCustomAttribute([str(terrain_ctrl)], "proxy", 0,
+                                          ["container", "vhint", "group", "count", "allow_expression"],
+                                          ["CONTAINER_SINGLE", "VISUAL_HINT_DEFAULT", "Terrain", "1", "0"])
+            # ix.cmds.CreateCustomAttribute([str(terrain_ctrl)], "proxy_control_by_lod", 0,
+            #                               ["container", "vhint", "group", "count", "allow_expression"],
+            #                               ["CONTAINER_SINGLE", "VISUAL_HINT_DEFAULT", "Terrain", "1", "0"])
+            # Heightmap filename
+            ix.cmds.CreateCustomAttribute([str(terrain_ctrl)], "filename", 4,
+                                          ["container", "vhint", "group", "count", "allow_expression"],
+                                          ["CONTAINER_SINGLE", "VISUAL_HINT_DEFAULT", "Terrain", "1", "0"])
+            # Width
+            ix.cmds.CreateCustomAttribute([str(terrain_ctrl)], "terrain_width", 2,
+                                          ["container", "vhint", "group", "count", "allow_expression"],
+                                          ["CONTAINER_SINGLE", "VISUAL_HINT_DEFAULT", "Terrain", "1", "0"])
+            # Length
+            ix.cmds.CreateCustomAttribute([str(terrain_ctrl)], "terrain_length", 2,
+                                          ["container", "vhint", "group", "count", "allow_expression"],
+                                          ["CONTAINER_SINGLE", "VISUAL_HINT_DEFAULT", "Terrain", "1", "0"])
+            # Height
+            ix.cmds.CreateCustomAttribute([str(terrain_ctrl)], "terrain_height", 2,
+                                          ["container", "vhint", "group", "count", "allow_expression"],
+                                          ["CONTAINER_SINGLE", "VISUAL_HINT_DEFAULT", "Terrain", "1", "0"])
+            # Displacement spans
+            ix.cmds.CreateCustomAttribute([str(terrain_ctrl)], "adaptive_spans", 1,
+                                          ["container", "vhint", "group", "count", "allow_expression"],
+                                          ["CONTAINER_SINGLE", "VISUAL_HINT_DEFAULT", "Terrain", "1", "0"])
+            # Polygrid spans
+            ix.cmds.CreateCustomAttribute([str(terrain_ctrl)], "spans_x", 1,
+                                          ["container", "vhint", "group", "count", "allow_expression"],
+                                          ["CONTAINER_SINGLE", "VISUAL_HINT_DEFAULT", "Terrain", "1", "0"])
+            ix.cmds.CreateCustomAttribute([str(terrain_ctrl)], "spans_y", 1,
+                                          ["container", "vhint", "group", "count", "allow_expression"],
+                                          ["CONTAINER_SINGLE", "VISUAL_HINT_DEFAULT", "Terrain", "1", "0"])
+            # Proxy adaptive spans
+            ix.cmds.CreateCustomAttribute([str(terrain_ctrl)], "proxy_adaptive_spans", 1,
+                                          ["container", "vhint", "group", "count", "allow_expression"],
+                                          ["CONTAINER_SINGLE", "VISUAL_HINT_DEFAULT", "Terrain", "1", "0"])
+            # Proxy spans
+            ix.cmds.CreateCustomAttribute([str(terrain_ctrl)], "proxy_spans_x", 1,
+                                          ["container", "vhint", "group", "count", "allow_expression"],
+                                          ["CONTAINER_SINGLE", "VISUAL_HINT_DEFAULT", "Terrain", "1", "0"])
+            ix.cmds.CreateCustomAttribute([str(terrain_ctrl)], "proxy_spans_y", 1,
+                                          ["container", "vhint", "group", "count", "allow_expression"],
+                                          ["CONTAINER_SINGLE", "VISUAL_HINT_DEFAULT", "Terrain", "1", "0"])
+
+            commands.set_value(str(terrain_ctrl) + ".proxy", 1)
+            # commands.set_value(str(terrain_ctrl) + ".proxy_control_by_lod", 0)
+            commands.set_value(str(terrain_ctrl) + ".filename", heightmap_file)
+            commands.set_value(str(terrain_ctrl) + ".terrain_width", dimensions[0])
+            commands.set_value(str(terrain_ctrl) + ".terrain_length", dimensions[1])
+            commands.set_value(str(terrain_ctrl) + ".terrain_height", dimensions[2])
+            commands.set_value(str(terrain_ctrl) + ".adaptive_spans", adaptive_spans)
+            commands.set_value(str(terrain_ctrl) + ".spans_x", spans_x)
+            commands.set_value(str(terrain_ctrl) + ".spans_y", spans_y)
+            commands.set_value(str(terrain_ctrl) + ".proxy_adaptive_spans", int(proxy_adaptive_spans))
+            commands.set_value(str(terrain_ctrl) + ".proxy_spans_x", int(proxy_spans_x))
+            commands.set_value(str(terrain_ctrl) + ".proxy_spans_y", int(proxy_spans_y))
+
+        pump_events(force=True, ix=ix)
         ix.cmds.SetExpression([str(switcher_grp) + ".inclusion_rule[0]"],
                               ["get_double('terrain_ctrl.proxy') == 0 ? './terrain_geo' : './proxy_geo'"])
         ix.cmds.SetExpression([str(terrain_geo) + ".size[0]"],
@@ -0,0 +1,110 @@
+"""
+Regression check of a Megascans library import on the headless ix emulator. It writes a small fixture library, imports
+it into a strict HeadlessIx and compares the command counts with BENCHMARK_CALL_BUDGETS. Changes that add commands or
+touch attributes Clarisse doesn't have fail without Clarisse:
+
+    python -m clarisse_survival_kit.benchmark
+"""
+import os
+import sys
+import json
+import shutil
+import tempfile
+
+# Maximum number of calls of a fixture import with the default surface and 3d asset counts.
+BENCHMARK_CALL_BUDGETS = {
+    'CreateObject': 168,
+    'CreateContext': 62,
+    'Instantiate': 0,
+    'RenameItem': 0,
+    'CreateCustomAttribute': 10,
+    'SetValues': 32,
+    'SetValue': 2,
+    'SetTexture': 142,
+    'LocalizeAttributes': 0,
+    'get_items_outputs': 0,
+    'check_for_events': 1,
+    'item_exists': 108,
+    'get_item': 46,
+}
+BENCHMARK_SURFACE_MAPS = ('Albedo', 'Roughness', 'Normal', 'Displacement', 'AO', 'Specular')
+BENCHMARK_3D_MAPS = ('Albedo', 'Roughness', 'Normal', 'Displacement', 'Opacity')
+BENCHMARK_OBJ = 'v 0 0 0\nv 1 0 0\nv 0 1 0\nusemtl %s\nf 1 2 3\n'
+
+
+def write_asset(directory, name, category, maps, scan_area='2x2', lod_files=()):
+    """Writes a Megascans asset with empty texture files."""
+    asset_directory = os.path.join(directory, 'Downloaded', category, name)
+    if not os.path.isdir(asset_directory):
+        os.makedirs(asset_directory)
+    json_data = {'meta': [{'key': 'height', 'value': '0.1 m'}, {'key': 'scanArea', 'value': scan_area + ' m'}],
+                 'categories': ['surface' if category == 'surface' else category],
+                 'maps': [{'type': 'displacement', 'minIntensity': 20, 'maxIntensity': 220}]}
+    with open(os.path.join(asset_directory, name + '.json'), 'w') as json_file:
+        json.dump(json_data, json_file)
+    for map_name in maps:
+        open(os.path.join(asset_directory, '%s_2K_%s.jpg' % (name, map_name)), 'wb').close()
+    for lod_file in lod_files:
+        with open(os.path.join(asset_directory, lod_file), 'w') as obj_file:
+            obj_file.write(BENCHMARK_OBJ % name)
+    return asset_directory
+
+
+def write_fixture_library(directory, surfaces=8, objects=2):
+    """Writes a library of surfaces with two different scan areas and 3d assets with two LODs."""
+    for i in range(surfaces):
+        write_asset(directory, 'surface_%02i' % i, 'surface', BENCHMARK_SURFACE_MAPS,
+                    scan_area='2x2' if i % 2 else '1x1')
+    for i in range(objects):
+        name = 'object_%02i' % i
+        write_asset(directory, name, '3d', BENCHMARK_3D_MAPS, lod_files=(name + '_LOD0.obj', name + '_LOD1.obj'))
+    return directory
+
+
+def reset_user_path_caches():
+    """Drops the manifest and scan index so they're opened again from the current user path."""
+    from clarisse_survival_kit import manifest, scan_index
+    if manifest._library_manifest is not None:
+        manifest._library_manifest.close()
+    manifest._library_manifest = None
+    scan_index._scan_index = None
+
+
+def run_benchmark(surfaces=8, objects=2, budgets=None, verbose=True):
+    """Imports a fixture library into a strict HeadlessIx. Returns a list of failures, which is empty if the import
+    stayed within the budgets and didn't touch missing attributes."""
+    import clarisse_survival_kit
+    directory = tempfile.mkdtemp(prefix='csk_benchmark_')
+    # The manifest and scan index of the fixture library are kept out of the user path.
+    user_path = clarisse_survival_kit.user_path
+    clarisse_survival_kit.user_path = directory
+    reset_user_path_caches()
+    try:
+        from clarisse_survival_kit.headless import HeadlessIx
+        from clarisse_survival_kit.providers.megascans import import_ms_library
+        library = write_fixture_library(os.path.join(directory, 'library'), surfaces=surfaces, objects=objects)
+        ix = HeadlessIx(strict=True)
+        import_ms_library(library, ix=ix)
+    finally:
+        reset_user_path_caches()
+        clarisse_survival_kit.user_path = user_path
+        shutil.rmtree(directory, ignore_errors=True)
+    failures = ['%s: %s' % (level, message) for level, message in ix.messages if level == 'error']
+    materials = [item for item in ix.root.get_items(True) if item.is_kindof('MaterialPhysicalStandard')]
+    if len(materials) != surfaces + objects:
+        failures.append('Expected %i materials, found %i' % (surfaces + objects, len(materials)))
+    if budgets is None:
+        budgets = BENCHMARK_CALL_BUDGETS if (surfaces, objects) == (8, 2) else {}
+    for name, budget in sorted(budgets.items()):
+        count = ix.metrics.get_count(name)
+        if count > budget:
+            failures.append('%s was called %i times, the budget is %i' % (name, count, budget))
+    if verbose:
+        print(ix.metrics.report())
+        for failure in failures:
+            print('FAILED ' + failure)
+    return failures
+
+
+if __name__ == '__main__':
+    sys.exit(1 if run_benchmark() else 0)
@@ -1,5 +1,5 @@
 from clarisse_survival_kit.app import *
-from clarisse_survival_kit.utility import check_selection, blur_tx
+from clarisse_survival_kit.utility import check_selection, blur_tx, DependencyIndex
 
 
 def blur_textures_gui():
@@ -20,10 +20,11 @@ def blur_textures_gui():
                         ix.log_warning("One or more selected items are not texture objects.")
                 ix.begin_command_batch("Blur textures")
                 blurred_textures = []
+                dependency_index = DependencyIndex(ix, textures)
                 for texture in textures:
                     blurred_textures.append(blur_tx(texture, radius=radius_field.get_value(),
                                                     quality=int(quality_field.get_value()),
-                                                    ix=ix))
+                                                    dependency_index=dependency_index, ix=ix))
                 if blurred_textures:
                     ix.selection.deselect_all()
                     for blurred_tx in blurred_textures:
@@ -63,9 +64,7 @@ def blur_textures_gui():
                          event_rewire.run)  # connect(item_to_listen, what_we_are_listening, function_called)
 
     # Send all info to clarisse to generate window
-    window.show()
-    while window.is_shown():    ix.application.check_for_events()
-    window.destroy()
+    run_modal(window, ix=ix)
 
 
 blur_textures_gui()
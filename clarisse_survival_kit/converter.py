@@ -58,13 +58,21 @@ def converter_gui():
             progress.set_value(0.0)
             progress.set_step_count(count)
             progress.start()
+            textures = []
             for i in range(0, count):
                 tx = ix.get_item(selection_list.get_item_name(i))
                 if tx:
-                    convert_tx(tx, extension=extension_list.get_selected_item_name(),
-                               replace=replace_checkbox.get_value(), target_folder=directory, convert_srgb_to_linear=convert_srgb_to_linear_checkbox.get_value(), ix=ix)
-                progress.step(i)
-                ix.application.check_for_events()
+                    textures.append(tx)
+            finished = []
+
+            def step(job):
+                progress.step(len(finished))
+                finished.append(job)
+                pump_events(ix=ix)
+
+            convert_textures(textures, extension=extension_list.get_selected_item_name(),
+                             replace=replace_checkbox.get_value(), target_folder=directory,
+                             convert_srgb_to_linear=convert_srgb_to_linear_checkbox.get_value(), callback=step, ix=ix)
             progress.destroy()
             ix.end_command_batch()
 
@@ -130,9 +138,7 @@ def converter_gui():
                          event_rewire.run)
 
     # Send all info to clarisse to generate window
-    window.show()
-    while window.is_shown():    ix.application.check_for_events()
-    window.destroy()
+    run_modal(window, ix=ix)
 
 
 converter_gui()
@@ -0,0 +1,1022 @@
+"""
+In-process stand-in for the part of the Clarisse ix module that the toolkit uses. It keeps a scene of contexts, objects
+and attributes in memory and records how often each command is called and how long it would have taken. This makes it
+possible to run and benchmark imports, mixes, replacements and terrains without Clarisse:
+
+    ix = HeadlessIx()
+    import_controller(asset_directory, ix=ix)
+    print(ix.metrics.report())
+
+With strict=True only the attributes in CLASS_ATTRIBUTES exist, so code paths that check for attributes run like in
+Clarisse. The benchmark module runs a strict fixture library import and checks its command counts.
+"""
+import os
+import re
+import time
+import fnmatch
+import logging
+import collections
+
+ROOT_PATH = 'project:/'
+DEFAULT_CONTEXT = 'scene'
+
+# Simulated cost in seconds of a single call and of every additional attribute or item the call handles.
+DEFAULT_LATENCY = 0.0005
+DEFAULT_ITEM_LATENCY = 0.00005
+DEFAULT_LATENCIES = {
+    'CreateObject': 0.002,
+    'CreateContext': 0.001,
+    'Instantiate': 0.002,
+    'CreateFileReference': 0.01,
+    'DeleteItems': 0.001,
+    'RenameItem': 0.001,
+    'MoveItemsTo': 0.001,
+    'CreateCustomAttribute': 0.001,
+    'check_for_events': 0.005,
+    'get_items_outputs': 0.002,
+    'get_item': 0.00001,
+    'item_exists': 0.00001,
+}
+
+TYPE_BOOL = 0
+TYPE_LONG = 1
+TYPE_DOUBLE = 2
+TYPE_STRING = 3
+TYPE_FILE = 4
+TYPE_REFERENCE = 5
+TYPE_OBJECT = 6
+TYPE_NAMES = {TYPE_BOOL: 'TYPE_BOOL', TYPE_LONG: 'TYPE_LONG', TYPE_DOUBLE: 'TYPE_DOUBLE', TYPE_STRING: 'TYPE_STRING',
+              TYPE_FILE: 'TYPE_FILE', TYPE_REFERENCE: 'TYPE_REFERENCE', TYPE_OBJECT: 'TYPE_OBJECT'}
+CONTAINER_SINGLE = 0
+CONTAINER_ARRAY = 1
+CONTAINER_LIST = 2
+
+# Class names that don't follow the prefix of their family.
+CLASS_PARENTS = {
+    'MaterialPhysicalStandard': 'MaterialPhysical',
+    'MaterialPhysicalBlend': 'MaterialPhysical',
+    'MaterialPhysicalDiffuse': 'MaterialPhysical',
+    'MaterialPhysical': 'Material',
+    'GeometryPolyfile': 'GeometryPolymesh',
+    'GeometryPolygrid': 'GeometryPolymesh',
+    'GeometryAbcMesh': 'GeometryPolymesh',
+    'GeometryPolymesh': 'Geometry',
+    'GeometryPointCloud': 'Geometry',
+    'GeometryPointUniform': 'Geometry',
+    'Group': 'SceneItem',
+    'Geometry': 'SceneObject',
+    'SceneObject': 'SceneItem',
+}
+CLASS_FAMILIES = ('Texture', 'Material', 'Geometry', 'Light', 'Constraint')
+# Attributes some classes don't have. Every other attribute exists with a default value.
+MISSING_ATTRIBUTES = {
+    'TextureStreamedMapFile': ('single_channel_file_behavior',),
+}
+# Built-in attributes per class that exist in strict mode. Lists the attributes the toolkit reads and writes.
+MAP_FILE_ATTRIBUTES = ('filename', 'projection', 'axis', 'object_space', 'uv_scale', 'uv_translate', 'invert',
+                       'u_repeat_mode', 'v_repeat_mode', 'color_space_auto_detect', 'file_color_space', 'use_raw_data',
+                       'interpolation_mode', 'mipmap_mode', 'detect_sequence', 'sequence_mode', 'default_color')
+CLASS_ATTRIBUTES = {
+    'MaterialPhysicalStandard': ('diffuse_front_color', 'diffuse_front_strength', 'specular_1_color',
+                                 'specular_1_strength', 'specular_1_roughness', 'specular_1_index_of_refraction',
+                                 'specular_1_fresnel_mode', 'specular_1_fresnel_preset', 'specular_1_metallic',
+                                 'transmission_color', 'transmission_strength', 'emission_color', 'emission_strength',
+                                 'normal_input', 'runtime_materials'),
+    'MaterialPhysicalBlend': ('input1', 'input2', 'mix', 'runtime_materials'),
+    'MaterialPhysicalDiffuse': ('front_color', 'runtime_materials'),
+    'Displacement': ('front_value', 'front_offset', 'bound', 'front_texture'),
+    'GeometryPolymesh': ('filename', 'scale_offset', 'materials', 'clip_maps', 'displacements', 'parent'),
+    'SceneObjectCombiner': ('objects',),
+    'TextureMapFile': MAP_FILE_ATTRIBUTES + ('single_channel_file_behavior',),
+    'TextureStreamedMapFile': MAP_FILE_ATTRIBUTES,
+    'TextureTriplanar': ('right', 'left', 'top', 'bottom', 'front', 'back', 'blend', 'object_space'),
+    'TextureReorder': ('input', 'channel_order'),
+    'TextureNormalMap': ('input',),
+    'TextureBlur': ('color', 'radius', 'quality'),
+    'TextureAdd': ('input1', 'input2'),
+    'TextureSubtract': ('input1', 'input2'),
+    'TextureMultiply': ('input1', 'input2'),
+    'TextureBlend': ('input1', 'input2', 'mix', 'mode'),
+    'TextureBranch': ('input_a', 'input_b', 'mode'),
+    'TextureClamp': ('input',),
+    'TextureRemap': ('input',),
+    'TextureGradient': ('input', 'mode', 'output'),
+    'TextureConstantColor': ('color',),
+    'TextureScope': ('scopes',),
+    'TextureFractalNoise': ('projection', 'axis', 'uv_scale', 'uv_translate', 'color1', 'color2', 'contrast',
+                            'normalize', 'turbulent'),
+    'TextureMultiBlend': ('layer_1_label', 'layer_1_color') + tuple(
+        'layer_%i_%s' % (layer, name) for layer in range(2, 9)
+        for name in ('label', 'color', 'mode', 'mix')) + tuple('enable_layer_%i' % layer for layer in range(2, 9)),
+}
+COLOR_SPACE_NAMES = ['linear', 'sRGB', 'Rec709', 'Cineon', 'Gamma 1.8', 'Gamma 2.2']
+GEOMETRY_CLASSES = ('Geometry',)
+
+ATTR_PATH_REGEX = re.compile(r'^(?P<item>.*?)\.(?P<attr>[A-Za-z_][A-Za-z0-9_]*)(?:\[(?P<index>\d+)\])?$')
+
+
+class Metrics:
+    """Counts calls by name and sums up their simulated latency. With sleep enabled the latency is actually waited
+    for so wall clock benchmarks show the effect of batching."""
+
+    def __init__(self, latencies=None, default_latency=DEFAULT_LATENCY, item_latency=DEFAULT_ITEM_LATENCY,
+                 sleep=False):
+        self.latencies = dict(DEFAULT_LATENCIES)
+        self.latencies.update(latencies or {})
+        self.default_latency = default_latency
+        self.item_latency = item_latency
+        self.sleep = sleep
+        self.counts = collections.Counter()
+        self.items = collections.Counter()
+        self.latency = collections.defaultdict(float)
+
+    def record(self, name, items=1):
+        latency = self.latencies.get(name, self.default_latency) + max(items - 1, 0) * self.item_latency
+        self.counts[name] += 1
+        self.items[name] += items
+        self.latency[name] += latency
+        if self.sleep:
+            time.sleep(latency)
+        return latency
+
+    def reset(self):
+        self.counts.clear()
+        self.items.clear()
+        self.latency.clear()
+
+    def get_count(self, name=None):
+        """Returns the call count of a command or of all commands."""
+        if name:
+            return self.counts[name]
+        return sum(self.counts.values())
+
+    def get_latency(self, name=None):
+        """Returns the simulated seconds of a command or of all commands."""
+        if name:
+            return self.latency[name]
+        return sum(self.latency.values())
+
+    def snapshot(self):
+        return {'counts': dict(self.counts), 'items': dict(self.items), 'latency': dict(self.latency)}
+
+    def report(self):
+        """Returns a table of calls ordered by simulated latency."""
+        lines = ['%-32s %8s %8s %10s' % ('call', 'count', 'items', 'latency')]
+        for name in sorted(self.counts, key=lambda n: self.latency[n], reverse=True):
+            lines.append('%-32s %8i %8i %9.4fs' % (name, self.counts[name], self.items[name], self.latency[name]))
+        lines.append('%-32s %8i %8i %9.4fs' % ('total', self.get_count(), sum(self.items.values()),
+                                               self.get_latency()))
+        return '\n'.join(lines)
+
+
+class StringArray(list):
+    def __init__(self, size=0):
+        list.__init__(self, [''] * size)
+
+    def get_count(self):
+        return len(self)
+
+
+class ItemArray(list):
+    def __init__(self, size=0):
+        list.__init__(self, [None] * size)
+
+    def get_count(self):
+        return len(self)
+
+
+class ItemVector(list):
+    def add(self, item):
+        self.append(item)
+
+    def get_count(self):
+        return len(self)
+
+
+class BitFieldHelper:
+    pass
+
+
+class Variable:
+    def __init__(self, value):
+        self.value = value
+
+    def get_string(self):
+        return self.value
+
+
+class ColorIO:
+    color_space_names = list(COLOR_SPACE_NAMES)
+
+    @classmethod
+    def get_color_space_names(cls):
+        return list(cls.color_space_names)
+
+
+class OfAttr:
+    TYPE_BOOL = TYPE_BOOL
+    TYPE_LONG = TYPE_LONG
+    TYPE_DOUBLE = TYPE_DOUBLE
+    TYPE_STRING = TYPE_STRING
+    TYPE_FILE = TYPE_FILE
+    TYPE_REFERENCE = TYPE_REFERENCE
+    TYPE_OBJECT = TYPE_OBJECT
+
+    @staticmethod
+    def get_type_name(attr_type):
+        return TYPE_NAMES.get(attr_type, 'TYPE_UNKNOWN')
+
+
+class Api:
+    CoreStringArray = StringArray
+    CoreStringVector = ItemVector
+    OfObjectArray = ItemArray
+    OfItemArray = ItemArray
+    OfObjectVector = ItemVector
+    OfItemVector = ItemVector
+    CoreBitFieldHelper = BitFieldHelper
+    ColorIO = ColorIO
+    OfAttr = OfAttr
+
+
+def get_class_ancestors(class_name):
+    """Returns the class and all classes it derives from."""
+    ancestors = [class_name]
+    while class_name in CLASS_PARENTS:
+        class_name = CLASS_PARENTS[class_name]
+        ancestors.append(class_name)
+    for family in CLASS_FAMILIES:
+        if ancestors[-1].startswith(family) and ancestors[-1] != family:
+            ancestors.append(family)
+    return ancestors
+
+
+def to_value(value):
+    """Converts a stored string back to the type Clarisse would return for it."""
+    if not isinstance(value, str):
+        return value
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+class Attribute:
+    def __init__(self, item, name, attr_type=TYPE_DOUBLE, container=CONTAINER_SINGLE, values=None):
+        self.item = item
+        self.name = name
+        self.attr_type = attr_type
+        self.container = container
+        self.values = list(values or [])
+        self.texture = None
+        self.expression = None
+        self.locked = False
+        self.local = True
+
+    def __str__(self):
+        return str(self.item) + '.' + self.name
+
+    def __repr__(self):
+        return '<Attribute %s>' % str(self)
+
+    def set_value(self, value, index=None):
+        if isinstance(value, Item):
+            self.attr_type = TYPE_OBJECT
+        elif isinstance(value, bool):
+            self.attr_type = TYPE_BOOL
+            value = int(value)
+        elif isinstance(to_value(str(value)), str):
+            if str(value).startswith(ROOT_PATH) and self.item.ix.resolve(value):
+                self.attr_type = TYPE_OBJECT
+                value = self.item.ix.resolve(value)
+            elif value != '' or self.attr_type != TYPE_OBJECT:
+                self.attr_type = TYPE_STRING
+        if not isinstance(value, Item):
+            value = str(value)
+        index = index or 0
+        while len(self.values) <= index:
+            self.values.append(None)
+        self.values[index] = value
+
+    def get_name(self):
+        return self.name
+
+    def get_parent_object(self):
+        return self.item
+
+    def get_type(self):
+        return self.attr_type
+
+    def get_container(self):
+        return self.container
+
+    def get_value_count(self):
+        return len(self.values)
+
+    def get_value(self, index=0):
+        if index < len(self.values):
+            return self.values[index]
+        return None
+
+    def get_string(self, index=0):
+        value = self.get_value(index)
+        return '' if value is None else str(value)
+
+    def set_string(self, value):
+        self.set_value(value)
+
+    def get_bool(self, index=0):
+        return bool(to_value(self.get_value(index)))
+
+    def get_long(self, index=0):
+        return int(to_value(self.get_value(index)) or 0)
+
+    def get_double(self, index=0):
+        return float(to_value(self.get_value(index)) or 0)
+
+    def get_object(self, index=0):
+        value = self.get_value(index)
+        return value if isinstance(value, Item) else None
+
+    def get_values(self, vector):
+        for value in self.values:
+            if isinstance(value, Item):
+                vector.add(value)
+
+    def get_texture(self):
+        return self.texture
+
+    def is_textured(self):
+        return self.texture is not None
+
+    def get_expression(self):
+        return self.expression
+
+    def is_editable(self):
+        return not self.locked
+
+    def is_locked(self):
+        return self.locked
+
+    def is_local(self):
+        return self.local
+
+
+class AttributeValue:
+    """What `item.attrs.name` returns. Indexing reads or writes a single value."""
+
+    def __init__(self, attr):
+        self.attr = attr
+
+    def __getitem__(self, index):
+        return to_value(self.attr.get_value(index))
+
+    def __setitem__(self, index, value):
+        self.attr.item.ix.metrics.record('attrs.set')
+        self.attr.set_value(value, index)
+
+    def __len__(self):
+        return len(self.attr.values)
+
+    def __str__(self):
+        return str([to_value(value) for value in self.attr.values])
+
+
+class AttributeAccessor:
+    def __init__(self, item):
+        self.__dict__['_item'] = item
+
+    def __getattr__(self, name):
+        attr = self._item.get_attribute(name)
+        if attr is None:
+            raise AttributeError(name)
+        return AttributeValue(attr)
+
+    def __setattr__(self, name, value):
+        self._item.ix.metrics.record('attrs.set')
+        attr = self._item.get_attribute(name)
+        if attr is None:
+            raise AttributeError(name)
+        attr.set_value(value)
+
+
+class GeometryModule:
+    def __init__(self, item):
+        self.item = item
+        self.materials = {}
+        self.clip_maps = {}
+        self.displacements = {}
+
+    def get_shading_group_count(self):
+        return self.item.ix.shading_group_count
+
+    def get_shading_group_names(self):
+        names = StringArray(self.get_shading_group_count())
+        for i in range(len(names)):
+            names[i] = 'shading_group_%i' % i
+        return names
+
+    def get_geometry(self):
+        return self
+
+    def assign_material(self, module, index):
+        self.item.ix.metrics.record('assign_material')
+        self.materials[index] = module
+
+    def assign_clip_map(self, module, index):
+        self.item.ix.metrics.record('assign_clip_map')
+        self.clip_maps[index] = module
+
+    def assign_displacement(self, module, index):
+        self.item.ix.metrics.record('assign_displacement')
+        self.displacements[index] = module
+
+
+class ShadingLayerModule:
+    COLUMNS = ('filter', 'is_visible', 'material', 'clip_map', 'displacement')
+
+    def __init__(self, item):
+        self.item = item
+        self.rules = []
+
+    def add_rule(self, index):
+        self.rules.insert(index, dict((column, '') for column in self.COLUMNS))
+
+    def get_rules(self):
+        rules = ItemVector()
+        rules.extend(self.rules)
+        return rules
+
+    def get_rule_value(self, row, column):
+        return self.rules[row].get(column, '')
+
+    def set_rule_value(self, row, column, value):
+        self.item.ix.metrics.record('set_rule_value')
+        self.rules[row][column] = value
+
+
+class Module:
+    def __init__(self, item):
+        self.item = item
+
+
+class Item:
+    def __init__(self, ix, name, class_name, context=None):
+        self.ix = ix
+        self.name = name
+        self.class_name = class_name
+        self.context = context
+        self.attributes = collections.OrderedDict()
+        self.attrs = AttributeAccessor(self)
+        self.source = None
+        self.enabled = True
+        self.module = None
+
+    def __str__(self):
+        return self.get_full_name()
+
+    def __repr__(self):
+        return '<%s %s>' % (self.class_name, self.get_full_name())
+
+    def get_full_name(self):
+        if not self.context:
+            return ROOT_PATH
+        return self.context.get_full_name() + '/' + self.name
+
+    def get_name(self):
+        return self.name
+
+    def get_contextual_name(self):
+        return self.name
+
+    def get_class_name(self):
+        return self.class_name
+
+    def get_context(self):
+        return self.context
+
+    def get_parent(self):
+        return self.context
+
+    def is_kindof(self, kind):
+        return kind in get_class_ancestors(self.class_name)
+
+    def is_context(self):
+        return False
+
+    def is_object(self):
+        return True
+
+    def to_object(self):
+        return self
+
+    def is_local(self):
+        return self.source is None
+
+    def is_editable(self):
+        return True
+
+    def is_content_locked(self):
+        return False
+
+    def is_remote(self):
+        return False
+
+    def is_enabled(self):
+        return self.enabled
+
+    def attribute_exists(self, name):
+        if name in self.attributes:
+            return True
+        if self.ix.strict:
+            return any(name in CLASS_ATTRIBUTES.get(class_name, ()) for class_name in
+                       get_class_ancestors(self.class_name))
+        return name not in MISSING_ATTRIBUTES.get(self.class_name, ())
+
+    def get_attribute_count(self):
+        return len(self.attributes)
+
+    def get_attribute(self, name):
+        """Returns the attribute. Attributes that were never set are created on access, in strict mode only if the
+        class has them. Otherwise None is returned like Clarisse does."""
+        if isinstance(name, int):
+            return list(self.attributes.values())[name]
+        attr = self.attributes.get(name)
+        if attr is None:
+            if not self.attribute_exists(name):
+                return None
+            attr = Attribute(self, name)
+            self.attributes[name] = attr
+        return attr
+
+    def get_module(self):
+        if self.module is None:
+            if self.is_kindof('ShadingLayer'):
+                self.module = ShadingLayerModule(self)
+            elif any(self.is_kindof(kind) for kind in GEOMETRY_CLASSES):
+                self.module = GeometryModule(self)
+            else:
+                self.module = Module(self)
+        return self.module
+
+    def call_action(self, name):
+        self.ix.metrics.record('call_action')
+
+
+class Context(Item):
+    def __init__(self, ix, name, context=None):
+        Item.__init__(self, ix, name, 'OfContext', context)
+        self.contexts = []
+        self.objects = []
+
+    def is_context(self):
+        return True
+
+    def is_object(self):
+        return False
+
+    def is_kindof(self, kind):
+        return kind in ('OfContext', 'Context')
+
+    def get_context_count(self):
+        return len(self.contexts)
+
+    def get_context(self, index=None):
+        if index is None:
+            return self.context
+        return self.contexts[index]
+
+    def get_object_count(self):
+        return len(self.objects)
+
+    def get_all_objects(self, objects, flags=None, recursive=False):
+        items = self.get_items(recursive)
+        for i in range(min(len(objects), len(items))):
+            objects[i] = items[i]
+
+    def get_items(self, recursive=False):
+        items = list(self.objects)
+        if recursive:
+            for context in self.contexts:
+                items.extend(context.get_items(True))
+        return items
+
+    def get_child(self, name):
+        for child in self.contexts + self.objects:
+            if child.name == name:
+                return child
+        return None
+
+    def get_unique_name(self, name):
+        if not self.get_child(name):
+            return name
+        base = re.sub(r'\d+$', '', name)
+        i = 1
+        while self.get_child(base + str(i)):
+            i += 1
+        return base + str(i)
+
+    def add_child(self, item):
+        item.context = self
+        item.name = self.get_unique_name(item.name)
+        if item.is_context():
+            self.contexts.append(item)
+        else:
+            self.objects.append(item)
+        return item
+
+    def remove_child(self, item):
+        if item in self.contexts:
+            self.contexts.remove(item)
+        if item in self.objects:
+            self.objects.remove(item)
+
+
+class Commands:
+    """Stand-in for ix.cmds. Commands the emulator doesn't model are still counted."""
+
+    def __init__(self, ix):
+        self.ix = ix
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def command(*args, **kwargs):
+            self.ix.metrics.record(name)
+            logging.debug("Headless ix doesn't model command: " + name)
+
+        return command
+
+    def _record(self, name, items=1):
+        self.ix.metrics.record(name, items)
+
+    def _attrs(self, paths):
+        """Returns the attributes and indices of the paths. Missing attributes are logged and left out."""
+        attrs = [self.ix.get_attribute_path(str(path)) for path in paths]
+        return [(attr, index) for attr, index in attrs if attr is not None]
+
+    def CreateContext(self, name, storage="Global", parent=None):
+        self._record('CreateContext')
+        parent_ctx = self.ix.resolve(str(parent)) if parent else self.ix.application.get_working_context()
+        return parent_ctx.add_child(Context(self.ix, name))
+
+    def CreateObject(self, name, class_name, storage="Global", parent=None):
+        self._record('CreateObject')
+        parent_ctx = self.ix.resolve(str(parent)) if parent else self.ix.application.get_working_context()
+        return parent_ctx.add_child(Item(self.ix, name, class_name))
+
+    def SetValue(self, path, values):
+        self._record('SetValue', len(values))
+        attr, index = self.ix.get_attribute_path(str(path))
+        if attr is None:
+            return
+        for i, value in enumerate(values):
+            attr.set_value(value, (index or 0) + i)
+
+    def SetValues(self, paths, values):
+        self._record('SetValues', len(values))
+        if len(paths) == 1 and len(values) > 1:
+            attr, index = self.ix.get_attribute_path(str(paths[0]))
+            if attr is None:
+                return
+            for i, value in enumerate(values):
+                attr.set_value(value, (index or 0) + i)
+            return
+        for path, value in zip(paths, values):
+            attr, index = self.ix.get_attribute_path(str(path))
+            if attr is not None:
+                attr.set_value(value, index)
+
+    def SetTexture(self, paths, texture):
+        self._record('SetTexture', len(paths))
+        texture_item = self.ix.resolve(str(texture)) if texture else None
+        for attr, index in self._attrs(paths):
+            attr.texture = texture_item
+
+    def SetExpression(self, paths, expressions):
+        self._record('SetExpression', len(paths))
+        for path, expression in zip(paths, expressions):
+            attr, index = self.ix.get_attribute_path(str(path))
+            if attr is not None:
+                attr.expression = expression
+
+    def AddValues(self, paths, values):
+        self._record('AddValues', len(values))
+        for attr, index in self._attrs(paths):
+            attr.container = CONTAINER_LIST
+            for value in values:
+                if str(value).startswith('Constraint'):
+                    value = Item(self.ix, str(value), str(value), attr.item.context)
+                attr.set_value(value, len(attr.values))
+
+    def RemoveValue(self, paths, indices):
+        self._record('RemoveValue', len(indices))
+        for attr, index in self._attrs(paths):
+            for i in sorted(indices, reverse=True):
+                if i < len(attr.values):
+                    del attr.values[i]
+
+    def LocalizeAttributes(self, paths, localize):
+        self._record('LocalizeAttributes', len(paths))
+        for attr, index in self._attrs(paths):
+            attr.local = bool(localize)
+
+    def LockAttributes(self, paths, lock):
+        self._record('LockAttributes', len(paths))
+        for attr, index in self._attrs(paths):
+            attr.locked = bool(lock)
+
+    def CreateCustomAttribute(self, paths, name, attr_type, keys=(), values=()):
+        self._record('CreateCustomAttribute', len(paths))
+        for path in paths:
+            item = self.ix.resolve(str(path))
+            item.attributes[name] = Attribute(item, name, attr_type)
+
+    def Instantiate(self, paths):
+        self._record('Instantiate', len(paths))
+        instances = ItemVector()
+        for path in paths:
+            source = self.ix.resolve(str(path))
+            mapping = {}
+            instance = source.context.add_child(self._instantiate(source, mapping))
+            # References to items inside an instanced context point to their instances.
+            for item_source, item_instance in mapping.items():
+                for name, attr in item_source.attributes.items():
+                    copy = item_instance.attributes.setdefault(name, Attribute(item_instance, name))
+                    copy.attr_type, copy.container = attr.attr_type, attr.container
+                    copy.values = [mapping.get(value, value) for value in attr.values]
+                    copy.texture = mapping.get(attr.texture, attr.texture)
+                    copy.expression, copy.local = attr.expression, False
+            instances.add(instance)
+        return instances
+
+    def _instantiate(self, source, mapping):
+        if source.is_context():
+            instance = Context(self.ix, source.name)
+            for child in source.contexts + source.objects:
+                instance.add_child(self._instantiate(child, mapping))
+        else:
+            instance = Item(self.ix, source.name, source.class_name)
+        instance.source = source
+        mapping[source] = instance
+        return instance
+
+    def CombineItems(self, paths, parent):
+        self._record('CombineItems', len(paths))
+        combiner = self.ix.resolve(parent).add_child(Item(self.ix, 'combiner', 'SceneObjectCombiner'))
+        objects = combiner.attributes.setdefault('objects', Attribute(combiner, 'objects'))
+        for path in paths:
+            objects.set_value(self.ix.resolve(str(path)), objects.get_value_count())
+        return combiner
+
+    def MoveItemsTo(self, paths, parent):
+        self._record('MoveItemsTo', len(paths))
+        parent_ctx = self.ix.resolve(str(parent))
+        for path in paths:
+            item = self.ix.resolve(str(path))
+            item.context.remove_child(item)
+            parent_ctx.add_child(item)
+
+    def RenameItem(self, path, name):
+        self._record('RenameItem')
+        item = self.ix.resolve(str(path))
+        if item.name != name:
+            item.name = item.context.get_unique_name(name)
+
+    def DeleteItems(self, paths):
+        self._record('DeleteItems', len(paths))
+        for path in paths:
+            item = self.ix.resolve(str(path))
+            if item and item.context:
+                item.context.remove_child(item)
+
+    def DisableItems(self, paths, disable=True):
+        self._record('DisableItems', len(paths))
+        for path in paths:
+            self.ix.resolve(str(path)).enabled = not disable
+
+    def CreateFileReference(self, parent, files):
+        self._record('CreateFileReference', len(files))
+        parent_ctx = self.ix.resolve(str(parent))
+        name = os.path.splitext(os.path.basename(files[0]))[0] if files else 'reference'
+        return parent_ctx.add_child(Context(self.ix, name))
+
+    def AddShadingLayerRule(self, path, index, properties=()):
+        self._record('AddShadingLayerRule')
+        self.ix.resolve(str(path)).get_module().add_rule(index)
+
+    def SetShadingLayerRulesProperty(self, path, rows, column, values):
+        self._record('SetShadingLayerRulesProperty', len(rows))
+        module = self.ix.resolve(str(path)).get_module()
+        for row, value in zip(rows, values):
+            module.rules[row][column] = value
+
+
+class Factory:
+    def __init__(self, ix):
+        self.ix = ix
+        self.vars = {'CLARISSE_BIN_DIR': Variable('')}
+
+    def get_vars(self):
+        return self.vars
+
+    def get_items_outputs(self, items, outputs, recursive=False):
+        """Adds every object that references one of the items through a value or a texture connection."""
+        self.ix.metrics.record('get_items_outputs')
+        targets = [item for item in items if item is not None]
+        for item in self.ix.root.get_items(True):
+            for attr in item.attributes.values():
+                if attr.texture in targets or any(value in targets for value in attr.values):
+                    outputs.add(item)
+                    break
+            if item.is_kindof('ShadingLayer') and item not in outputs:
+                for rule in item.get_module().rules:
+                    if any(str(value) in [str(target) for target in targets] for value in rule.values()):
+                        outputs.add(item)
+                        break
+
+
+class ProgressBar:
+    def __init__(self, ix, title=''):
+        self.ix = ix
+        self.steps = 0
+        self.title = title
+        self.value = 0
+
+    def set_step_count(self, steps):
+        self.steps = steps
+
+    def start(self):
+        pass
+
+    def step(self, value=None):
+        self.value = self.value + 1 if value is None else value
+
+    def set_value(self, value):
+        self.value = value
+
+    def destroy(self):
+        pass
+
+
+class Application:
+    def __init__(self, ix):
+        self.ix = ix
+        self.working_context = None
+        self.factory = Factory(ix)
+
+    def check_for_events(self):
+        self.ix.metrics.record('check_for_events')
+
+    def get_working_context(self):
+        return self.working_context
+
+    def get_factory(self):
+        return self.factory
+
+    def get_max_thread_count(self):
+        try:
+            import multiprocessing
+            return multiprocessing.cpu_count()
+        except NotImplementedError:
+            return 1
+
+    def get_matching_objects(self, objects, filter, context, class_names):
+        """Adds the objects in the context and its subcontexts whose name matches the wildcard filter and that are of
+        one of the classes or a class derived from them."""
+        self.ix.metrics.record('get_matching_objects')
+        for item in context.get_items(True):
+            if fnmatch.fnmatchcase(item.get_name(), filter) and \
+                    any(item.is_kindof(class_name) for class_name in class_names):
+                objects.add(item)
+
+    def select_next_outputs(self):
+        self.ix.metrics.record('select_next_outputs')
+        outputs = ItemVector()
+        self.factory.get_items_outputs(list(self.ix.selection), outputs)
+        self.ix.selection.deselect_all()
+        for item in outputs:
+            self.ix.selection.add(item)
+
+    def create_progress_bar(self, title=''):
+        return ProgressBar(self.ix, title)
+
+
+class Selection:
+    def __init__(self, ix):
+        self.ix = ix
+        self.items = []
+
+    def __iter__(self):
+        return iter(list(self.items))
+
+    def __getitem__(self, index):
+        return self.items[index]
+
+    def __len__(self):
+        return len(self.items)
+
+    def get_count(self):
+        return len(self.items)
+
+    def select(self, item):
+        self.items = [item]
+
+    def add(self, item):
+        if item not in self.items:
+            self.items.append(item)
+
+    def deselect_all(self):
+        self.items = []
+
+
+class HeadlessIx:
+    """Replacement for the ix module. Pass it as the ix keyword argument of any toolkit function.
+    Every attribute exists unless strict is enabled, in which case unknown attributes fail like they do in Clarisse:
+    attribute_exists returns False, get_attribute returns None and commands log an error for them."""
+
+    def __init__(self, metrics=None, shading_group_count=1, strict=False, **kwargs):
+        self.metrics = metrics or Metrics(**kwargs)
+        self.shading_group_count = shading_group_count
+        # In strict mode only the attributes in CLASS_ATTRIBUTES and custom attributes exist.
+        self.strict = strict
+        self.api = Api()
+        self.cmds = Commands(self)
+        self.application = Application(self)
+        self.selection = Selection(self)
+        self.root = Context(self, '')
+        self.root.context = None
+        self.application.working_context = self.root.add_child(Context(self, DEFAULT_CONTEXT))
+        self.messages = []
+        self.command_batches = 0
+
+    def resolve(self, path):
+        """Returns the item at the path or None."""
+        path = str(path)
+        if not path.startswith(ROOT_PATH):
+            path = str(self.application.get_working_context()) + '/' + path
+        item = self.root
+        for name in [name for name in path[len(ROOT_PATH):].split('/') if name]:
+            if not isinstance(item, Context):
+                return None
+            item = item.get_child(name)
+            if item is None:
+                return None
+        return item
+
+    def get_attribute_path(self, path):
+        """Splits an attribute path like project://scene/tx.uv_scale[1] into the attribute and the index."""
+        match = ATTR_PATH_REGEX.match(path)
+        if not match:
+            raise ValueError('Invalid attribute path: ' + path)
+        item = self.resolve(match.group('item'))
+        if item is None:
+            raise ValueError('Item does not exist: ' + match.group('item'))
+        index = match.group('index')
+        attr = item.get_attribute(match.group('attr'))
+        if attr is None:
+            self.log_error('Attribute does not exist: ' + path)
+        return attr, int(index) if index is not None else None
+
+    def resolve_item_or_attribute(self, path):
+        item = self.resolve(path)
+        match = ATTR_PATH_REGEX.match(str(path))
+        if item is None and match:
+            item = self.resolve(match.group('item'))
+            if item is not None:
+                return item.get_attribute(match.group('attr'))
+        return item
+
+    def item_exists(self, path):
+        self.metrics.record('item_exists')
+        return self.resolve_item_or_attribute(path)
+
+    def get_item(self, path):
+        self.metrics.record('get_item')
+        item = self.resolve_item_or_attribute(path)
+        if item is None:
+            raise KeyError('Item does not exist: ' + str(path))
+        return item
+
+    def begin_command_batch(self, name=''):
+        self.command_batches += 1
+
+    def end_command_batch(self):
+        self.command_batches -= 1
+
+    def log_info(self, message):
+        self.messages.append(('info', message))
+        logging.info(message)
+
+    def log_warning(self, message):
+        self.messages.append(('warning', message))
+        logging.warning(message)
+
+    def log_error(self, message):
+        self.messages.append(('error', message))
+        logging.error(message)
@@ -0,0 +1,211 @@
+import os
+import struct
+import logging
+
+from clarisse_survival_kit.settings import *
+
+EXR_MAGIC = b'\x76\x2f\x31\x01'
+PNG_MAGIC = b'\x89PNG\r\n\x1a\n'
+TIFF_MAGIC = (b'II*\x00', b'MM\x00*')
+BIGTIFF_MAGIC = (b'II+\x00', b'MM\x00+')
+JPEG_MAGIC = b'\xff\xd8'
+HDR_MAGIC = (b'#?RADIANCE', b'#?RGBE')
+
+EXR_PIXEL_TYPE_BITS = {0: 32, 1: 16, 2: 32}
+PNG_COLOR_TYPE_CHANNELS = {0: 1, 2: 3, 3: 3, 4: 2, 6: 4}
+# Start of frame markers. C4, C8 and CC are used for other purposes.
+JPEG_SOF_MARKERS = (0xc0, 0xc1, 0xc2, 0xc3, 0xc5, 0xc6, 0xc7, 0xc9, 0xca, 0xcb, 0xcd, 0xce, 0xcf)
+TIFF_TYPE_FORMATS = {3: ('H', 2), 4: ('I', 4), 16: ('Q', 8)}
+
+
+def get_image_info(width, height, channels, bit_depth, image_format, tiled=False, mipmapped=False):
+    return {'format': image_format, 'width': width, 'height': height, 'channels': channels,
+            'bit_depth': bit_depth, 'tiled': tiled, 'mipmapped': mipmapped}
+
+
+def read_exr_info(f):
+    """Reads the header attributes of the first part of an OpenEXR file."""
+    f.seek(4)
+    version = struct.unpack('<I', f.read(4))[0]
+    tiled = bool(version & 0x200)
+    long_names = bool(version & 0x400)
+    channels = []
+    data_window = None
+    mipmapped = False
+
+    def read_string():
+        chars = []
+        char = f.read(1)
+        while char and char != b'\x00':
+            chars.append(char)
+            char = f.read(1)
+            if len(chars) > (255 if long_names else 31) * 8:
+                raise ValueError('Invalid EXR attribute name')
+        return b''.join(chars)
+
+    while True:
+        name = read_string()
+        if not name:
+            break
+        attr_type = read_string()
+        size = struct.unpack('<i', f.read(4))[0]
+        value = f.read(size)
+        if len(value) != size:
+            raise ValueError('Truncated EXR header')
+        if name == b'channels' and attr_type == b'chlist':
+            offset = 0
+            while offset < len(value) and value[offset:offset + 1] != b'\x00':
+                end = value.index(b'\x00', offset)
+                pixel_type = struct.unpack('<i', value[end + 1:end + 5])[0]
+                channels.append(EXR_PIXEL_TYPE_BITS.get(pixel_type, 0))
+                offset = end + 17
+        elif name == b'dataWindow' and attr_type == b'box2i':
+            data_window = struct.unpack('<iiii', value[:16])
+        elif name == b'tiles' and attr_type == b'tiledesc':
+            tiled = True
+            mipmapped = (struct.unpack('<B', value[8:9])[0] & 0x0f) in (1, 2)
+    if not data_window:
+        return None
+    return get_image_info(data_window[2] - data_window[0] + 1, data_window[3] - data_window[1] + 1, len(channels),
+                          max(channels) if channels else 0, 'exr', tiled=tiled, mipmapped=mipmapped)
+
+
+def read_tiff_info(f, header):
+    """Reads the first image file directory of a TIFF file. TX files are tiled TIFF files with a directory per mip
+    level."""
+    byte_order = '<' if header[:2] == b'II' else '>'
+    f.seek(4)
+    ifd_offset = struct.unpack(byte_order + 'I', f.read(4))[0]
+    f.seek(ifd_offset)
+    entry_count = struct.unpack(byte_order + 'H', f.read(2))[0]
+    tags = {}
+    entries = f.read(entry_count * 12)
+    next_ifd_offset = struct.unpack(byte_order + 'I', f.read(4) or b'\x00\x00\x00\x00')[0]
+    for i in range(entry_count):
+        tag, tag_type, count = struct.unpack(byte_order + 'HHI', entries[i * 12:i * 12 + 8])
+        if tag not in (256, 257, 258, 277, 322, 323) or tag_type not in TIFF_TYPE_FORMATS:
+            continue
+        value_format, value_size = TIFF_TYPE_FORMATS[tag_type]
+        value_data = entries[i * 12 + 8:i * 12 + 12]
+        if value_size * count > 4:
+            # Values that don't fit in the entry are stored at an offset. Only the first one is needed.
+            position = f.tell()
+            f.seek(struct.unpack(byte_order + 'I', value_data)[0])
+            value_data = f.read(value_size)
+            f.seek(position)
+        tags[tag] = (struct.unpack(byte_order + value_format, value_data[:value_size])[0], count)
+    if 256 not in tags or 257 not in tags:
+        return None
+    channels = tags[277][0] if 277 in tags else tags.get(258, (0, 1))[1]
+    bit_depth = tags[258][0] if 258 in tags else 1
+    return get_image_info(tags[256][0], tags[257][0], channels, bit_depth, 'tiff', tiled=322 in tags and 323 in tags,
+                          mipmapped=next_ifd_offset != 0)
+
+
+def read_png_info(header):
+    width, height, bit_depth, color_type = struct.unpack('>IIBB', header[16:26])
+    if color_type == 3:
+        bit_depth = 8
+    return get_image_info(width, height, PNG_COLOR_TYPE_CHANNELS.get(color_type, 0), bit_depth, 'png')
+
+
+def read_jpeg_info(f):
+    f.seek(2)
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0:1] != b'\xff':
+            return None
+        marker_type = struct.unpack('B', marker[1:2])[0]
+        if marker_type == 0xff:
+            # Padding byte
+            f.seek(-1, 1)
+            continue
+        if marker_type in (0xd8, 0x01) or 0xd0 <= marker_type <= 0xd7:
+            continue
+        length = struct.unpack('>H', f.read(2))[0]
+        if marker_type in JPEG_SOF_MARKERS:
+            bit_depth, height, width, channels = struct.unpack('>BHHB', f.read(6))
+            return get_image_info(width, height, channels, bit_depth, 'jpeg')
+        f.seek(length - 2, 1)
+
+
+def read_tga_info(header):
+    image_type = struct.unpack('B', header[2:3])[0]
+    width, height, pixel_depth, descriptor = struct.unpack('<HHBB', header[12:18])
+    alpha_bits = descriptor & 0x0f
+    if image_type in (3, 11):
+        channels = 1 + (1 if alpha_bits else 0)
+    elif image_type in (1, 9):
+        channels = 3
+    else:
+        channels = 4 if pixel_depth == 32 or alpha_bits else 3
+    return get_image_info(width, height, channels, 8, 'tga')
+
+
+def read_hdr_info(f):
+    f.seek(0)
+    for i in range(64):
+        line = f.readline(1024).strip()
+        if not line:
+            break
+    resolution = f.readline(256).split()
+    if len(resolution) != 4:
+        return None
+    dimensions = dict([(resolution[0][-1:].upper(), int(resolution[1])),
+                       (resolution[2][-1:].upper(), int(resolution[3]))])
+    return get_image_info(dimensions[b'X'], dimensions[b'Y'], 3, 32, 'hdr')
+
+
+def read_image_info(path):
+    """Returns the width, height, channel count, bit depth and whether the image is tiled or mipmapped by reading only
+    the file header. EXR, TIFF/TX, PNG, JPEG, TGA and HDR files are supported. Returns None for unsupported or
+    invalid files."""
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(32)
+            if header[:4] == EXR_MAGIC:
+                return read_exr_info(f)
+            elif header[:4] in TIFF_MAGIC:
+                return read_tiff_info(f, header)
+            elif header[:4] in BIGTIFF_MAGIC:
+                logging.debug("BigTIFF headers are not supported: " + str(path))
+                return None
+            elif header[:8] == PNG_MAGIC and header[12:16] == b'IHDR':
+                return read_png_info(header)
+            elif header[:2] == JPEG_MAGIC:
+                return read_jpeg_info(f)
+            elif header.startswith(HDR_MAGIC):
+                return read_hdr_info(f)
+            elif os.path.splitext(path)[-1].lower() == '.tga' and len(header) >= 18:
+                return read_tga_info(header)
+    except (IOError, OSError, ValueError, KeyError, IndexError, TypeError, struct.error) as e:
+        logging.debug("Could not read image header of %s: %s" % (path, str(e)))
+    return None
+
+
+def get_resolution_name(image_info, resolutions=IMAGE_RESOLUTIONS):
+    """Returns the resolution name like 4K that matches the largest side of the image or None."""
+    if not image_info:
+        return None
+    size = max(image_info['width'], image_info['height'])
+    for resolution in resolutions:
+        if size == int(resolution.rstrip('Kk')) * 1024:
+            return resolution
+    return None
+
+
+def is_single_channel(path, read_function=read_image_info):
+    """Checks if the image holds a single (grey) channel. Returns None if the header can't be read."""
+    image_info = read_function(path)
+    if not image_info:
+        return None
+    return image_info['channels'] == 1
+
+
+def is_valid_image(path):
+    """Checks if the image has a readable header with a valid size. Formats the header reader doesn't support only
+    need to exist and not be empty."""
+    if os.path.splitext(path)[-1].lower().lstrip('.') in IMAGE_HEADER_FORMATS:
+        image_info = read_image_info(path)
+        return bool(image_info and image_info['width'] > 0 and image_info['height'] > 0)
+    return os.path.exists(path) and os.path.getsize(path) >= 10
@@ -1,11 +1,29 @@
 from clarisse_survival_kit.settings import *
 from clarisse_survival_kit.app import *
+from clarisse_survival_kit.jobs import ImportJob, JobScheduler
 import logging
 
 
+def iter_import_assets(directories, **kwargs):
+    """Imports the asset directories one at a time so they can be run as an ImportJob."""
+    ix = get_ix(kwargs.get('ix'))
+    yield {'asset': None, 'count': len(directories), 'done': False}
+    for directory in directories:
+        if os.path.isdir(directory):
+            logging.debug("Import Controller called")
+            surface = import_controller(directory, **kwargs)
+            if surface:
+                ix.selection.deselect_all()
+                ix.selection.add(surface.mtl)
+        else:
+            ix.log_warning("Invalid directory: %s" % directory)
+        yield {'asset': directory, 'done': True}
+
+
 def import_asset_gui(**kwargs):
     logging.debug("Import Asset GUI started")
     ix = get_ix(kwargs.get('ix'))
+    scheduler = JobScheduler(ix)
     auto_cycle_name = 'Auto (Cycle)'
 
     class EventRewire(ix.api.EventObject):
@@ -45,54 +63,51 @@ def import_asset_gui(**kwargs):
         def cancel(self, sender, evtid):
             sender.get_window().hide()
 
+        def stop_import(self, sender, evtid):
+            scheduler.stop()
+
+        def cancel_import(self, sender, evtid):
+            scheduler.cancel()
+
         def run(self, sender, evtid):
-            ix.begin_command_batch("Import Asset")
             directory_txt = path_txt.get_text()
             if directory_txt:
                 directories = directory_txt.split(IMPORTER_PATH_DELIMITER)
-                for directory in directories:
-                    if os.path.isdir(directory):
-                        logging.debug("Import Controller called")
-                        provider_name = provider_list.get_selected_item_name().lower()
-                        if provider_name == auto_cycle_name.lower():
-                            provider_name = None
-                        resolution = resolution_list.get_selected_item_name()
-                        if resolution == 'Auto':
-                            resolution = None
-                        lod = lod_list.get_selected_item_name()
-                        if lod == 'High':
-                            lod = -1
-                        else:
-                            lod = int(lod)
-                        color_space_selection = {}
-                        for color_space_key, color_space_list_button in list(color_space_list_buttons.items()):
-                            color_space_selection[color_space_key] = color_space_list_button.get_selected_item_name()
-                        surface = import_controller(directory,
-                                                    provider_name=provider_name,
-                                                    projection_type=mapping_list.get_selected_item_name().lower(),
-                                                    clip_opacity=clip_opacity_checkbox.get_value(),
-                                                    object_space=os_list.get_selected_item_index(),
-                                                    color_spaces=color_space_selection,
-                                                    triplanar_blend=triplanar_blend_field.get_value(),
-                                                    ior=ior_field.get_value(),
-                                                    metallic_ior=metallic_ior_field.get_value(),
-                                                    obj_scale=obj_scale_field.get_value(),
-                                                    resolution=resolution,
-                                                    lod=lod,
-                                                    ix=ix)
-                        if surface:
-                            ix.application.check_for_events()
-                            ix.selection.deselect_all()
-                            ix.selection.add(surface.mtl)
-                    else:
-                        ix.log_warning("Invalid directory: %s" % directory)
+                provider_name = provider_list.get_selected_item_name().lower()
+                if provider_name == auto_cycle_name.lower():
+                    provider_name = None
+                resolution = resolution_list.get_selected_item_name()
+                if resolution == 'Auto':
+                    resolution = None
+                lod = lod_list.get_selected_item_name()
+                if lod == 'High':
+                    lod = -1
+                else:
+                    lod = int(lod)
+                color_space_selection = {}
+                for color_space_key, color_space_list_button in list(color_space_list_buttons.items()):
+                    color_space_selection[color_space_key] = color_space_list_button.get_selected_item_name()
+                # The settings are read now so changing them in the window doesn't affect a running import.
+                scheduler.add(ImportJob("Import Asset", iter_import_assets(
+                    directories,
+                    provider_name=provider_name,
+                    projection_type=mapping_list.get_selected_item_name().lower(),
+                    clip_opacity=clip_opacity_checkbox.get_value(),
+                    object_space=os_list.get_selected_item_index(),
+                    color_spaces=color_space_selection,
+                    triplanar_blend=triplanar_blend_field.get_value(),
+                    ior=ior_field.get_value(),
+                    metallic_ior=metallic_ior_field.get_value(),
+                    obj_scale=obj_scale_field.get_value(),
+                    resolution=resolution,
+                    lod=lod,
+                    ix=ix)))
             else:
                 ix.log_warning("No directory specified")
-            ix.end_command_batch()
 
     # Window creation
     clarisse_win = ix.application.get_event_window()
-    window = ix.api.GuiWindow(clarisse_win, 900, 450, 400, 670)  # Parent, X position, Y position, Width, Height
+    window = ix.api.GuiWindow(clarisse_win, 900, 450, 400, 700)  # Parent, X position, Y position, Width, Height
     window.set_title('Asset importer')  # Window name
 
     # Main widget creation
@@ -216,6 +231,8 @@ def import_asset_gui(**kwargs):
 
     close_button = ix.api.GuiPushButton(panel, 10, 640, 100, 22, "Close")
     run_button = ix.api.GuiPushButton(panel, 130, 640, 250, 22, "Import")
+    stop_button = ix.api.GuiPushButton(panel, 10, 670, 180, 22, "Stop after asset")
+    cancel_button = ix.api.GuiPushButton(panel, 200, 670, 180, 22, "Cancel import")
 
     # init values
     triplanar_blend_field.set_value(0.5)
@@ -238,11 +255,14 @@ def import_asset_gui(**kwargs):
                          event_rewire.cancel)
     event_rewire.connect(run_button, 'EVT_ID_PUSH_BUTTON_CLICK',
                          event_rewire.run)
+    event_rewire.connect(stop_button, 'EVT_ID_PUSH_BUTTON_CLICK',
+                         event_rewire.stop_import)
+    event_rewire.connect(cancel_button, 'EVT_ID_PUSH_BUTTON_CLICK',
+                         event_rewire.cancel_import)
 
     # Send all info to clarisse to generate window
-    window.show()
-    while window.is_shown():    ix.application.check_for_events()
-    window.destroy()
+    # Imports keep running after the window was closed.
+    run_modal(window, work=scheduler.run_slice, ix=ix)
 
 
 def get_ix(ix_local):
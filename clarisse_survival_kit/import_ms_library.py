@@ -1,9 +1,12 @@
 from clarisse_survival_kit.app import *
-from clarisse_survival_kit.providers.megascans import import_ms_library
+from clarisse_survival_kit.providers.megascans import iter_import_ms_library
+from clarisse_survival_kit.jobs import ImportJob, JobScheduler
+from clarisse_survival_kit.profiling import profile_steps
 
 
 def import_ms_library_gui():
     skip_categories = []
+    scheduler = JobScheduler(ix)
 
     class EventRewire(ix.api.EventObject):
         def categories_refresh(self, sender, evtid):
@@ -26,8 +29,13 @@ def import_ms_library_gui():
         def cancel(self, sender, evtid):
             sender.get_window().hide()
 
+        def stop_import(self, sender, evtid):
+            scheduler.stop()
+
+        def cancel_import(self, sender, evtid):
+            scheduler.cancel()
+
         def run(self, sender, evtid):
-            ix.begin_command_batch("Import Megascans library")
             resolution = resolution_list.get_selected_item_name()
             if resolution == 'Auto':
                 resolution = None
@@ -39,18 +47,21 @@ def import_ms_library_gui():
             directory = path_txt.get_text()
             if directory:
                 if os.path.isdir(directory):
-                    import_ms_library(directory, target_ctx=None, custom_assets=cat_custom_checkbox.get_value(),
-                                      skip_categories=skip_categories, lod=lod, resolution=resolution, ix=ix)
-                    ix.application.check_for_events()
+                    # The assets are imported from the event loop below so the application stays responsive.
+                    # The job is profiled like import_ms_library.
+                    scheduler.add(ImportJob("Import Megascans library", profile_steps(iter_import_ms_library(
+                        directory, target_ctx=None, custom_assets=cat_custom_checkbox.get_value(),
+                        skip_categories=list(skip_categories), lod=lod, resolution=resolution,
+                        use_manifest=manifest_checkbox.get_value(), update_manifest=rescan_checkbox.get_value(),
+                        ix=ix), 'library', directory, ix=ix)))
                 else:
                     ix.log_warning("Invalid directory: %s" % directory)
             else:
                 ix.log_warning("No directory specified")
-            ix.end_command_batch()
 
     # Window creation
     clarisse_win = ix.application.get_event_window()
-    window = ix.api.GuiWindow(clarisse_win, 900, 450, 400, 380)  # Parent, X position, Y position, Width, Height
+    window = ix.api.GuiWindow(clarisse_win, 900, 450, 400, 470)  # Parent, X position, Y position, Width, Height
     window.set_title('Import Megascans library')  # Window name
 
     # Main widget creation
@@ -104,8 +115,15 @@ def import_ms_library_gui():
         'surface': cat_surface_checkbox,
     }
 
-    close_button = ix.api.GuiPushButton(panel, 10, 330, 100, 22, "Close")
-    run_button = ix.api.GuiPushButton(panel, 130, 330, 250, 22, "Import")
+    manifest_label = ix.api.GuiLabel(panel, 10, 310, 180, 22, "Use library manifest:")
+    manifest_checkbox = ix.api.GuiCheckbox(panel, 180, 310, "")
+    rescan_label = ix.api.GuiLabel(panel, 10, 340, 180, 22, "Rescan library:")
+    rescan_checkbox = ix.api.GuiCheckbox(panel, 180, 340, "")
+
+    close_button = ix.api.GuiPushButton(panel, 10, 390, 100, 22, "Close")
+    run_button = ix.api.GuiPushButton(panel, 130, 390, 250, 22, "Import")
+    stop_button = ix.api.GuiPushButton(panel, 10, 420, 180, 22, "Stop after asset")
+    cancel_button = ix.api.GuiPushButton(panel, 200, 420, 180, 22, "Cancel import")
 
     # init values
     cat_3d_checkbox.set_value(True)
@@ -113,6 +131,8 @@ def import_ms_library_gui():
     cat_atlas_checkbox.set_value(True)
     cat_surface_checkbox.set_value(True)
     cat_custom_checkbox.set_value(True)
+    manifest_checkbox.set_value(LIBRARY_MANIFEST_ENABLED)
+    rescan_checkbox.set_value(True)
 
     # Connect to function
     event_rewire = EventRewire()  # init the class
@@ -126,11 +146,14 @@ def import_ms_library_gui():
                          event_rewire.cancel)
     event_rewire.connect(run_button, 'EVT_ID_PUSH_BUTTON_CLICK',
                          event_rewire.run)
+    event_rewire.connect(stop_button, 'EVT_ID_PUSH_BUTTON_CLICK',
+                         event_rewire.stop_import)
+    event_rewire.connect(cancel_button, 'EVT_ID_PUSH_BUTTON_CLICK',
+                         event_rewire.cancel_import)
 
     # Send all info to clarisse to generate window
-    window.show()
-    while window.is_shown():    ix.application.check_for_events()
-    window.destroy()
+    # Imports keep running after the window was closed.
+    run_modal(window, work=scheduler.run_slice, ix=ix)
 
 
 import_ms_library_gui()
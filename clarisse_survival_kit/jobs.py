@@ -0,0 +1,143 @@
+import os
+import time
+import logging
+import collections
+
+from clarisse_survival_kit.settings import *
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+
+class ImportJob:
+    """An import that is run step by step. The steps are generated by an iterator like iter_import_ms_library that
+    yields a progress dict after each step. The dict has the asset the step worked on, whether that asset is done and
+    optionally the number of assets that were added to the job."""
+
+    def __init__(self, name, steps):
+        self.name = name
+        self.steps = iter(steps)
+        self.state = 'pending'
+        self.asset = None
+        self.asset_done = True
+        self.count = 0
+        self.done_count = 0
+
+    def is_active(self):
+        return self.state in ('pending', 'running', 'stopping')
+
+    def step(self):
+        """Runs the next step. Returns False when the job has finished."""
+        if not self.is_active():
+            return False
+        if self.state == 'stopping' and self.asset_done:
+            self.close('stopped')
+            return False
+        self.state = 'running' if self.state == 'pending' else self.state
+        try:
+            progress = next(self.steps)
+        except StopIteration:
+            self.state = 'finished'
+            return False
+        except Exception:
+            logging.exception("Import job failed: " + self.name)
+            self.close('failed')
+            return False
+        self.count += progress.get('count', 0)
+        self.asset_done = progress.get('done', True)
+        if progress.get('asset'):
+            self.asset = progress['asset']
+            if self.asset_done:
+                self.done_count += 1
+        return True
+
+    def stop(self):
+        """Stops the job once the asset it's working on is imported."""
+        if self.is_active():
+            self.state = 'stopping'
+
+    def cancel(self):
+        """Stops the job right away. Steps that already ran are kept."""
+        if self.is_active():
+            self.close('cancelled')
+
+    def close(self, state):
+        self.state = state
+        if hasattr(self.steps, 'close'):
+            self.steps.close()
+
+    def get_status(self):
+        status = '%s: %i/%i' % (self.name, self.done_count, self.count)
+        if self.asset:
+            status += ' ' + os.path.basename(os.path.normpath(self.asset))
+        return status
+
+
+class JobScheduler:
+    """Runs import jobs in time slices from the event loop of a window so the application stays responsive.
+    Each slice is one command batch, so every slice can be undone on its own and nothing the artist does between
+    slices ends up in it."""
+
+    def __init__(self, ix, time_slice=IMPORT_JOB_TIME_SLICE):
+        self.ix = ix
+        self.time_slice = time_slice
+        self.jobs = collections.deque()
+        self.progress = None
+
+    def add(self, job):
+        self.jobs.append(job)
+        return job
+
+    def is_busy(self):
+        return bool(self.jobs)
+
+    def get_job(self):
+        return self.jobs[0] if self.jobs else None
+
+    def run_slice(self):
+        """Runs steps of the current job until the time slice is spent. At least one step is run per slice.
+        Returns whether jobs are left."""
+        job = self.get_job()
+        if not job:
+            return False
+        start = _clock()
+        self.ix.begin_command_batch(job.name)
+        try:
+            while job.step():
+                if _clock() - start >= self.time_slice:
+                    break
+        finally:
+            self.ix.end_command_batch()
+        self.update_progress(job)
+        if not job.is_active():
+            logging.debug("Import job %s %s" % (job.name, job.state))
+            self.jobs.popleft()
+            if self.progress:
+                self.progress.destroy()
+                self.progress = None
+        return self.is_busy()
+
+    def update_progress(self, job):
+        if not job.count:
+            return
+        if not self.progress:
+            self.progress = self.ix.application.create_progress_bar(job.name)
+            self.progress.set_value(0.0)
+            self.progress.start()
+        # Jobs can find more assets while they run.
+        self.progress.set_step_count(job.count)
+        self.progress.step(job.done_count)
+
+    def stop(self):
+        """Stops the current job after its current asset and drops the jobs waiting behind it."""
+        while len(self.jobs) > 1:
+            self.jobs.pop().cancel()
+        if self.jobs:
+            self.jobs[0].stop()
+
+    def cancel(self):
+        """Cancels all jobs right away."""
+        while self.jobs:
+            self.jobs.popleft().cancel()
+        if self.progress:
+            self.progress.destroy()
+            self.progress = None
@@ -0,0 +1,322 @@
+import os
+import re
+import json
+import logging
+import sqlite3
+import threading
+
+from clarisse_survival_kit.settings import *
+from clarisse_survival_kit.scan_index import walk_directory, is_excluded
+
+
+class LibraryManifest:
+    """SQLite manifest of asset libraries.
+
+    Every asset is stored with its type, JSON metadata and files. Image files are classified into map types,
+    resolutions, LOD levels and UDIM tiles so imports and queries don't have to touch the file system.
+    Directory mtimes of each asset are stored as well to detect which assets need to be indexed again.
+    """
+    VERSION = 1
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = None
+        self.lock = threading.RLock()
+
+    def connect(self):
+        """Opens the database and creates the tables if needed."""
+        with self.lock:
+            if self.connection is None:
+                self.connection = sqlite3.connect(self.path, check_same_thread=False)
+                self.connection.row_factory = sqlite3.Row
+                self.create_tables()
+            return self.connection
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+    def create_tables(self):
+        connection = self.connection
+        version = connection.execute('PRAGMA user_version').fetchone()[0]
+        if version != self.VERSION:
+            logging.debug("Manifest version changed. Rebuilding manifest.")
+            for table in ('maps', 'files', 'directories', 'assets'):
+                connection.execute('DROP TABLE IF EXISTS ' + table)
+        connection.executescript('''
+            CREATE TABLE IF NOT EXISTS assets (
+                id INTEGER PRIMARY KEY,
+                path TEXT UNIQUE NOT NULL,
+                directory TEXT NOT NULL,
+                name TEXT NOT NULL,
+                provider TEXT NOT NULL,
+                library TEXT,
+                category TEXT,
+                type TEXT,
+                json_data TEXT
+            );
+            CREATE TABLE IF NOT EXISTS directories (
+                asset_id INTEGER NOT NULL REFERENCES assets(id) ON DELETE CASCADE,
+                path TEXT NOT NULL,
+                mtime REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS files (
+                id INTEGER PRIMARY KEY,
+                asset_id INTEGER NOT NULL REFERENCES assets(id) ON DELETE CASCADE,
+                path TEXT NOT NULL,
+                directory TEXT NOT NULL,
+                name TEXT NOT NULL,
+                extension TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                resolution TEXT,
+                lod INTEGER,
+                udim INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS maps (
+                asset_id INTEGER NOT NULL REFERENCES assets(id) ON DELETE CASCADE,
+                file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+                map_type TEXT NOT NULL,
+                resolution TEXT
+            );
+            CREATE INDEX IF NOT EXISTS assets_type ON assets(type);
+            CREATE INDEX IF NOT EXISTS assets_library ON assets(library, category);
+            CREATE INDEX IF NOT EXISTS directories_asset ON directories(asset_id);
+            CREATE INDEX IF NOT EXISTS files_asset ON files(asset_id);
+            CREATE INDEX IF NOT EXISTS maps_type ON maps(map_type, resolution, asset_id);
+            CREATE INDEX IF NOT EXISTS maps_resolution ON maps(resolution, asset_id);
+        ''')
+        connection.execute('PRAGMA user_version = %i' % self.VERSION)
+        connection.execute('PRAGMA foreign_keys = ON')
+        connection.commit()
+
+    @staticmethod
+    def get_key(directory):
+        return os.path.normcase(os.path.normpath(os.path.abspath(directory)))
+
+    def get_asset_id(self, asset_directory):
+        with self.lock:
+            row = self.connect().execute('SELECT id FROM assets WHERE path = ?',
+                                         (self.get_key(asset_directory),)).fetchone()
+        return row['id'] if row else None
+
+    def is_current(self, asset_directory):
+        """Checks if the asset is indexed and none of its directories changed since."""
+        with self.lock:
+            asset_id = self.get_asset_id(asset_directory)
+            if asset_id is None:
+                return False
+            rows = self.connection.execute('SELECT path, mtime FROM directories WHERE asset_id = ?',
+                                           (asset_id,)).fetchall()
+        for row in rows:
+            try:
+                if os.stat(row['path']).st_mtime != row['mtime']:
+                    return False
+            except OSError:
+                return False
+        return bool(rows)
+
+    def index_asset(self, asset_directory, provider, asset_type=None, json_data=None, library=None, category=None,
+                    lod_match_template=LOD_MATCH_TEMPLATE, force=False):
+        """Stores the asset and all of its files. Unchanged assets are skipped unless forced."""
+        if not force and self.is_current(asset_directory):
+            return self.get_asset_id(asset_directory)
+        # Imported at runtime since utility imports the scan index and this module is kept free of Clarisse.
+        from clarisse_survival_kit.utility import get_filename_classifier
+        classifier = get_filename_classifier(FILENAME_MATCH_TEMPLATE, lod_match_template, IMAGE_FORMATS)
+        udim_regex = re.compile(UDIM_MATCH_TEMPLATE)
+        key = self.get_key(asset_directory)
+        directories = []
+        files = []
+        for root, dirs, filenames in walk_directory(asset_directory):
+            try:
+                directories.append((root, os.stat(root).st_mtime))
+            except OSError:
+                continue
+            relative_dir = os.path.relpath(root, asset_directory).replace(os.sep, '/')
+            if relative_dir == '.':
+                relative_dir = ''
+            for f in filenames:
+                filename, extension = os.path.splitext(f)
+                extension = extension.lower().lstrip('.')
+                record = {'path': os.path.normpath(os.path.join(root, f)), 'directory': relative_dir, 'name': f,
+                          'extension': extension, 'kind': 'other', 'resolution': None, 'lod': None, 'udim': None,
+                          'map_types': ()}
+                if extension in IMAGE_FORMATS:
+                    record['kind'] = 'image'
+                    record['map_types'] = classifier.classify(filename)
+                    record['lod'] = classifier.get_lod_level(filename)
+                    for resolution in IMAGE_RESOLUTIONS:
+                        if resolution in filename:
+                            record['resolution'] = resolution
+                            break
+                    udim_match = udim_regex.search(filename)
+                    if udim_match:
+                        record['udim'] = int(udim_match.group(1))
+                elif extension in GEOMETRY_FORMATS:
+                    record['kind'] = 'geometry'
+                elif extension == 'json':
+                    record['kind'] = 'json'
+                files.append(record)
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                connection.execute('DELETE FROM assets WHERE path = ?', (key,))
+                asset_id = connection.execute(
+                    'INSERT INTO assets (path, directory, name, provider, library, category, type, json_data) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (key, os.path.normpath(asset_directory), os.path.basename(os.path.normpath(asset_directory)), provider,
+                     self.get_key(library) if library else None, category, asset_type,
+                     json.dumps(json_data) if json_data is not None else None)).lastrowid
+                connection.executemany('INSERT INTO directories (asset_id, path, mtime) VALUES (?, ?, ?)',
+                                       [(asset_id, path, mtime) for path, mtime in directories])
+                for record in files:
+                    file_id = connection.execute(
+                        'INSERT INTO files (asset_id, path, directory, name, extension, kind, resolution, lod, udim) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                        (asset_id, record['path'], record['directory'], record['name'], record['extension'],
+                         record['kind'], record['resolution'], record['lod'], record['udim'])).lastrowid
+                    connection.executemany('INSERT INTO maps (asset_id, file_id, map_type, resolution) '
+                                           'VALUES (?, ?, ?, ?)',
+                                           [(asset_id, file_id, map_type, record['resolution'])
+                                            for map_type in record['map_types']])
+        logging.debug("Indexed asset %s with %i files" % (asset_directory, len(files)))
+        return asset_id
+
+    def remove_assets(self, library, keep_ids=()):
+        """Removes the assets of a library that aren't in keep_ids."""
+        keep_ids = set(keep_ids)
+        with self.lock:
+            connection = self.connect()
+            rows = connection.execute('SELECT id FROM assets WHERE library = ?', (self.get_key(library),)).fetchall()
+            remove_ids = [(row['id'],) for row in rows if row['id'] not in keep_ids]
+            with connection:
+                connection.executemany('DELETE FROM assets WHERE id = ?', remove_ids)
+        return len(remove_ids)
+
+    def get_asset(self, asset_directory):
+        """Returns the asset record with its files or None if it isn't indexed."""
+        with self.lock:
+            connection = self.connect()
+            row = connection.execute('SELECT * FROM assets WHERE path = ?',
+                                     (self.get_key(asset_directory),)).fetchone()
+            if not row:
+                return None
+            asset = self.get_record(row)
+            map_types = {}
+            for map_row in connection.execute('SELECT file_id, map_type FROM maps WHERE asset_id = ?', (row['id'],)):
+                map_types.setdefault(map_row['file_id'], []).append(map_row['map_type'])
+            asset['files'] = []
+            for file_row in connection.execute('SELECT * FROM files WHERE asset_id = ? ORDER BY id', (row['id'],)):
+                file_record = dict((column, file_row[column]) for column in file_row.keys())
+                file_record['map_types'] = map_types.get(file_row['id'], [])
+                asset['files'].append(file_record)
+        return asset
+
+    @staticmethod
+    def get_record(row):
+        record = dict((column, row[column]) for column in row.keys())
+        record['json_data'] = json.loads(row['json_data']) if row['json_data'] else None
+        return record
+
+    def get_assets(self, library=None, category=None, asset_type=None, provider=None):
+        """Returns the asset records without files ordered by path."""
+        query = 'SELECT * FROM assets WHERE 1'
+        values = []
+        if library:
+            query += ' AND library = ?'
+            values.append(self.get_key(library))
+        if category:
+            query += ' AND category = ?'
+            values.append(category)
+        if asset_type:
+            query += ' AND type = ?'
+            values.append(asset_type)
+        if provider:
+            query += ' AND provider = ?'
+            values.append(provider)
+        with self.lock:
+            rows = self.connect().execute(query + ' ORDER BY path', values).fetchall()
+        return [self.get_record(row) for row in rows]
+
+    def query_assets(self, asset_type=None, resolution=None, map_types=(), library=None, provider=None):
+        """Returns the directories of the assets matching all conditions.
+        For example all 4K surfaces with displacement: query_assets('surface', '4K', ('displacement',))"""
+        query = 'SELECT directory FROM assets a WHERE 1'
+        values = []
+        if asset_type:
+            query += ' AND a.type = ?'
+            values.append(asset_type)
+        if library:
+            query += ' AND a.library = ?'
+            values.append(self.get_key(library))
+        if provider:
+            query += ' AND a.provider = ?'
+            values.append(provider)
+        for map_type in map_types:
+            query += ' AND EXISTS (SELECT 1 FROM maps m WHERE m.asset_id = a.id AND m.map_type = ?'
+            values.append(map_type)
+            if resolution:
+                query += ' AND m.resolution = ?'
+                values.append(resolution)
+            query += ')'
+        if resolution and not map_types:
+            query += ' AND EXISTS (SELECT 1 FROM maps m WHERE m.asset_id = a.id AND m.resolution = ?)'
+            values.append(resolution)
+        with self.lock:
+            rows = self.connect().execute(query + ' ORDER BY a.path', values).fetchall()
+        return [row['directory'] for row in rows]
+
+    def get_resolutions(self, asset_directory):
+        """Returns the available texture resolutions of an asset."""
+        with self.lock:
+            rows = self.connect().execute(
+                'SELECT DISTINCT m.resolution FROM maps m JOIN assets a ON a.id = m.asset_id '
+                'WHERE a.path = ? AND m.resolution IS NOT NULL', (self.get_key(asset_directory),)).fetchall()
+        resolutions = [row['resolution'] for row in rows]
+        return [resolution for resolution in IMAGE_RESOLUTIONS if resolution in resolutions]
+
+
+def get_asset_files(asset, directory=None, kind=None, exclude=()):
+    """Returns the paths of the files of an asset record. Files in excluded sub directories are skipped."""
+    paths = []
+    for file_record in asset['files']:
+        if kind and file_record['kind'] != kind:
+            continue
+        if directory is not None and file_record['directory'] != directory:
+            continue
+        if exclude and file_record['directory']:
+            if [dir_name for dir_name in file_record['directory'].split('/') if is_excluded(dir_name, exclude)]:
+                continue
+        paths.append(file_record['path'])
+    return paths
+
+
+_library_manifest = None
+
+
+def get_library_manifest():
+    """Returns the library manifest stored in the user path."""
+    global _library_manifest
+    if _library_manifest is None:
+        from clarisse_survival_kit import user_path
+        _library_manifest = LibraryManifest(os.path.join(user_path, LIBRARY_MANIFEST_FILENAME))
+    return _library_manifest
+
+
+def find_manifest_asset(asset_directory):
+    """Returns the asset record if the manifest is enabled and the asset didn't change since it was indexed."""
+    if not LIBRARY_MANIFEST_ENABLED:
+        return None
+    from clarisse_survival_kit import user_path
+    if not user_path or not os.path.isfile(os.path.join(user_path, LIBRARY_MANIFEST_FILENAME)):
+        return None
+    manifest = get_library_manifest()
+    try:
+        if not manifest.is_current(asset_directory):
+            return None
+        return manifest.get_asset(asset_directory)
+    except sqlite3.Error as e:
+        logging.debug("Could not read library manifest: " + str(e))
+        return None
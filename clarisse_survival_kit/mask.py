@@ -12,8 +12,12 @@ def get_blend_nodes(items=None):
         print(str(item))
         kind = ['TextureBlend', 'MaterialPhysicalBlend']
         if item.is_context():
-            ctx_textures = get_items(item, kind=kind, ix=ix)
+            ctx_textures = get_items(item, kind=kind + ['TextureMultiBlend'], ix=ix)
             blend_nodes = blend_nodes + get_blend_nodes(ctx_textures)
+        elif item.get_class_name() == 'TextureMultiBlend':
+            # Multi blends of mixes, masks, moistures and point clouds get the selectors they were created without.
+            if get_selector_layers(item):
+                blend_nodes.append(item)
         elif item.get_class_name() in kind:
             if not item.attrs.mix.attr.get_texture():
                 blend_nodes.append(item)
@@ -43,17 +47,28 @@ def mask_gui():
             ix.begin_command_batch("Mask")
             count = selection_list.get_item_count()
             blend_items = []
+            multi_blend_items = []
             for i in range(0, count):
-                blend_items.append(ix.get_item(selection_list.get_item_name(i)))
-            mask_blend_nodes(blend_items,
-                             mix_name=name_txt.get_text(),
-                             height_blend=height_blend_checkbox.get_value(),
-                             fractal_blend=fractal_blend_checkbox.get_value(),
-                             scope_blend=scope_blend_checkbox.get_value(),
-                             slope_blend=slope_blend_checkbox.get_value(),
-                             triplanar_blend=triplanar_blend_checkbox.get_value(),
-                             ao_blend=ao_blend_checkbox.get_value(),
-                             ix=ix)
+                item = ix.get_item(selection_list.get_item_name(i))
+                if item.get_class_name() == 'TextureMultiBlend':
+                    multi_blend_items.append(item)
+                else:
+                    blend_items.append(item)
+            enabled = {'height': height_blend_checkbox.get_value(), 'fractal': fractal_blend_checkbox.get_value(),
+                       'scope': scope_blend_checkbox.get_value(), 'slope': slope_blend_checkbox.get_value(),
+                       'triplanar': triplanar_blend_checkbox.get_value(), 'ao': ao_blend_checkbox.get_value()}
+            if blend_items:
+                mask_blend_nodes(blend_items,
+                                 mix_name=name_txt.get_text(),
+                                 height_blend=enabled['height'],
+                                 fractal_blend=enabled['fractal'],
+                                 scope_blend=enabled['scope'],
+                                 slope_blend=enabled['slope'],
+                                 triplanar_blend=enabled['triplanar'],
+                                 ao_blend=enabled['ao'],
+                                 ix=ix)
+            for multi_blend_item in multi_blend_items:
+                add_selectors(multi_blend_item, enabled, ix=ix)
             ix.application.check_for_events()
             ix.end_command_batch()
 
@@ -68,7 +83,7 @@ def mask_gui():
                           ix.api.GuiWidget.CONSTRAINT_RIGHT, ix.api.GuiWidget.CONSTRAINT_BOTTOM)
 
     # Form generation
-    separator_label1 = ix.api.GuiLabel(panel, 10, 10, 380, 22, "[ BLEND NODES: ]")
+    separator_label1 = ix.api.GuiLabel(panel, 10, 10, 380, 22, "[ BLEND NODES OR MULTI BLENDS: ]")
     separator_label1.set_text_color(ix.api.GMathVec3uc(128, 128, 128))
 
     textures = get_blend_nodes()
@@ -125,9 +140,7 @@ def mask_gui():
                          event_rewire.run)
 
     # Send all info to clarisse to generate window
-    window.show()
-    while window.is_shown():    ix.application.check_for_events()
-    window.destroy()
+    run_modal(window, ix=ix)
 
 
 mask_gui()
@@ -154,9 +154,7 @@ def mix_surface_gui():
                          event_rewire.run)
 
     # Send all info to clarisse to generate window
-    window.show()
-    while window.is_shown():    ix.application.check_for_events()
-    window.destroy()
+    run_modal(window, ix=ix)
 
 
 mix_surface_gui()
@@ -93,9 +93,7 @@ def moisten_surface_gui():
                          event_rewire.run)
 
     # Send all info to clarisse to generate window
-    window.show()
-    while window.is_shown():    ix.application.check_for_events()
-    window.destroy()
+    run_modal(window, ix=ix)
 
 
 moisten_surface_gui()
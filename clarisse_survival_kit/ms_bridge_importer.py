@@ -1,10 +1,17 @@
 import traceback
-import json, sys, socket, time, threading, os
+import threading
+import codecs
+import json, sys, socket, time, os
 import struct
-import socket
+import select
 import re
 import platform
 
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
 host, port = '127.0.0.1', 24981
 
 
@@ -21,6 +28,13 @@ class ClarisseNetError(Exception):
 
 
 class ClarisseNet:
+    """Client for the Clarisse command port. Messages are framed with a 4 byte little endian size.
+
+    The connection is kept open between commands and reconnected when Clarisse closed it in the meantime. Replies
+    are read into a buffer of the announced size instead of being concatenated chunk by chunk.
+    """
+    header = struct.Struct("<I")
+
     class Status:
         Ok = 1
         Error = -1
@@ -31,22 +45,40 @@ class ClarisseNet:
 
     def __init__(self, host="localhost", port=55000):
         self.status = self.Status.Error
+        self.host = host
+        self.port = port
+        self._socket = None
+        self._header_buffer = bytearray(self.header.size)
         self.connect(host, port)
 
-    def connect(self, host, port):
+    def connect(self, host=None, port=None):
         self.close()
-        self.status = self.Status.Error
+        self.host = host or self.host
+        self.port = port or self.port
         try:
             self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             if platform.system().lower() == "windows":
                 self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             else:
                 self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
-            self._socket.connect((host, port))
-        except:
-            raise ValueError('Failed to connect to ' + host + ':' + str(port))
+            # Commands are small and sent one at a time, don't wait for more data to fill a packet.
+            self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._socket.connect((self.host, self.port))
+        except socket.error:
+            self._socket.close()
+            raise ValueError('Failed to connect to ' + self.host + ':' + str(self.port))
         self.status = self.Status.Ok
 
+    def is_alive(self):
+        """An idle connection has nothing to read. If it's readable Clarisse closed it."""
+        if self.status != self.Status.Ok:
+            return False
+        try:
+            readable, _, _ = select.select([self._socket], [], [], 0)
+        except (socket.error, select.error, ValueError):
+            return False
+        return not readable
+
     def run(self, script):
         self._send(script, self.Mode.Script)
 
@@ -54,85 +86,124 @@ class ClarisseNet:
         return self._send(statement, self.Mode.Statement)
 
     def close(self):
-        if (self.status == self.Status.Ok):
+        if self.status == self.Status.Ok:
             self._socket.close()
+        self.status = self.Status.Error
 
     def __del__(self):
         self.close()
 
     def _send(self, command, mode):
-        if (self.status != self.Status.Ok):
-            raise RuntimeError('Not connected to Clarisse')
-        command_size = len(command) + 1
-        command_size = struct.pack("<I", command_size)
-        self._socket.send(command_size)
-        packet = str(mode) + command
-        if sys.version_info[0] == 3:
-            packet = packet.encode()
-        self._socket.send(packet)
-        result_size = self._socket.recv(4)
-        result_size = struct.unpack("<I", result_size)[0]
-        must_recv = True
-        result = ''
-        remaining = result_size
-        while (must_recv):
-            if sys.version_info[0] == 3:
-                result += self._socket.recv(remaining).decode()
-            else:
-                result += self._socket.recv(remaining)
-            remaining = result_size - len(result)
-            if remaining == 0: must_recv = False
-
-        if (result[0] == '0'):
-            raise ClarisseNetError(result[1:], command)
-        else:
-            result = result[1:]
-            if (result == ''):
-                return None
-            else:
-                return result
+        if not self.is_alive():
+            self.connect()
+        packet = (str(mode) + command).encode('utf-8')
+        try:
+            self._socket.sendall(self.header.pack(len(packet)) + packet)
+        except socket.error:
+            # Nothing was executed yet, so the command can be sent again over a new connection.
+            self.connect()
+            self._socket.sendall(self.header.pack(len(packet)) + packet)
+        try:
+            self._recv_into(memoryview(self._header_buffer))
+            result_size = self.header.unpack(bytes(self._header_buffer))[0]
+            result = memoryview(bytearray(result_size))
+            self._recv_into(result)
+        except socket.error:
+            # The reply is lost, so the connection can't be used for the next command.
+            self.close()
+            raise
+        # Memoryviews index to str on Python 2 and to int on Python 3, so the status is compared as bytes.
+        if result_size == 0 or result[:1].tobytes() == b'0':
+            raise ClarisseNetError(result[1:].tobytes().decode('utf-8'), command)
+        if result_size == 1:
+            return None
+        return result[1:].tobytes().decode('utf-8')
+
+    def _recv_into(self, view):
+        """Fills the view with exactly len(view) bytes."""
+        received = 0
+        while received < len(view):
+            count = self._socket.recv_into(view[received:])
+            if not count:
+                raise socket.error('Connection to ' + self.host + ':' + str(self.port) + ' closed')
+            received += count
+
 
+_connections = {}
 
-class ms_Init(threading.Thread):
-    def __init__(self, importer):
-        threading.Thread.__init__(self)
+
+def get_connection(host="localhost", port=55000):
+    """Returns a connection to the command port that is shared by all sends to the same address."""
+    connection = _connections.get((host, port))
+    if not connection:
+        connection = _connections[(host, port)] = ClarisseNet(host, port)
+    return connection
+
+
+class ThreadedBridgeServer:
+    """Single long-lived listener for Bridge exports on Python 2, which has no asyncio.
+
+    Connections are read one after another by the listener thread. Parsed payloads are queued and imported one after
+    another by a single worker thread, so the thread count stays flat over a session.
+    """
+    buffer_size = 4096 * 2
+
+    def __init__(self, importer, host=host, port=port):
         self.importer = importer
+        self.host = host
+        self.port = port
+        self.queue = queue.Queue()
+
+    def handle_client(self, client):
+        data = bytearray()
+        try:
+            while True:
+                chunk = client.recv(self.buffer_size)
+                if not chunk:
+                    break
+                data += chunk
+        finally:
+            client.close()
+        if not data:
+            return
+        try:
+            json_array = json.loads(data.decode('utf-8'))
+        except ValueError as e:
+            print('Could not parse Bridge data: ' + str(e))
+            return
+        self.queue.put(json_array)
+
+    def import_worker(self):
+        while True:
+            json_array = self.queue.get()
+            try:
+                self.importer(json_array)
+            except Exception as e:
+                print('Error Line : {}'.format(sys.exc_info()[-1].tb_lineno), type(e).__name__, e)
+                print(traceback.format_exc())
 
     def run(self):
         print("Starting up...")
-        time.sleep(0.1)
         try:
-            print("Making socket on port " + str(port))
-            socket_ = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            if platform.system().lower() == "windows":
-                socket_.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            else:
-                socket_.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
-            socket_.bind((host, port))
+            print("Making socket on port " + str(self.port))
+            server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            server.bind((self.host, self.port))
+            server.listen(5)
             print("Socket bound")
             print("Listening to incoming Bridge requests...")
+            worker = threading.Thread(target=self.import_worker)
+            worker.daemon = True
+            worker.start()
             while True:
-                socket_.listen(5)
-                client, addr = socket_.accept()
-                data = ""
-                buffer_size = 4096 * 2
-                data = client.recv(buffer_size)
-                if data != "":
-                    self.TotalData = b""
-                    self.TotalData += data
-                    while True:
-                        data = client.recv(4096 * 2)
-                        if data:
-                            self.TotalData += data
-                        else:
-                            self.importer(self.TotalData)
-                            break
+                client, addr = server.accept()
+                self.handle_client(client)
         except Exception as e:
             print('Error Line : {}'.format(sys.exc_info()[-1].tb_lineno), type(e).__name__, e)
 
 
 def send_to_command_port(assets):
-    rclarisse = ClarisseNet()
+    rclarisse = get_connection()
     import_command = 'from clarisse_survival_kit.providers.megascans import *\n\n'
     print(assets)
     for asset in assets:
@@ -150,10 +221,9 @@ def send_to_command_port(assets):
     rclarisse.run(import_command)
 
 
-def ms_asset_importer(imported_data):
+def ms_asset_importer(json_array):
     print("Imported json data")
     try:
-        json_array = json.loads(imported_data)
         assets = []
         for json_data in json_array:
             assets.append({'path': json_data['path'], 'id': json_data['id'],
@@ -168,14 +238,12 @@ def ms_asset_importer(imported_data):
                 print("Writing json file...")
                 json_file = os.path.join(os.path.normpath(json_data['path']), json_data['id'] + '.json')
 
-                with open(json_file, 'w', encoding="utf8") as outfile:
+                with codecs.open(json_file, 'w', encoding="utf8") as outfile:
                     outfile.write(json.dumps(json_data, indent=4))
                 print("... done writing json file")
         if assets:
             print("Send to command port")
             send_to_command_port(assets)
-        threaded_server = ms_Init(ms_asset_importer)
-        threaded_server.start()
 
     except Exception as e:
         print('Error Line : {}'.format(sys.exc_info()[-1].tb_lineno), type(e).__name__, e)
@@ -183,6 +251,11 @@ def ms_asset_importer(imported_data):
         pass
 
 
+if sys.version_info[0] >= 3:
+    # Lives in its own module since the coroutines are a syntax error on Python 2.
+    from ms_bridge_server import BridgeServer
+else:
+    BridgeServer = ThreadedBridgeServer
+
 print("Running Megascans Bridge client")
-t = ms_Init(ms_asset_importer)
-t.start()
+BridgeServer(ms_asset_importer, host=host, port=port).run()
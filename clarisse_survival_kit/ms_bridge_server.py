@@ -0,0 +1,73 @@
+"""
+Asyncio listener for Megascans Bridge exports. Only used on Python 3, ms_bridge_importer falls back to its
+ThreadedBridgeServer on Python 2.
+"""
+import sys
+import json
+import asyncio
+import traceback
+import concurrent.futures
+
+
+class BridgeServer:
+    """Single long-lived listener for Bridge exports.
+
+    Every connection is read into its own growable buffer and parsed off the event loop. Parsed payloads are queued
+    and imported one after another by a single worker thread, so the thread count stays flat over a session.
+    """
+    buffer_size = 4096 * 2
+
+    def __init__(self, importer, host='127.0.0.1', port=24981):
+        self.importer = importer
+        self.host = host
+        self.port = port
+        self.loop = None
+        self.queue = None
+        self.import_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    async def handle_client(self, reader, writer):
+        data = bytearray()
+        try:
+            while True:
+                chunk = await reader.read(self.buffer_size)
+                if not chunk:
+                    break
+                data += chunk
+        finally:
+            writer.close()
+        if not data:
+            return
+        try:
+            json_array = await self.loop.run_in_executor(None, json.loads, data.decode('utf-8'))
+        except ValueError as e:
+            print('Could not parse Bridge data: ' + str(e))
+            return
+        await self.queue.put(json_array)
+
+    async def import_worker(self):
+        while True:
+            json_array = await self.queue.get()
+            try:
+                await self.loop.run_in_executor(self.import_executor, self.importer, json_array)
+            except Exception as e:
+                print('Error Line : {}'.format(sys.exc_info()[-1].tb_lineno), type(e).__name__, e)
+                print(traceback.format_exc())
+
+    def run(self):
+        print("Starting up...")
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.queue = asyncio.Queue()
+        try:
+            print("Making socket on port " + str(self.port))
+            server = self.loop.run_until_complete(
+                asyncio.start_server(self.handle_client, self.host, self.port, reuse_address=True))
+            print("Socket bound")
+            print("Listening to incoming Bridge requests...")
+            self.loop.create_task(self.import_worker())
+            self.loop.run_forever()
+        except Exception as e:
+            print('Error Line : {}'.format(sys.exc_info()[-1].tb_lineno), type(e).__name__, e)
+        finally:
+            self.import_executor.shutdown(wait=False)
+            self.loop.close()
@@ -0,0 +1,82 @@
+import os
+import re
+import mmap
+import logging
+
+OBJ_STATEMENT_REGEX = re.compile(br'^[ \t]*(usemtl|g)[ \t]+([^\r\n]*)', re.M)
+# Vertices are only matched when the bounds are needed, a match object per vertex costs more than the scan itself.
+OBJ_BOUNDS_STATEMENT_REGEX = re.compile(br'^[ \t]*(usemtl|g|v)[ \t]+([^\r\n]*)', re.M)
+OBJ_FACE_REGEX = re.compile(br'^[ \t]*f[ \t]', re.M)
+OBJ_DEFAULT_SHADING_GROUP = 'default'
+
+_obj_info_cache = {}
+
+
+def scan_obj(data, bounds=True):
+    """Collects the usemtl and group names in order of appearance and whether faces come before the first usemtl.
+    The vertex count and the bounds of the vertices are only collected with bounds, otherwise they're None."""
+    materials = []
+    groups = []
+    first_material_start = None
+    vertex_count = 0
+    minimum = [float('inf')] * 3
+    maximum = [float('-inf')] * 3
+    for match in (OBJ_BOUNDS_STATEMENT_REGEX if bounds else OBJ_STATEMENT_REGEX).finditer(data):
+        statement = match.group(1)
+        if statement == b'v':
+            vertex_count += 1
+            position = match.group(2).split()
+            for axis in range(min(len(position), 3)):
+                value = float(position[axis])
+                if value < minimum[axis]:
+                    minimum[axis] = value
+                if value > maximum[axis]:
+                    maximum[axis] = value
+            continue
+        if statement == b'usemtl' and first_material_start is None:
+            first_material_start = match.start()
+        name = match.group(2).strip().decode('utf-8', 'replace')
+        names = materials if statement == b'usemtl' else groups
+        if name and name not in names:
+            names.append(name)
+    # Faces before the first usemtl end up in the default shading group.
+    default_group = first_material_start is not None and \
+        OBJ_FACE_REGEX.search(data, 0, first_material_start) is not None
+    return {'materials': materials, 'groups': groups, 'default_group': default_group,
+            'vertex_count': vertex_count if bounds else None,
+            'bounds': (tuple(minimum), tuple(maximum)) if bounds and vertex_count else None}
+
+
+def read_obj_info(path, bounds=False):
+    """Returns the material and group names and optionally the vertex count and bounds of an OBJ file without
+    loading it as geometry. The file is memory mapped and scanned in one pass. Returns None if it can't be read."""
+    try:
+        stat = os.stat(path)
+        cache_key = (os.path.normpath(path), bounds)
+        cached = _obj_info_cache.get(cache_key)
+        if cached and cached[0] == (stat.st_mtime, stat.st_size):
+            return cached[1]
+        if not stat.st_size:
+            obj_info = scan_obj(b'', bounds=bounds)
+        else:
+            with open(path, 'rb') as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                try:
+                    obj_info = scan_obj(data, bounds=bounds)
+                finally:
+                    data.close()
+    except (IOError, OSError, ValueError) as e:
+        logging.debug("Could not scan OBJ file %s: %s" % (path, str(e)))
+        return None
+    _obj_info_cache[cache_key] = ((stat.st_mtime, stat.st_size), obj_info)
+    return obj_info
+
+
+def get_shading_group_names(obj_info):
+    """Returns the shading group names the OBJ will have once it's loaded. Faces without a material end up in a
+    single default shading group."""
+    if not obj_info['materials']:
+        return [OBJ_DEFAULT_SHADING_GROUP]
+    if obj_info.get('default_group'):
+        return [OBJ_DEFAULT_SHADING_GROUP] + obj_info['materials']
+    return obj_info['materials']
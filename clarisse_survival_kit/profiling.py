@@ -0,0 +1,222 @@
+import time
+import logging
+import threading
+import functools
+import collections
+
+from clarisse_survival_kit.settings import *
+
+# Phases every command is timed under. Commands that aren't listed count as attribute writes.
+NODE_COMMANDS = ('CreateObject', 'CreateContext', 'Instantiate', 'CombineItems', 'DeleteItems', 'RenameItem',
+                 'MoveItemsTo', 'CreateCustomAttribute')
+GEOMETRY_COMMANDS = ('CreateFileReference',)
+PHASES = ('scan', 'json', 'nodes', 'attributes', 'geometry', 'events', 'other')
+
+_clock = getattr(time, 'perf_counter', time.time)
+_active_profiles = []
+_last_profile = [None]
+
+# Summaries are always written to the .csk log, whatever LOG_LEVEL is set to.
+profile_logger = logging.getLogger('clarisse_survival_kit.profile')
+profile_logger.setLevel(logging.INFO)
+
+
+class Profile:
+    """Wall time per phase and ix.cmds call counts of an operation. Time is only counted for the innermost phase, so
+    the phases add up to the total."""
+
+    def __init__(self, label, name=None):
+        self.label = label
+        self.name = name
+        self.phases = collections.OrderedDict((phase, 0.0) for phase in PHASES)
+        self.commands = collections.Counter()
+        self.children = 0
+        self.total = 0.0
+        self.thread = threading.current_thread()
+        self.start = _clock()
+        self.stack = [['other', self.start]]
+        self.paused = 0.0
+        self.pause_start = None
+
+    def enter(self, phase, now):
+        self.phases[self.stack[-1][0]] += now - self.stack[-1][1]
+        self.stack.append([phase, now])
+
+    def exit(self, now):
+        phase, start = self.stack.pop()
+        self.phases[phase] += now - start
+        self.stack[-1][1] = now
+
+    def pause(self, now):
+        """Stops counting time, like between the steps of an import job."""
+        self.phases['other'] += now - self.stack[0][1]
+        self.pause_start = now
+
+    def resume(self, now):
+        self.paused += now - self.pause_start
+        self.pause_start = None
+        self.stack[0][1] = now
+
+    def finish(self):
+        now = _clock()
+        if self.pause_start is not None:
+            self.resume(now)
+        while len(self.stack) > 1:
+            self.exit(now)
+        self.phases['other'] += now - self.stack[0][1]
+        self.total = now - self.start - self.paused
+
+    def summary(self):
+        lines = ['Profile %s%s: %.3fs' % (self.label, ' ' + str(self.name) if self.name else '', self.total)]
+        if self.children:
+            lines.append('  assets: %i' % self.children)
+        for phase, seconds in self.phases.items():
+            if seconds:
+                lines.append('  %-12s %8.3fs %5.1f%%' % (phase, seconds, seconds / (self.total or 1) * 100))
+        lines.append('  commands: %i' % sum(self.commands.values()))
+        for command, count in self.commands.most_common():
+            lines.append('    %-28s %6i' % (command, count))
+        return '\n'.join(lines)
+
+
+class CommandCounter:
+    """Stands in for ix.cmds while profiling. Counts each call and times it as node creation, attribute writes or
+    geometry loading."""
+
+    def __init__(self, cmds):
+        self.cmds = cmds
+
+    def __getattr__(self, name):
+        command = getattr(self.cmds, name)
+        if not callable(command):
+            return command
+
+        def counted_command(*args, **kwargs):
+            for profile in _active_profiles:
+                profile.commands[name] += 1
+            if name in GEOMETRY_COMMANDS or (name == 'CreateObject' and len(args) > 1 and
+                                             str(args[1]).startswith('Geometry')):
+                phase = 'geometry'
+            elif name in NODE_COMMANDS:
+                phase = 'nodes'
+            else:
+                phase = 'attributes'
+            with profile_phase(phase):
+                return command(*args, **kwargs)
+
+        return counted_command
+
+
+class profile_phase:
+    """Times the enclosed block as a phase of every active profile started on the same thread. Does nothing when
+    profiling is off."""
+
+    def __init__(self, phase):
+        self.phase = phase
+        self.profiles = []
+
+    def __enter__(self):
+        if _active_profiles:
+            self.profiles = [profile for profile in _active_profiles if profile.thread is threading.current_thread()]
+            now = _clock()
+            for profile in self.profiles:
+                profile.enter(self.phase, now)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.profiles:
+            now = _clock()
+            for profile in self.profiles:
+                profile.exit(now)
+            self.profiles = []
+        return False
+
+
+def profile_iterator(iterable, phase):
+    """Times fetching each item of a lazy iterable as a phase."""
+    iterator = iter(iterable)
+    while True:
+        with profile_phase(phase):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def profiled(label):
+    """Profiles the decorated function when PROFILING_ENABLED is set or it's called with profile=True. The summary is
+    written to the log. Calls nested in a profile with the same label are part of that profile, calls nested in a
+    different one are counted as its children and added to its totals."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not kwargs.get('profile', PROFILING_ENABLED) or \
+                    (_active_profiles and _active_profiles[-1].label == label):
+                return func(*args, **kwargs)
+            from clarisse_survival_kit.utility import get_ix
+            ix = get_ix(kwargs.get('ix'))
+            name = args[0] if args and isinstance(args[0], str) else None
+            profile = Profile(label, name)
+            if _active_profiles:
+                _active_profiles[-1].children += 1
+            cmds = ix.cmds
+            if not isinstance(cmds, CommandCounter):
+                ix.cmds = CommandCounter(cmds)
+            _active_profiles.append(profile)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _active_profiles.remove(profile)
+                ix.cmds = cmds
+                profile.finish()
+                _last_profile[0] = profile
+                profile_logger.info(profile.summary())
+
+        return wrapper
+
+    return decorator
+
+
+def profile_steps(steps, label, name=None, **kwargs):
+    """Profiles an iterator that is run step by step like the steps of an ImportJob, with the same options as profiled.
+    The profile is only active while a step runs, the time between steps isn't counted. The summary is written when
+    the steps are exhausted or the generator is closed."""
+    steps = iter(steps)
+    profile = None
+    if kwargs.get('profile', PROFILING_ENABLED):
+        from clarisse_survival_kit.utility import get_ix
+        ix = get_ix(kwargs.get('ix'))
+        profile = Profile(label, name)
+        profile.pause(profile.start)
+    try:
+        while True:
+            if profile:
+                profile.resume(_clock())
+                cmds = ix.cmds
+                if not isinstance(cmds, CommandCounter):
+                    ix.cmds = CommandCounter(cmds)
+                _active_profiles.append(profile)
+            try:
+                step = next(steps)
+            except StopIteration:
+                return
+            finally:
+                if profile:
+                    _active_profiles.remove(profile)
+                    ix.cmds = cmds
+                    profile.pause(_clock())
+            yield step
+    finally:
+        if hasattr(steps, 'close'):
+            steps.close()
+        if profile:
+            profile.finish()
+            _last_profile[0] = profile
+            profile_logger.info(profile.summary())
+
+
+def get_last_profile():
+    """Returns the last finished profile."""
+    return _last_profile[0]
@@ -1,32 +1,61 @@
 from clarisse_survival_kit.settings import *
 from clarisse_survival_kit.utility import *
 from clarisse_survival_kit.surface import Surface
+from clarisse_survival_kit.manifest import get_library_manifest, get_asset_files
 
 
 def inspect_asset(asset_directory):
     report = {}
-    if get_textures_from_directory(asset_directory):
+    textures, geometry = get_assets_from_directory(asset_directory)
+    if textures:
         report['has_textures'] = True
-        if get_geometry_from_directory(asset_directory):
+        if geometry:
             report['has_geometry'] = True
     return report
 
 
-def import_asset(asset_directory, report, **kwargs):
+def get_plan_from_manifest(asset, **kwargs):
+    """Builds the import plan of an asset from its manifest record without touching the file system."""
+    plan = {'directory': asset['directory'], 'report': {}}
+    plan['textures'] = get_textures_from_directory(asset['directory'], image_files=get_asset_files(asset, kind='image'))
+    plan['geometry'] = get_asset_files(asset, kind='geometry')
+    if plan['textures']:
+        plan['report']['has_textures'] = True
+        if plan['geometry']:
+            plan['report']['has_geometry'] = True
+    return plan
+
+
+def index_asset(asset_directory, manifest=None, library=None, category=None, force=False):
+    """Stores the asset in the library manifest. Returns the asset id or None if no textures were found."""
+    if manifest is None:
+        manifest = get_library_manifest()
+    report = inspect_asset(asset_directory)
+    if not report:
+        return None
+    asset_type = '3d' if report.get('has_geometry') else 'surface'
+    return manifest.index_asset(asset_directory, 'generic', asset_type=asset_type, json_data=report,
+                                library=library, category=category, force=force)
+
+
+def import_asset(asset_directory, report, plan=None, **kwargs):
     surface = None
     if report.get('has_textures'):
         logging.debug('Importing surface with arguments: ' + str(kwargs))
-        surface = import_surface(asset_directory, **kwargs)
+        surface = import_surface(asset_directory, plan=plan, **kwargs)
     if report.get('has_geometry'):
         target_ctx = None
         if surface:
             target_ctx = surface.ctx
-        geometry = import_geometry(asset_directory, target_ctx=target_ctx, surface=surface, **kwargs)
+        geometry = import_geometry(asset_directory, target_ctx=target_ctx, surface=surface, plan=plan, **kwargs)
+    # The descriptor is written once the asset is complete.
+    if surface:
+        surface.save_descriptor()
 
 
 def import_surface(asset_directory, target_ctx=None, ior=DEFAULT_IOR, metallic_ior=DEFAULT_METALLIC_IOR,
                    projection_type="triplanar", object_space=0, clip_opacity=True,
-                   color_spaces=(), triplanar_blend=0.5, **kwargs):
+                   color_spaces=(), triplanar_blend=0.5, plan=None, **kwargs):
     # Initial data
     ix = get_ix(kwargs.get("ix"))
     if not target_ctx:
@@ -45,7 +74,10 @@ def import_surface(asset_directory, target_ctx=None, ior=DEFAULT_IOR, metallic_i
     tileable = True
     asset_name = os.path.basename(os.path.normpath(asset_directory))
 
-    textures = get_textures_from_directory(asset_directory)
+    if plan and 'textures' in plan:
+        textures = plan['textures']
+    else:
+        textures = get_textures_from_directory(asset_directory)
     if not textures:
         ix.log_warning("No textures found in directory.")
         return None
@@ -66,7 +98,8 @@ def import_surface(asset_directory, target_ctx=None, ior=DEFAULT_IOR, metallic_i
     return surface
 
 
-def import_geometry(asset_directory, target_ctx=None, surface=None, clip_opacity=True, obj_scale=0.01, **kwargs):
+def import_geometry(asset_directory, target_ctx=None, surface=None, clip_opacity=True, obj_scale=0.01, plan=None,
+                    **kwargs):
     ix = get_ix(kwargs.get("ix"))
     if not target_ctx:
         target_ctx = ix.application.get_working_context()
@@ -81,7 +114,10 @@ def import_geometry(asset_directory, target_ctx=None, surface=None, clip_opacity
     logging.debug("Importing geometry:")
     asset_name = os.path.basename(os.path.normpath(asset_directory))
 
-    geometry = get_geometry_from_directory(asset_directory)
+    if plan and 'geometry' in plan:
+        geometry = plan['geometry']
+    else:
+        geometry = get_geometry_from_directory(asset_directory)
     if not geometry:
         ix.log_warning("No geometry found in directory.")
         return None
@@ -102,13 +138,10 @@ def import_geometry(asset_directory, target_ctx=None, surface=None, clip_opacity
             polyfile.attrs.scale_offset[2] = obj_scale
             geo_items.append(polyfile)
             if surface:
-                geo = polyfile.get_module()
-                for i in range(geo.get_shading_group_count()):
-                    geo.assign_material(surface.mtl.get_module(), i)
-                    if clip_opacity and surface.get('opacity'):
-                        geo.assign_clip_map(surface.get('opacity').get_module(), i)
-                    if surface.get('displacement') and surface.get('displacement_map'):
-                        geo.assign_displacement(surface.get('displacement_map').get_module(), i)
+                assign_shading_groups(polyfile, os.path.join(asset_directory, geo_file), material=surface.mtl,
+                                      clip_map=surface.get('opacity') if clip_opacity else None,
+                                      displacement=surface.get('displacement_map')
+                                      if surface.get('displacement') else None, ix=ix)
         elif extension.lower() == ".abc":
             abc_reference = ix.cmds.CreateFileReference(str(target_ctx),
                                                         [os.path.normpath(os.path.join(asset_directory, geo_file))])
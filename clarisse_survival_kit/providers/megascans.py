@@ -2,12 +2,18 @@ import json
 import logging
 import os
 import multiprocessing.dummy as mp
+import functools
+import copy
 import glob
 import bisect
+import threading
 
 from clarisse_survival_kit.settings import *
 from clarisse_survival_kit.utility import *
 from clarisse_survival_kit.surface import Surface
+from clarisse_survival_kit.scan_index import get_scan_index, list_directory
+from clarisse_survival_kit.manifest import get_library_manifest, get_asset_files
+from clarisse_survival_kit.profiling import profiled, profile_phase, profile_iterator
 
 
 def inspect_asset(asset_directory):
@@ -19,29 +25,186 @@ def inspect_asset(asset_directory):
         return None
 
 
+def prescan_asset(asset_directory, resolution=None, lod=None):
+    """Gathers the metadata and files of an asset into an import plan. Doesn't touch Clarisse so it's thread safe."""
+    asset_directory = os.path.join(os.path.normpath(asset_directory), '')
+    plan = {'directory': asset_directory, 'report': None}
+    try:
+        report = inspect_asset(asset_directory)
+        plan['report'] = report
+        if not report:
+            return plan
+        if report.get('type') == '3dplant':
+            plan['atlas_textures'] = get_textures_from_directory(os.path.join(asset_directory, 'Textures/Atlas/'),
+                                                                 resolution=resolution)
+            plan['billboard_textures'] = get_textures_from_directory(
+                os.path.join(asset_directory, 'Textures/Billboard/'), resolution=resolution)
+            plan['variations'] = {}
+            for dir_name in list_directory(asset_directory)[0]:
+                if dir_name.startswith('Var'):
+                    variation_dir = os.path.join(asset_directory, dir_name)
+                    plan['variations'][variation_dir] = list_directory(variation_dir)[1]
+        else:
+            plan['textures'] = get_textures_from_directory(asset_directory, resolution=resolution, lod=lod,
+                                                           lod_match_template=MEGASCANS_LOD_MATCH_TEMPLATE,
+                                                           exclude=MEGASCANS_SCAN_EXCLUDE_DIRS)
+            plan['files'] = list_directory(asset_directory)[1]
+    except (IOError, OSError, ValueError) as e:
+        logging.error("Could not scan asset %s: %s" % (asset_directory, str(e)))
+        plan['report'] = None
+    return plan
+
+
+def imap_threaded(function, items, threads=MEGASCANS_PRESCAN_THREADS):
+    """Calls the function for each item on a thread pool. Results are yielded in order as soon as they're ready."""
+    if not items:
+        return
+    pool = mp.Pool(max(1, min(threads, len(items))))
+    exhausted = False
+    try:
+        for result in pool.imap(function, items):
+            yield result
+        exhausted = True
+    finally:
+        # A generator that is closed early only waits for the items that are being worked on, not the queued ones.
+        if exhausted:
+            pool.close()
+        else:
+            pool.terminate()
+        pool.join()
+
+
+def prescan_assets(asset_directories, resolution=None, lod=None, threads=MEGASCANS_PRESCAN_THREADS):
+    """Scans the asset directories on a thread pool. Import plans are yielded in order as soon as they're ready."""
+    return imap_threaded(functools.partial(prescan_asset, resolution=resolution, lod=lod), asset_directories,
+                         threads=threads)
+
+
+def get_plan_from_manifest(asset, resolution=None, lod=None):
+    """Builds the import plan of an asset from its manifest record without listing its directories.
+    When a resolution is given, files without a resolution in their name are checked by their image header, which is
+    cached in the scan index."""
+    asset_directory = os.path.join(asset['directory'], '')
+    report = asset['json_data']
+    plan = {'directory': asset_directory, 'report': report}
+    if not report:
+        return plan
+    if report.get('type') == '3dplant':
+        plan['atlas_textures'] = get_textures_from_directory(
+            os.path.join(asset_directory, 'Textures/Atlas/'), resolution=resolution,
+            image_files=get_asset_files(asset, directory='Textures/Atlas', kind='image'))
+        plan['billboard_textures'] = get_textures_from_directory(
+            os.path.join(asset_directory, 'Textures/Billboard/'), resolution=resolution,
+            image_files=get_asset_files(asset, directory='Textures/Billboard', kind='image'))
+        plan['variations'] = {}
+        for file_record in asset['files']:
+            dir_name = file_record['directory']
+            if dir_name.startswith('Var') and '/' not in dir_name:
+                plan['variations'].setdefault(os.path.join(asset_directory, dir_name), []).append(file_record['name'])
+    else:
+        plan['textures'] = get_textures_from_directory(
+            asset_directory, resolution=resolution, lod=lod, lod_match_template=MEGASCANS_LOD_MATCH_TEMPLATE,
+            image_files=get_asset_files(asset, kind='image', exclude=MEGASCANS_SCAN_EXCLUDE_DIRS))
+        plan['files'] = [file_record['name'] for file_record in asset['files'] if not file_record['directory']]
+    return plan
+
+
+def index_asset(asset_directory, manifest=None, library=None, category=None, force=False):
+    """Stores the asset in the library manifest. Returns the asset id or None if it's not a Megascans asset.
+    Unchanged assets are only checked by the mtimes of their directories, their JSON file isn't read again."""
+    if manifest is None:
+        manifest = get_library_manifest()
+    if not force and manifest.is_current(asset_directory):
+        return manifest.get_asset_id(asset_directory)
+    report = inspect_asset(asset_directory)
+    if not report:
+        return None
+    return manifest.index_asset(asset_directory, 'megascans', asset_type=report.get('type'), json_data=report,
+                                library=library, category=category,
+                                lod_match_template=MEGASCANS_LOD_MATCH_TEMPLATE, force=True)
+
+
+def index_ms_library(library_dir, manifest=None, custom_assets=True, skip_categories=(), force=False):
+    """Indexes the whole Megascans Library into the library manifest. Only changed assets are indexed again and
+    assets that were removed from disk are removed from the manifest. Assets are indexed on the prescan thread pool.
+    Returns the number of indexed assets."""
+    return len([asset_id for asset_id in iter_index_ms_library(library_dir, manifest=manifest,
+                                                               custom_assets=custom_assets,
+                                                               skip_categories=skip_categories, force=force)
+                if asset_id is not None])
+
+
+def iter_index_ms_library(library_dir, manifest=None, custom_assets=True, skip_categories=(), force=False):
+    """Indexes the Megascans Library step by step so it can be part of an ImportJob. See index_ms_library.
+    Yields the id of each indexed asset, None for directories without Megascans data and None after each category
+    was listed."""
+    if manifest is None:
+        manifest = get_library_manifest()
+    if not os.path.isdir(library_dir):
+        return
+    if os.path.isdir(os.path.join(library_dir, "Downloaded")):
+        library_dir = os.path.join(library_dir, "Downloaded")
+    logging.debug("Indexing Megascans library: " + library_dir)
+    assets = []
+    for category_dir_name in list_directory(library_dir)[0]:
+        if category_dir_name in MEGASCANS_LIBRARY_CATEGORIES and category_dir_name not in skip_categories:
+            category_dir_path = os.path.join(library_dir, category_dir_name)
+            for asset_directory_name in sorted(list_directory(category_dir_path)[0]):
+                assets.append((os.path.join(category_dir_path, asset_directory_name), category_dir_name))
+            yield None
+    asset_ids = []
+    indexed = imap_threaded(lambda asset: index_asset(asset[0], manifest=manifest, library=library_dir,
+                                                      category=asset[1], force=force), assets)
+    try:
+        for asset_id in indexed:
+            if asset_id is not None:
+                asset_ids.append(asset_id)
+            yield asset_id
+    finally:
+        indexed.close()
+    if not skip_categories:
+        manifest.remove_assets(library_dir, keep_ids=asset_ids)
+    if custom_assets and os.path.isdir(os.path.join(library_dir, "My Assets")):
+        for asset_id in iter_index_ms_library(os.path.join(library_dir, "My Assets"), manifest=manifest,
+                                              custom_assets=False, skip_categories=skip_categories, force=force):
+            yield asset_id
+
+
+@profiled('import')
 def import_asset(asset_directory, report=None, **kwargs):
     ix = get_ix(kwargs.get('ix'))
     asset_directory = os.path.join(os.path.normpath(asset_directory), '')
     if not report:
-        report = inspect_asset(asset_directory)
+        with profile_phase('scan'):
+            report = inspect_asset(asset_directory)
     if report:
         if not kwargs.get('color_spaces'):
             kwargs['color_spaces'] = get_color_spaces(MEGASCANS_COLOR_SPACES, ix=ix)
         asset_type = report.get('type')
+        # Only plain surfaces can be made from templates. Other assets add geometry to the surface context.
+        templates = kwargs.pop('templates', None)
         if asset_type:
+            surfaces = None
             if asset_type == 'surface':
-                import_surface(asset_directory, **kwargs)
+                surfaces = [import_surface(asset_directory, templates=templates, **kwargs)]
             elif asset_type == '3d':
-                import_3d(asset_directory, **kwargs)
+                surfaces = [import_3d(asset_directory, **kwargs)]
             elif asset_type == '3dplant':
-                import_3dplant(asset_directory, **kwargs)
+                surfaces = import_3dplant(asset_directory, **kwargs)
             elif asset_type == 'atlas':
-                import_atlas(asset_directory, **kwargs)
+                surfaces = [import_atlas(asset_directory, **kwargs)]
+            # The descriptors are written once the asset is complete.
+            for surface in surfaces or ():
+                if surface:
+                    surface.save_descriptor()
 
 
 def import_surface(asset_directory, target_ctx=None, ior=DEFAULT_IOR, projection_type='triplanar', object_space=0,
-                   clip_opacity=True, color_spaces=None, triplanar_blend=0.5, resolution=None, lod=None, **kwargs):
-    """Imports a Megascans surface."""
+                   clip_opacity=True, color_spaces=None, triplanar_blend=0.5, resolution=None, lod=None, plan=None,
+                   templates=None, **kwargs):
+    """Imports a Megascans surface.
+    With a templates dict the surface is instanced from an earlier surface with the same signature if there is one.
+    Otherwise it's built and added to the templates."""
     logging.debug("++++++++++++++++++++++.")
     logging.debug("Import Megascans surface called.")
     ix = get_ix(kwargs.get('ix'))
@@ -56,7 +219,10 @@ def import_surface(asset_directory, target_ctx=None, ior=DEFAULT_IOR, projection
     logging.debug('Asset directory: ' + asset_directory)
 
     # Initial data
-    json_data = get_json_data_from_directory(asset_directory)
+    if plan and plan.get('report'):
+        json_data = plan['report']
+    else:
+        json_data = get_json_data_from_directory(asset_directory)
     logging.debug('JSON data:')
     logging.debug(str(json_data))
     if not json_data:
@@ -76,9 +242,12 @@ def import_surface(asset_directory, target_ctx=None, ior=DEFAULT_IOR, projection
 
     # All assets except 3dplant have the material in the root directory of the asset.
     logging.debug('Searching for textures: ')
-    lod_match_template = r'(?:_LOD(?P<lod>[0-9]*)|_NormalBump$)'
-    textures = get_textures_from_directory(asset_directory, resolution=resolution, lod=lod,
-                                           lod_match_template=lod_match_template)
+    if plan and 'textures' in plan:
+        textures = plan['textures']
+    else:
+        textures = get_textures_from_directory(asset_directory, resolution=resolution, lod=lod,
+                                               lod_match_template=MEGASCANS_LOD_MATCH_TEMPLATE,
+                                               exclude=MEGASCANS_SCAN_EXCLUDE_DIRS)
     if not textures:
         ix.log_warning('No textures found in directory. Directory is empty or resolution is invalid.')
         return None
@@ -92,15 +261,26 @@ def import_surface(asset_directory, target_ctx=None, ior=DEFAULT_IOR, projection
     surface = Surface(ix, projection=projection_type, uv_scale=scan_area, height=height, tile=tileable,
                       object_space=object_space, triplanar_blend=triplanar_blend, ior=ior, specular_strength=1,
                       displacement_offset=displacement_offset)
+    signature = None
+    if templates is not None:
+        signature = surface.get_signature(textures, color_spaces, streamed_maps=streamed_maps,
+                                          clip_opacity=clip_opacity)
+        template = templates.get(signature)
+        if template and ix.item_exists(str(template.ctx)):
+            surface.create_from_template(template, asset_name, target_ctx, textures)
+            logging.debug("Import Megascans surface from template done.")
+            return surface
     mtl = surface.create_mtl(asset_name, target_ctx)
     surface.create_textures(textures, color_spaces=color_spaces,
                             streamed_maps=streamed_maps, clip_opacity=clip_opacity)
+    if signature is not None:
+        templates[signature] = surface
     logging.debug("Import Megascans surface done.")
     logging.debug("++++++++++++++++++++++.")
     return surface
 
 
-def import_3d(asset_directory, target_ctx=None, lod=None, resolution=None, clip_opacity=True, **kwargs):
+def import_3d(asset_directory, target_ctx=None, lod=None, resolution=None, clip_opacity=True, plan=None, **kwargs):
     """Imports a Megascans 3D object."""
     ix = get_ix(kwargs.get('ix'))
     logging.debug("*******************************")
@@ -108,7 +288,7 @@ def import_3d(asset_directory, target_ctx=None, lod=None, resolution=None, clip_
     # Force projection to uv
     kwargs['projection_type'] = 'uv'
     surface = import_surface(asset_directory=asset_directory, target_ctx=target_ctx, clip_opacity=clip_opacity,
-                             resolution=resolution, lod=lod, **kwargs)
+                             resolution=resolution, lod=lod, plan=plan, **kwargs)
     if not surface:
         logging.debug('Material creation failed. Specified resolution is probably not valid.')
         return None
@@ -116,7 +296,7 @@ def import_3d(asset_directory, target_ctx=None, lod=None, resolution=None, clip_
     mtl = surface.mtl
     ctx = surface.ctx
 
-    files = [f for f in os.listdir(asset_directory) if os.path.isfile(os.path.join(asset_directory, f))]
+    files = plan['files'] if plan and 'files' in plan else list_directory(asset_directory)[1]
     lod_files = {}
     for f in files:
         filename, extension = os.path.splitext(f)
@@ -145,7 +325,7 @@ def import_3d(asset_directory, target_ctx=None, lod=None, resolution=None, clip_
                     for i in range(geo.get_shading_group_count()):
                         logging.debug('Applying material to geometry')
                         geo.assign_material(mtl.get_module(), i)
-                        ix.application.check_for_events()
+                        pump_events(ix=ix)
                         if clip_opacity and surface.get('opacity'):
                             logging.debug('Applying clip map')
                             geo.assign_clip_map(surface.get('opacity').get_module(), i)
@@ -173,17 +353,13 @@ def import_3d(asset_directory, target_ctx=None, lod=None, resolution=None, clip_
                 polyfile.attrs.scale_offset[0] = .01
                 polyfile.attrs.scale_offset[1] = .01
                 polyfile.attrs.scale_offset[2] = .01
-                geo = polyfile.get_module()
-                for i in range(geo.get_shading_group_count()):
-                    logging.debug('Applying material to geometry')
-                    geo.assign_material(mtl.get_module(), i)
-                    ix.application.check_for_events()
-                    if clip_opacity and surface.get('opacity'):
-                        logging.debug('Applying clip map')
-                        geo.assign_clip_map(surface.get('opacity').get_module(), i)
-                    if not filename.endswith("_High") and surface.get('displacement'):
-                        logging.debug('Applying displacement map')
-                        geo.assign_displacement(surface.get('displacement_map').get_module(), i)
+                logging.debug('Applying material to geometry')
+                assign_shading_groups(polyfile, f, material=mtl,
+                                      clip_map=surface.get('opacity') if clip_opacity else None,
+                                      displacement=surface.get('displacement_map')
+                                      if not filename.endswith("_High") and surface.get('displacement') else None,
+                                      ix=ix)
+                pump_events(ix=ix)
 
     logging.debug("Creating shading layers..")
     shading_layer = ix.cmds.CreateObject(asset_name + SHADING_LAYER_SUFFIX, "ShadingLayer", "Global",
@@ -199,9 +375,11 @@ def import_3d(asset_directory, target_ctx=None, lod=None, resolution=None, clip_
                                              [str(surface.get('opacity'))])
     logging.debug("...done creating shading layers and importing 3d object.")
     logging.debug("********************************************************")
+    return surface
 
 
-def import_atlas(asset_directory, target_ctx=None, lod=None, clip_opacity=True, resolution=None, use_displacement=True, **kwargs):
+def import_atlas(asset_directory, target_ctx=None, lod=None, clip_opacity=True, resolution=None, use_displacement=True,
+                 plan=None, **kwargs):
     """Imports a Megascans 3D object."""
     ix = get_ix(kwargs.get('ix'))
     logging.debug("*******************")
@@ -210,7 +388,7 @@ def import_atlas(asset_directory, target_ctx=None, lod=None, clip_opacity=True,
     # Force projection to UV
     kwargs['projection_type'] = 'uv'
     surface = import_surface(asset_directory=asset_directory, target_ctx=target_ctx, clip_opacity=clip_opacity,
-                             double_sided=True, resolution=resolution, **kwargs)
+                             double_sided=True, resolution=resolution, plan=plan, **kwargs)
     if not surface:
         logging.debug('Material creation failed. Specified resolution is probably not valid.')
         return None
@@ -218,7 +396,7 @@ def import_atlas(asset_directory, target_ctx=None, lod=None, clip_opacity=True,
     mtl = surface.mtl
     ctx = surface.ctx
 
-    files = [f for f in os.listdir(asset_directory) if os.path.isfile(os.path.join(asset_directory, f))]
+    files = plan['files'] if plan and 'files' in plan else list_directory(asset_directory)[1]
     polyfiles = []
     for key, f in enumerate(files):
         filename, extension = os.path.splitext(f)
@@ -227,13 +405,9 @@ def import_atlas(asset_directory, target_ctx=None, lod=None, clip_opacity=True,
             polyfile = ix.cmds.CreateObject(filename, "GeometryPolyfile", "Global",
                                             str(ctx))
             polyfile.attrs.filename = os.path.normpath(os.path.join(asset_directory, f))
-            geo = polyfile.get_module()
-            for i in range(geo.get_shading_group_count()):
-                geo.assign_material(mtl.get_module(), i)
-                if surface.get('opacity') and clip_opacity:
-                    geo.assign_clip_map(surface.get('opacity').get_module(), i)
-                if surface.get('displacement') and use_displacement:
-                    geo.assign_displacement(surface.get('displacement').get_module(), i)
+            assign_shading_groups(polyfile, os.path.join(asset_directory, f), material=mtl,
+                                  clip_map=surface.get('opacity') if clip_opacity else None,
+                                  displacement=surface.get('displacement') if use_displacement else None, ix=ix)
             polyfiles.append(polyfile)
         elif extension.lower() == ".abc":
             logging.debug("Found abc: " + f)
@@ -261,11 +435,12 @@ def import_atlas(asset_directory, target_ctx=None, lod=None, clip_opacity=True,
     ix.cmds.RemoveValue([group.get_full_name() + ".filter"], [2, 0, 1])
     logging.debug("...done setting up group and atlas")
     logging.debug("**********************************")
+    return surface
 
 
 def import_3dplant(asset_directory, target_ctx=None, ior=DEFAULT_IOR, object_space=0, clip_opacity=True,
                    use_displacement=True, color_spaces=MEGASCANS_COLOR_SPACES, triplanar_blend=0.5,
-                   resolution=None, lod=None, **kwargs):
+                   resolution=None, lod=None, plan=None, **kwargs):
     """Imports a Megascans 3D object."""
     ix = get_ix(kwargs.get('ix'))
     logging.debug("*******************")
@@ -283,7 +458,10 @@ def import_3dplant(asset_directory, target_ctx=None, ior=DEFAULT_IOR, object_spa
     logging.debug("Asset directory: " + asset_directory)
 
     # Initial data
-    json_data = get_json_data_from_directory(asset_directory)
+    if plan and plan.get('report'):
+        json_data = plan['report']
+    else:
+        json_data = get_json_data_from_directory(asset_directory)
     logging.debug("JSON data:")
     logging.debug(str(json_data))
     if not json_data:
@@ -298,13 +476,16 @@ def import_3dplant(asset_directory, target_ctx=None, ior=DEFAULT_IOR, object_spa
     asset_name = os.path.basename(os.path.normpath(asset_directory))
     logging.debug("Asset name: " + asset_name)
     logging.debug(os.path.join(asset_directory, 'Textures/Atlas/'))
-    atlas_textures = get_textures_from_directory(os.path.join(asset_directory, 'Textures/Atlas/'),
-                                                 resolution=resolution)
+    if plan and 'atlas_textures' in plan:
+        atlas_textures = plan['atlas_textures']
+    else:
+        atlas_textures = get_textures_from_directory(os.path.join(asset_directory, 'Textures/Atlas/'),
+                                                     resolution=resolution)
     if not atlas_textures:
         ix.log_warning("No atlas textures found in directory. Files might have been exported flattened from Bridge.\n"
                        "Testing import as Atlas.")
         import_atlas(asset_directory, target_ctx=target_ctx, use_displacement=use_displacement,
-                     clip_opacity=clip_opacity, resolution=resolution, **kwargs)
+                     clip_opacity=clip_opacity, resolution=resolution, plan=plan, **kwargs)
         return None
     logging.debug("Atlas textures: ")
     logging.debug(str(atlas_textures))
@@ -321,8 +502,11 @@ def import_3dplant(asset_directory, target_ctx=None, ior=DEFAULT_IOR, object_spa
                                   clip_opacity=clip_opacity)
     atlas_ctx = atlas_surface.ctx
     # Find the textures of the Billboard and create the material.
-    billboard_textures = get_textures_from_directory(os.path.join(asset_directory, 'Textures/Billboard/'),
-                                                     resolution=resolution)
+    if plan and 'billboard_textures' in plan:
+        billboard_textures = plan['billboard_textures']
+    else:
+        billboard_textures = get_textures_from_directory(os.path.join(asset_directory, 'Textures/Billboard/'),
+                                                         resolution=resolution)
     if not billboard_textures:
         ix.log_warning("No Billboard textures found in directory.")
     else:
@@ -340,62 +524,64 @@ def import_3dplant(asset_directory, target_ctx=None, ior=DEFAULT_IOR, object_spa
                                           clip_opacity=clip_opacity)
         billboard_ctx = billboard_surface.ctx
 
-    for dir_name in os.listdir(asset_directory):
-        variation_dir = os.path.join(asset_directory, dir_name)
-        if os.path.isdir(variation_dir) and dir_name.startswith('Var'):
-            logging.debug("Variation dir found: " + variation_dir)
-            files = [f for f in os.listdir(variation_dir) if os.path.isfile(os.path.join(variation_dir, f))]
-            # Search for models files and apply material
-            for f in files:
+    if plan and 'variations' in plan:
+        variations = plan['variations']
+    else:
+        variations = {}
+        for dir_name in list_directory(asset_directory)[0]:
+            if dir_name.startswith('Var'):
+                variation_dir = os.path.join(asset_directory, dir_name)
+                variations[variation_dir] = list_directory(variation_dir)[1]
+    for variation_dir, files in sorted(variations.items()):
+        logging.debug("Variation dir found: " + variation_dir)
+        # Search for models files and apply material
+        for f in files:
+            filename, extension = os.path.splitext(f)
+            if extension.lower() == ".obj":
+                logging.debug("Found obj: " + f)
                 filename, extension = os.path.splitext(f)
-                if extension.lower() == ".obj":
-                    logging.debug("Found obj: " + f)
-                    filename, extension = os.path.splitext(f)
-                    polyfile = ix.cmds.CreateObject(filename, "GeometryPolyfile", "Global", str(plant_root_ctx))
-                    ix.cmds.SetValue(str(polyfile) + ".filename",
-                                     [os.path.normpath(os.path.join(variation_dir, f))])
-                    # Megascans .obj files are saved in cm, Clarisse imports them as meters.
-                    polyfile.attrs.scale_offset[0] = .01
-                    polyfile.attrs.scale_offset[1] = .01
-                    polyfile.attrs.scale_offset[2] = .01
-                    geo = polyfile.get_module()
-                    for i in range(geo.get_shading_group_count()):
-                        if filename.endswith('3'):
-                            geo.assign_material(billboard_mtl.get_module(), i)
-                            if clip_opacity and billboard_surface.get('opacity'):
-                                geo.assign_clip_map((billboard_surface.get('opacity')).get_module(), i)
-                        else:
-                            geo.assign_material(atlas_mtl.get_module(), i)
-                            if clip_opacity and atlas_surface.get('opacity'):
-                                geo.assign_clip_map(atlas_surface.get('opacity').get_module(), i)
-                            lod_level_match = re.sub('.*?([0-9]*)$', r'\1', filename)
-                            if int(lod_level_match) in ATLAS_LOD_DISPLACEMENT_LEVELS and use_displacement:
-                                geo.assign_displacement(atlas_surface.get('displacement_map').get_module(), i)
-                elif extension.lower() == ".abc":
-                    logging.debug("Found abc: " + f)
-                    abc_reference = ix.cmds.CreateFileReference(str(plant_root_ctx),
-                                                                [os.path.normpath(os.path.join(variation_dir, f))])
-
-                    for item in get_items(abc_reference, kind=('GeometryAbcMesh', 'AbcXform'), ix=ix):
-                        if not item.attrs.parent[0]:
-                            item.attrs.scale_offset[0] = .01
-                            item.attrs.scale_offset[1] = .01
-                            item.attrs.scale_offset[2] = .01
-                            geo = item.get_module()
-                            for i in range(geo.get_shading_group_count()):
-                                logging.debug('Applying material to geometry')
-                                if filename.endswith('3'):
-                                    geo.assign_material(billboard_mtl.get_module(), i)
-                                    ix.application.check_for_events()
-                                    if clip_opacity and billboard_surface.get('opacity'):
-                                        logging.debug('Applying clip map')
-                                        geo.assign_clip_map(billboard_surface.get('opacity').get_module(), i)
-                                else:
-                                    geo.assign_material(atlas_mtl.get_module(), i)
-                                    ix.application.check_for_events()
-                                    if clip_opacity and atlas_surface.get('opacity'):
-                                        logging.debug('Applying clip map')
-                                        geo.assign_clip_map(atlas_surface.get('opacity').get_module(), i)
+                polyfile = ix.cmds.CreateObject(filename, "GeometryPolyfile", "Global", str(plant_root_ctx))
+                ix.cmds.SetValue(str(polyfile) + ".filename",
+                                 [os.path.normpath(os.path.join(variation_dir, f))])
+                # Megascans .obj files are saved in cm, Clarisse imports them as meters.
+                polyfile.attrs.scale_offset[0] = .01
+                polyfile.attrs.scale_offset[1] = .01
+                polyfile.attrs.scale_offset[2] = .01
+                if filename.endswith('3'):
+                    assign_shading_groups(polyfile, os.path.join(variation_dir, f), material=billboard_mtl,
+                                          clip_map=billboard_surface.get('opacity') if clip_opacity else None, ix=ix)
+                else:
+                    lod_level_match = re.sub('.*?([0-9]*)$', r'\1', filename)
+                    assign_shading_groups(polyfile, os.path.join(variation_dir, f), material=atlas_mtl,
+                                          clip_map=atlas_surface.get('opacity') if clip_opacity else None,
+                                          displacement=atlas_surface.get('displacement_map')
+                                          if int(lod_level_match) in ATLAS_LOD_DISPLACEMENT_LEVELS and
+                                          use_displacement else None, ix=ix)
+            elif extension.lower() == ".abc":
+                logging.debug("Found abc: " + f)
+                abc_reference = ix.cmds.CreateFileReference(str(plant_root_ctx),
+                                                            [os.path.normpath(os.path.join(variation_dir, f))])
+
+                for item in get_items(abc_reference, kind=('GeometryAbcMesh', 'AbcXform'), ix=ix):
+                    if not item.attrs.parent[0]:
+                        item.attrs.scale_offset[0] = .01
+                        item.attrs.scale_offset[1] = .01
+                        item.attrs.scale_offset[2] = .01
+                        geo = item.get_module()
+                        for i in range(geo.get_shading_group_count()):
+                            logging.debug('Applying material to geometry')
+                            if filename.endswith('3'):
+                                geo.assign_material(billboard_mtl.get_module(), i)
+                                pump_events(ix=ix)
+                                if clip_opacity and billboard_surface.get('opacity'):
+                                    logging.debug('Applying clip map')
+                                    geo.assign_clip_map(billboard_surface.get('opacity').get_module(), i)
+                            else:
+                                geo.assign_material(atlas_mtl.get_module(), i)
+                                pump_events(ix=ix)
+                                if clip_opacity and atlas_surface.get('opacity'):
+                                    logging.debug('Applying clip map')
+                                    geo.assign_clip_map(atlas_surface.get('opacity').get_module(), i)
 
     shading_layer = ix.cmds.CreateObject(asset_name + SHADING_LAYER_SUFFIX, "ShadingLayer", "Global",
                                          str(plant_root_ctx))
@@ -420,99 +606,196 @@ def import_3dplant(asset_directory, target_ctx=None, ior=DEFAULT_IOR, object_spa
 
     logging.debug("...done setting up shading rules, groups and 3d plant")
     logging.debug("*****************************************************")
+    return [atlas_surface, billboard_surface] if billboard_textures else [atlas_surface]
+
+
+_json_data_cache = {}
+# Prescan threads read and fill the cache concurrently.
+_json_data_lock = threading.Lock()
+
+
+def parse_json_data(json_file):
+    """Parses the Megascans JSON file into the data required for material setup."""
+    data = {}
+    with profile_phase('json'), open(json_file) as json_file:
+        json_data = json.load(json_file)
+    if not json_data or type(json_data) == list:
+        return None
+    meta_data = json_data.get('meta')
+    logging.debug("Meta JSON Data: " + str(meta_data))
+    if not meta_data:
+        return None
+    categories = json_data.get('categories')
+    logging.debug("Categories JSON Data: " + str(categories))
+    if not categories:
+        return None
+    maps = json_data.get('maps')
+    logging.debug("JSON follows Megascans structure.")
+    if categories:
+        if 'surface' in categories:
+            data['type'] = 'surface'
+        if '3d' in categories:
+            data['type'] = '3d'
+        if 'atlas' in categories:
+            data['type'] = 'atlas'
+        if '3dplant' in categories:
+            data['type'] = '3dplant'
+    if meta_data:
+        for md in meta_data:
+            if md['key'] == "height":
+                data['surface_height'] = float((md['value']).replace("m", "").replace(" ", ""))
+            elif md['key'] == "scanArea":
+                data['scan_area'] = [float(val) for val in
+                                     (md['value']).replace("m", "").replace(" ", "").split("x")]
+            elif md['key'] == "tileable":
+                data['tileable'] = md['value']
+    if maps:
+        for mp in maps:
+            if mp['type'] == 'displacement' and 'maxIntensity' in mp and 'minIntensity' in mp:
+                # getting average intensity, using 260 as max RGB since that's what Megascans is doing
+                data['displacement_offset'] = ((mp['maxIntensity'] + mp['minIntensity']) * 0.5) / 260.0
+    return data
 
 
 def get_json_data_from_directory(directory):
-    """Get the JSON data contents required for material setup."""
+    """Get the JSON data contents required for material setup.
+    Parsed data is cached per JSON file until its mtime or size changes."""
     logging.debug("Searching for JSON...")
-    files = [f for f in os.listdir(directory) if os.path.isfile(os.path.join(directory, f))]
+    files = list_directory(directory)[1]
     # Search for any JSON file. Custom Mixer scans don't have a suffix like the ones from the library.
-    data = {}
     for f in files:
         filename, extension = os.path.splitext(f)
         if extension == ".json":
             logging.debug("...JSON found!!!")
-            json_file = os.path.join(directory, filename + ".json")
-            with open(json_file) as json_file:
-                json_data = json.load(json_file)
-                if not json_data or type(json_data) == list:
-                    return None
-                meta_data = json_data.get('meta')
-                logging.debug("Meta JSON Data: " + str(meta_data))
-                if not meta_data:
-                    return None
-                categories = json_data.get('categories')
-                logging.debug("Categories JSON Data: " + str(categories))
-                if not categories:
-                    return None
-                maps = json_data.get('maps')
-                logging.debug("JSON follows Megascans structure.")
-                if categories:
-                    if 'surface' in categories:
-                        data['type'] = 'surface'
-                    if '3d' in categories:
-                        data['type'] = '3d'
-                    if 'atlas' in categories:
-                        data['type'] = 'atlas'
-                    if '3dplant' in categories:
-                        data['type'] = '3dplant'
-                if meta_data:
-                    for md in meta_data:
-                        if md['key'] == "height":
-                            data['surface_height'] = float((md['value']).replace("m", "").replace(" ", ""))
-                        elif md['key'] == "scanArea":
-                            data['scan_area'] = [float(val) for val in
-                                                 (md['value']).replace("m", "").replace(" ", "").split("x")]
-                        elif md['key'] == "tileable":
-                            data['tileable'] = md['value']
-                if maps:
-                    for mp in maps:
-                        if mp['type'] == 'displacement' and 'maxIntensity' in mp and 'minIntensity' in mp:
-                            # getting average intensity, using 260 as max RGB since that's what Megascans is doing
-                            data['displacement_offset'] = ((mp['maxIntensity'] + mp['minIntensity']) * 0.5) / 260.0
-            break
-    return data
+            json_file = os.path.normpath(os.path.join(directory, filename + ".json"))
+            try:
+                stat = os.stat(json_file)
+            except OSError:
+                return {}
+            fingerprint = (stat.st_mtime, stat.st_size)
+            with _json_data_lock:
+                cached = _json_data_cache.get(json_file)
+            if cached and cached[0] == fingerprint:
+                logging.debug("Using cached JSON data.")
+                data = cached[1]
+            else:
+                data = parse_json_data(json_file)
+                with _json_data_lock:
+                    _json_data_cache[json_file] = (fingerprint, data)
+            # Callers add their own keys to the data so hand out copies.
+            return copy.deepcopy(data)
+    return {}
 
 
+@profiled('library')
 def import_ms_library(library_dir, target_ctx=None, lod=None, custom_assets=True, resolution=None,
-                      skip_categories=(), **kwargs):
+                      skip_categories=(), use_manifest=LIBRARY_MANIFEST_ENABLED, update_manifest=True,
+                      use_templates=SURFACE_TEMPLATES_ENABLED, **kwargs):
     """Imports the whole Megascans Library. Point it to the Downloaded folder inside your library folder.
+    With use_manifest the assets are read from the library manifest. The manifest is brought up to date first unless
+    update_manifest is disabled. With use_templates surfaces with the same map set are instanced from the first one
+    instead of being built from scratch. Instanced surfaces share the nodes of that first surface, so don't use it for
+    surfaces you're going to edit or delete.
     """
+    for step in iter_import_ms_library(library_dir, target_ctx=target_ctx, lod=lod, custom_assets=custom_assets,
+                                       resolution=resolution, skip_categories=skip_categories,
+                                       use_manifest=use_manifest, update_manifest=update_manifest,
+                                       use_templates=use_templates, **kwargs):
+        pass
+
+
+def iter_import_ms_library(library_dir, target_ctx=None, lod=None, custom_assets=True, resolution=None,
+                           skip_categories=(), use_manifest=LIBRARY_MANIFEST_ENABLED, update_manifest=True,
+                           use_templates=SURFACE_TEMPLATES_ENABLED, templates=None, **kwargs):
+    """Imports the Megascans Library step by step so it can be run as an ImportJob. See import_ms_library.
+    Yields progress dicts without an asset while the library is indexed and its categories are listed, one with the
+    asset count once the library was scanned, then one when the files of an asset were scanned and one when the asset
+    is done. Closing the generator stops the import after the last finished step."""
     logging.debug("Importing Megascans library...")
 
     ix = get_ix(kwargs.get("ix"))
     if not target_ctx:
         target_ctx = ix.application.get_working_context()
     if not check_context(target_ctx, ix=ix):
-        return None
+        return
     if not os.path.isdir(library_dir):
-        return None
+        return
     if os.path.isdir(os.path.join(library_dir, "Downloaded")):
         library_dir = os.path.join(library_dir, "Downloaded")
     logging.debug("Directory set to: " + library_dir)
     print("Scanning folders in " + library_dir)
 
-    for category_dir_name in os.listdir(library_dir):
-        category_dir_path = os.path.join(library_dir, category_dir_name)
-        logging.debug("Checking if directory contains matches keywords: " + category_dir_name)
-        if category_dir_name in ["3d", "3dplant", "surface", "surfaces", "atlas", "atlases"]:
-            if category_dir_name not in skip_categories and os.path.isdir(category_dir_path):
-                context_name = category_dir_name
-                if os.path.basename(library_dir) == "My Assets" and category_dir_name == "surfaces":
-                    context_name = LIBRARY_MIXER_CTX
-                ctx = ix.item_exists(str(target_ctx) + "/" + MEGASCANS_LIBRARY_CATEGORY_PREFIX + context_name)
-                if not ctx:
-                    ctx = ix.cmds.CreateContext(MEGASCANS_LIBRARY_CATEGORY_PREFIX + context_name,
-                                                "Global", str(target_ctx))
-                print("Importing library folder: " + category_dir_name)
-                for asset_directory_name in os.listdir(category_dir_path):
-                    asset_directory_path = os.path.join(category_dir_path, asset_directory_name)
-                    if os.path.isdir(asset_directory_path):
-                        if not ix.item_exists(str(ctx) + "/" + asset_directory_name):
-                            print("Importing asset: " + asset_directory_path)
-                            import_asset(asset_directory_path, resolution=resolution, lod=lod, target_ctx=ctx, ix=ix)
-    if custom_assets and os.path.isdir(os.path.join(library_dir, "My Assets")):
-        logging.debug("My Assets exists...")
-        import_ms_library(os.path.join(library_dir, "My Assets"), target_ctx=target_ctx,
-                          skip_categories=skip_categories, lod=lod, resolution=resolution,
-                          custom_assets=False, ix=ix)
+    manifest = None
+    indexing = None
+    plans = None
+    try:
+        if use_manifest:
+            manifest = get_library_manifest()
+            if update_manifest:
+                # Every indexed asset is a step, so the application stays responsive while the library is scanned.
+                indexing = iter_index_ms_library(library_dir, manifest=manifest, custom_assets=False,
+                                                 skip_categories=skip_categories)
+                for asset_id in profile_iterator(indexing, 'scan'):
+                    yield {'asset': None, 'done': True}
+        assets = []
+        for category_dir_name in os.listdir(library_dir):
+            category_dir_path = os.path.join(library_dir, category_dir_name)
+            logging.debug("Checking if directory contains matches keywords: " + category_dir_name)
+            if category_dir_name in MEGASCANS_LIBRARY_CATEGORIES:
+                if category_dir_name not in skip_categories and os.path.isdir(category_dir_path):
+                    context_name = category_dir_name
+                    if os.path.basename(library_dir) == "My Assets" and category_dir_name == "surfaces":
+                        context_name = LIBRARY_MIXER_CTX
+                    ctx = ix.item_exists(str(target_ctx) + "/" + MEGASCANS_LIBRARY_CATEGORY_PREFIX + context_name)
+                    if not ctx:
+                        ctx = ix.cmds.CreateContext(MEGASCANS_LIBRARY_CATEGORY_PREFIX + context_name,
+                                                    "Global", str(target_ctx))
+                    print("Scanning library folder: " + category_dir_name)
+                    with profile_phase('scan'):
+                        if manifest:
+                            asset_directories = [asset['directory'] for asset in
+                                                 manifest.get_assets(library=library_dir, category=category_dir_name)]
+                        else:
+                            asset_directories = [os.path.join(category_dir_path, asset_directory_name) for
+                                                 asset_directory_name in sorted(list_directory(category_dir_path)[0])]
+                    for asset_directory_path in asset_directories:
+                        if not ix.item_exists(str(ctx) + "/" + os.path.basename(asset_directory_path)):
+                            assets.append((asset_directory_path, ctx))
+                    yield {'asset': None, 'done': True}
+        # Assets are scanned on worker threads while the main thread creates the nodes of the assets that are ready.
+        if manifest:
+            plans = imap_threaded(lambda asset_directory_path: get_plan_from_manifest(
+                manifest.get_asset(asset_directory_path), resolution=resolution, lod=lod),
+                [asset_directory_path for asset_directory_path, ctx in assets])
+        else:
+            plans = prescan_assets([asset_directory_path for asset_directory_path, ctx in assets],
+                                   resolution=resolution, lod=lod)
+        if templates is None and use_templates:
+            templates = {}
+        yield {'asset': None, 'count': len(assets), 'done': False}
+        # Waiting for a plan counts as scanning.
+        for (asset_directory_path, ctx), plan in zip(assets, profile_iterator(plans, 'scan')):
+            if not plan['report']:
+                logging.debug("Skipping asset without Megascans data: " + asset_directory_path)
+                yield {'asset': asset_directory_path, 'done': True}
+                continue
+            yield {'asset': asset_directory_path, 'done': False}
+            print("Importing asset: " + asset_directory_path)
+            import_asset(asset_directory_path, report=plan['report'], plan=plan, resolution=resolution, lod=lod,
+                         target_ctx=ctx, templates=templates, ix=ix)
+            yield {'asset': asset_directory_path, 'done': True}
+        if custom_assets and os.path.isdir(os.path.join(library_dir, "My Assets")):
+            logging.debug("My Assets exists...")
+            for step in iter_import_ms_library(os.path.join(library_dir, "My Assets"), target_ctx=target_ctx,
+                                               skip_categories=skip_categories, lod=lod, resolution=resolution,
+                                               custom_assets=False, use_manifest=use_manifest,
+                                               update_manifest=update_manifest, use_templates=use_templates,
+                                               templates=templates, ix=ix):
+                yield step
+    finally:
+        # The scanner threads of a stopped import are shut down right away.
+        for iterator in (indexing, plans):
+            if hasattr(iterator, 'close'):
+                iterator.close()
+        if SCAN_INDEX_ENABLED:
+            get_scan_index().save(force=True)
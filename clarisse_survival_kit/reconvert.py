@@ -30,16 +30,16 @@ def reconverter_gui():
     progress.set_value(0.0)
     progress.set_step_count(len(textures))
     progress.start()
-    i = 0
-    for tx in textures:
-        if tx:
-            filename = tx.attrs.filename.attr.get_string()
-            if filename:
-                extension = os.path.splitext(filename)[-1].lstrip('.')
-                convert_tx(tx, extension=extension, replace=True, update=True, ix=ix)
-        progress.step(i)
-        i += 1
-        ix.application.check_for_events()
+    finished = []
+
+    def step(job):
+        progress.step(len(finished))
+        finished.append(job)
+        pump_events(ix=ix)
+
+    # Every texture is converted to its own file format.
+    textures = [tx for tx in textures if tx and tx.attrs.filename.attr.get_string()]
+    convert_textures(textures, replace=True, update=True, callback=step, ix=ix)
     progress.destroy()
     ix.end_command_batch()
 
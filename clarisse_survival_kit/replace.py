@@ -211,9 +211,7 @@ def replace_surface_gui(**kwargs):
                          event_rewire.run)
 
     # Send all info to clarisse to generate window
-    window.show()
-    while window.is_shown():    ix.application.check_for_events()
-    window.destroy()
+    run_modal(window, ix=ix)
 
 
 replace_surface_gui()
@@ -0,0 +1,229 @@
+import os
+import json
+import time
+import atexit
+import fnmatch
+import logging
+import threading
+
+from clarisse_survival_kit.settings import *
+from clarisse_survival_kit.image_info import read_image_info
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+
+def scan_entries(directory):
+    """Returns the sub directory and file names of a directory as a tuple of lists with a single directory read.
+    The file type is taken from the cached DirEntry data so no extra stat calls are needed."""
+    dirs = []
+    files = []
+    if scandir is None:
+        for root, dirs, files in os.walk(directory):
+            break
+        return dirs, files
+    try:
+        for entry in scandir(directory):
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                dirs.append(entry.name)
+            else:
+                files.append(entry.name)
+    except OSError as e:
+        logging.debug("Could not scan directory: " + str(e))
+    return dirs, files
+
+
+def is_excluded(dir_name, exclude):
+    """Checks if the directory name matches any of the exclude patterns."""
+    for pattern in exclude:
+        if fnmatch.fnmatch(dir_name, pattern):
+            return True
+    return False
+
+
+def walk(directory, list_function=scan_entries, max_depth=0, exclude=(), current_depth=1):
+    """Walks the directory top-down like os.walk. Excluded directories are pruned. A max_depth of 0 is infinite."""
+    dirs, files = list_function(directory)
+    dirs = [dir_name for dir_name in dirs if not is_excluded(dir_name, exclude)]
+    yield directory, dirs, files
+    if max_depth and current_depth >= max_depth:
+        return
+    for dir_name in dirs:
+        for result in walk(os.path.join(directory, dir_name), list_function, max_depth, exclude, current_depth + 1):
+            yield result
+
+
+class ScanIndex:
+    """Persistent index of directory listings and image headers.
+
+    Every directory is stored with a fingerprint of its mtime and size. As long as the fingerprint of a directory
+    doesn't change its cached listing is served, so only directories that were modified get listed again. Image header
+    info is stored the same way with the fingerprint of the image file.
+    """
+    VERSION = 1
+
+    def __init__(self, path, save_interval=SCAN_INDEX_SAVE_INTERVAL):
+        self.path = path
+        self.save_interval = save_interval
+        self.entries = None
+        self.images = None
+        self.dirty = False
+        self.last_save = time.time()
+        self.lock = threading.RLock()
+
+    def load(self):
+        """Loads the index from disk. A missing or unreadable index starts out empty."""
+        with self.lock:
+            self.entries = {}
+            self.images = {}
+            if not self.path or not os.path.isfile(self.path):
+                return self.entries
+            try:
+                with open(self.path) as index_file:
+                    data = json.load(index_file)
+                if data.get('version') == self.VERSION:
+                    self.entries = data.get('directories', {})
+                    self.images = data.get('images', {})
+                    logging.debug("Scan index loaded with %i directories" % len(self.entries))
+                else:
+                    logging.debug("Scan index version changed. Starting with empty index.")
+            except (IOError, OSError, ValueError) as e:
+                logging.debug("Could not read scan index: " + str(e))
+            return self.entries
+
+    def save(self, force=False):
+        """Writes the index to disk if it changed. Unless forced, writes are throttled by the save interval."""
+        with self.lock:
+            if not self.dirty or self.entries is None or not self.path:
+                return False
+            if not force and time.time() - self.last_save < self.save_interval:
+                return False
+            temp_path = self.path + '.tmp'
+            try:
+                with open(temp_path, 'w') as index_file:
+                    json.dump({'version': self.VERSION, 'directories': self.entries, 'images': self.images},
+                              index_file)
+                if os.path.isfile(self.path):
+                    os.remove(self.path)
+                os.rename(temp_path, self.path)
+            except (IOError, OSError) as e:
+                logging.debug("Could not write scan index: " + str(e))
+                return False
+            self.dirty = False
+            self.last_save = time.time()
+            logging.debug("Scan index saved with %i directories" % len(self.entries))
+            return True
+
+    def clear(self):
+        """Removes all cached directories."""
+        with self.lock:
+            self.entries = {}
+            self.images = {}
+            self.dirty = True
+
+    @staticmethod
+    def get_key(directory):
+        return os.path.normcase(os.path.normpath(os.path.abspath(directory)))
+
+    @staticmethod
+    def get_fingerprint(directory):
+        """Returns the fingerprint of the directory or None if it can't be accessed."""
+        try:
+            stat = os.stat(directory)
+        except OSError:
+            return None
+        return [stat.st_mtime, stat.st_size]
+
+    def list_directory(self, directory):
+        """Returns the sub directory and file names of a directory as a tuple of lists."""
+        key = self.get_key(directory)
+        fingerprint = self.get_fingerprint(directory)
+        if fingerprint is None:
+            return [], []
+        with self.lock:
+            # Prescan threads list directories concurrently, so the index must only be loaded once.
+            if self.entries is None:
+                self.load()
+            entry = self.entries.get(key)
+        if entry and entry['fingerprint'] == fingerprint:
+            return entry['dirs'], entry['files']
+        logging.debug("Scanning directory: " + str(directory))
+        dirs, files = scan_entries(directory)
+        # A directory that was modified within the mtime resolution of the file system may still change unnoticed.
+        if time.time() - fingerprint[0] > SCAN_INDEX_MTIME_RESOLUTION:
+            with self.lock:
+                self.entries[key] = {'fingerprint': fingerprint, 'dirs': dirs, 'files': files}
+                self.dirty = True
+        return dirs, files
+
+    def get_image_info(self, path):
+        """Returns the header info of the image. The header is only read again if the file changed."""
+        key = self.get_key(path)
+        fingerprint = self.get_fingerprint(path)
+        if fingerprint is None:
+            return None
+        with self.lock:
+            if self.entries is None:
+                self.load()
+            entry = self.images.get(key)
+        if entry and entry['fingerprint'] == fingerprint:
+            return entry['info']
+        image_info = read_image_info(path)
+        if time.time() - fingerprint[0] > SCAN_INDEX_MTIME_RESOLUTION:
+            with self.lock:
+                self.images[key] = {'fingerprint': fingerprint, 'info': image_info}
+                self.dirty = True
+        return image_info
+
+    def walk(self, directory, max_depth=0, exclude=()):
+        """Walks the directory top-down like os.walk, serving unchanged directories from the index."""
+        try:
+            for result in walk(directory, self.list_directory, max_depth=max_depth, exclude=exclude):
+                yield result
+        finally:
+            # Also runs when the caller stops iterating early.
+            self.save()
+
+
+_scan_index = None
+
+
+def get_scan_index():
+    """Returns the scan index stored in the user path."""
+    global _scan_index
+    if _scan_index is None:
+        from clarisse_survival_kit import user_path
+        index_path = os.path.join(user_path, SCAN_INDEX_FILENAME) if user_path else None
+        _scan_index = ScanIndex(index_path)
+        atexit.register(_scan_index.save, True)
+    return _scan_index
+
+
+def walk_directory(directory, max_depth=SCAN_MAX_DEPTH, exclude=SCAN_EXCLUDE_DIRS):
+    """Walks the directory through the scan index if it's enabled, otherwise directly from disk."""
+    if not SCAN_INDEX_ENABLED:
+        return walk(directory, max_depth=max_depth, exclude=exclude)
+    return get_scan_index().walk(directory, max_depth=max_depth, exclude=exclude)
+
+
+def list_directory(directory):
+    """Returns the sub directory and file names of a directory, using the scan index if it's enabled."""
+    if not SCAN_INDEX_ENABLED:
+        return scan_entries(directory)
+    return get_scan_index().list_directory(directory)
+
+
+def get_image_info(path):
+    """Returns the header info of an image, cached in the scan index if it's enabled."""
+    if not SCAN_INDEX_ENABLED:
+        return read_image_info(path)
+    return get_scan_index().get_image_info(path)
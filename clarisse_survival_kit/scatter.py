@@ -117,9 +117,7 @@ def generate_decimated_pointcloud_gui():
     event_rewire.connect(run_btn, 'EVT_ID_PUSH_BUTTON_CLICK', event_rewire.run)
 
     # Send all info to clarisse to generate window
-    window.show()
-    while window.is_shown():    ix.application.check_for_events()
-    window.destroy()
+    run_modal(window, ix=ix)
 
 
 generate_decimated_pointcloud_gui()
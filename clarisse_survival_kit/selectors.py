@@ -1,61 +1,106 @@
 from clarisse_survival_kit.settings import *
-from clarisse_survival_kit.utility import add_gradient_key
+from clarisse_survival_kit.utility import add_gradient_key, CommandBuffer
+import collections
 import random
 
 
-def create_height_selector(ctx, name, name_suffix, ix, invert=False):
-	world_position_tx = ix.cmds.CreateObject(name + name_suffix + WORLD_POSITION_SUFFIX, "TextureUtility", "Global",
-											 str(ctx))
-	world_position_reorder_tx = ix.cmds.CreateObject(name + name_suffix + WORLD_POSITION_REORDER_SUFFIX,
-													 "TextureReorder", "Global", str(ctx))
-	world_position_reorder_tx.attrs.channel_order[0] = "ggga"
-	ix.cmds.SetTexture([str(world_position_reorder_tx) + ".input"], str(world_position_tx))
-
-	height_gradient_tx = ix.cmds.CreateObject(name + name_suffix + HEIGHT_GRADIENT_SUFFIX, "TextureGradient", "Global",
-											  str(ctx))
-	if invert:
-		add_gradient_key(str(height_gradient_tx) + ".output", 0.45, [1, 1, 1], ix=ix)
-		add_gradient_key(str(height_gradient_tx) + ".output", 0.55, [0, 0, 0], ix=ix)
-	else:
-		add_gradient_key(str(height_gradient_tx) + ".output", 0.45, [0, 0, 0], ix=ix)
-		add_gradient_key(str(height_gradient_tx) + ".output", 0.55, [1, 1, 1], ix=ix)
-	ix.cmds.RemoveCurveValue([str(height_gradient_tx) + ".output"], [1, 1, 1, 1, 1, 1, 1, 1])
-	ix.cmds.SetTexture([str(height_gradient_tx) + ".input"], str(world_position_reorder_tx))
+def create_height_selector(ctx, name, name_suffix, ix, invert=False, commands=None):
+	if commands is None:
+		commands = CommandBuffer(ix)
+	with commands:
+		world_position_tx = ix.cmds.CreateObject(name + name_suffix + WORLD_POSITION_SUFFIX, "TextureUtility",
+												 "Global", str(ctx))
+		world_position_reorder_tx = ix.cmds.CreateObject(name + name_suffix + WORLD_POSITION_REORDER_SUFFIX,
+														 "TextureReorder", "Global", str(ctx))
+		commands.set_value(str(world_position_reorder_tx) + ".channel_order[0]", "ggga")
+		commands.set_texture(str(world_position_reorder_tx) + ".input", world_position_tx)
+
+		height_gradient_tx = ix.cmds.CreateObject(name + name_suffix + HEIGHT_GRADIENT_SUFFIX, "TextureGradient",
+												  "Global", str(ctx))
+		if invert:
+			add_gradient_key(str(height_gradient_tx) + ".output", 0.45, [1, 1, 1], ix=ix)
+			add_gradient_key(str(height_gradient_tx) + ".output", 0.55, [0, 0, 0], ix=ix)
+		else:
+			add_gradient_key(str(height_gradient_tx) + ".output", 0.45, [0, 0, 0], ix=ix)
+			add_gradient_key(str(height_gradient_tx) + ".output", 0.55, [1, 1, 1], ix=ix)
+		ix.cmds.RemoveCurveValue([str(height_gradient_tx) + ".output"], [1, 1, 1, 1, 1, 1, 1, 1])
+		commands.set_texture(str(height_gradient_tx) + ".input", world_position_reorder_tx)
 	return height_gradient_tx
 
 
-def create_displacement_selector(disp_tx, ctx, name, name_suffix, ix):
-	branch_tx = ix.cmds.CreateObject(name + name_suffix + DISPLACEMENT_BRANCH_SUFFIX, "TextureBranch", "Global",
-									 str(ctx))
-	offset_tx = ix.cmds.CreateObject(name + name_suffix + DISPLACEMENT_OFFSET_SUFFIX, "TextureConstantColor",
-									 "Global",
-									 str(ctx))
-	offset_tx.attrs.color[0] = 0.5
-	offset_tx.attrs.color[1] = 0.5
-	offset_tx.attrs.color[2] = 0.5
-
-	ix.cmds.SetTexture([str(branch_tx) + ".input_a"], str(disp_tx))
-	ix.cmds.SetTexture([str(branch_tx) + ".input_b"], str(offset_tx))
-	branch_tx.attrs.mode = 2
+def create_displacement_selector(disp_tx, ctx, name, name_suffix, ix, commands=None):
+	if commands is None:
+		commands = CommandBuffer(ix)
+	with commands:
+		branch_tx = ix.cmds.CreateObject(name + name_suffix + DISPLACEMENT_BRANCH_SUFFIX, "TextureBranch", "Global",
+										 str(ctx))
+		offset_tx = ix.cmds.CreateObject(name + name_suffix + DISPLACEMENT_OFFSET_SUFFIX, "TextureConstantColor",
+										 "Global",
+										 str(ctx))
+		commands.set_values(str(offset_tx) + ".color", [0.5, 0.5, 0.5])
+
+		commands.set_texture(str(branch_tx) + ".input_a", disp_tx)
+		commands.set_texture(str(branch_tx) + ".input_b", offset_tx)
+		commands.set_value(str(branch_tx) + ".mode", 2)
 	return branch_tx
 
 
-def create_slope_selector(ctx, name, name_suffix, ix, invert=False):
-	# Setup slope gradient
-	slope_tx = ix.cmds.CreateObject(name + name_suffix + SLOPE_BLEND_SUFFIX, "TextureGradient", "Global", str(ctx))
-	slope_start_color = 0
-	slope_end_color = 1
-	if invert:
-		slope_start_color = 1
-		slope_end_color = 0
-	add_gradient_key(str(slope_tx) + ".output", 0.80, [slope_start_color, slope_start_color, slope_start_color], ix=ix)
-	add_gradient_key(str(slope_tx) + ".output", 0.85, [slope_end_color, slope_end_color, slope_end_color], ix=ix)
-	ix.cmds.RemoveCurveValue([str(slope_tx) + ".output"], [1, 1, 1, 1, 1, 1, 1, 1])
-	slope_tx.attrs.mode = 2
+def setup_displacement_normalization(disp, ctx, name, ix, commands=None):
+	"""
+	Scales the displacement texture by the surface height for height blending.
+	Returns the blend offset texture, the offset texture and whether the legacy offset is used.
+	Nodes that already exist in ctx are reused so a surface only has one normalization per context.
+	"""
+	if commands is None:
+		commands = CommandBuffer(ix)
+	blend_offset_tx = ix.item_exists(str(ctx) + "/" + name + DISPLACEMENT_BLEND_OFFSET_SUFFIX)
+	if blend_offset_tx:
+		logging.debug("Reusing displacement normalization: " + str(blend_offset_tx))
+		offset_tx = ix.item_exists(str(ctx) + "/" + name + DISPLACEMENT_OFFSET_SUFFIX)
+		if offset_tx:
+			return blend_offset_tx, offset_tx, True
+		return blend_offset_tx, ix.get_item(str(blend_offset_tx) + ".input1").get_texture(), False
+	height = disp.attrs.front_value[0]
+	disp_tx = ix.get_item(str(disp) + ".front_value").get_texture()
+	logging.debug("Setting up displacement normalization of %s with height %s" % (name, str(height)))
+	with commands:
+		blend_offset_tx = ix.cmds.CreateObject(name + DISPLACEMENT_BLEND_OFFSET_SUFFIX, "TextureAdd", "Global",
+											   str(ctx))
+		if height == 1:
+			commands.set_values(str(blend_offset_tx) + ".input2", [1] * 3)
+			commands.set_texture(str(blend_offset_tx) + ".input1", disp_tx)
+			return blend_offset_tx, disp_tx, False
+		height_scale_tx = ix.cmds.CreateObject(name + DISPLACEMENT_HEIGHT_SCALE_SUFFIX, "TextureMultiply", "Global",
+											   str(ctx))
+		commands.set_texture(str(height_scale_tx) + ".input1", disp_tx)
+		commands.set_values(str(height_scale_tx) + ".input2", [height] * 3)
+		commands.set_texture(str(blend_offset_tx) + ".input1", height_scale_tx)
+		offset_tx = ix.cmds.CreateObject(name + DISPLACEMENT_OFFSET_SUFFIX, "TextureAdd", "Global", str(ctx))
+		commands.set_values(str(offset_tx) + ".input2", [-0.5 * height + 0.5] * 3)
+		commands.set_texture(str(offset_tx) + ".input1", height_scale_tx)
+	return blend_offset_tx, offset_tx, True
+
+
+def create_slope_selector(ctx, name, name_suffix, ix, invert=False, commands=None):
+	if commands is None:
+		commands = CommandBuffer(ix)
+	with commands:
+		# Setup slope gradient
+		slope_tx = ix.cmds.CreateObject(name + name_suffix + SLOPE_BLEND_SUFFIX, "TextureGradient", "Global", str(ctx))
+		slope_start_color = 0
+		slope_end_color = 1
+		if invert:
+			slope_start_color = 1
+			slope_end_color = 0
+		add_gradient_key(str(slope_tx) + ".output", 0.80, [slope_start_color, slope_start_color, slope_start_color],
+						 ix=ix)
+		add_gradient_key(str(slope_tx) + ".output", 0.85, [slope_end_color, slope_end_color, slope_end_color], ix=ix)
+		ix.cmds.RemoveCurveValue([str(slope_tx) + ".output"], [1, 1, 1, 1, 1, 1, 1, 1])
+		commands.set_value(str(slope_tx) + ".mode", 2)
 	return slope_tx
 
 
-def create_scope_selector(ctx, name, name_suffix, ix):
+def create_scope_selector(ctx, name, name_suffix, ix, commands=None):
 	# Setup scope
 	scope_tx = ix.cmds.CreateObject(name + name_suffix + SCOPE_BLEND_SUFFIX, "TextureScope", "Global", str(ctx))
 	scope_obj = ix.cmds.CreateObject(name + name_suffix + SCOPE_OBJ_BLEND_SUFFIX, "Scope", "Global", str(ctx))
@@ -63,64 +108,140 @@ def create_scope_selector(ctx, name, name_suffix, ix):
 	return scope_tx
 
 
-def create_ao_selector(ctx, name, name_suffix, ix):
-	ao_tx = ix.cmds.CreateObject(name + name_suffix + AO_BLEND_SUFFIX, "TextureOcclusion", "Global", str(ctx))
-	ao_tx.attrs.color[0] = 0.0
-	ao_tx.attrs.color[1] = 0.0
-	ao_tx.attrs.color[2] = 0.0
-	ao_tx.attrs.occlusion_color[0] = 1.0
-	ao_tx.attrs.occlusion_color[1] = 1.0
-	ao_tx.attrs.occlusion_color[2] = 1.0
-	ao_tx.attrs.sample_count = 16
-	ao_remap_tx = ix.cmds.CreateObject(name + name_suffix + AO_BLEND_REMAP_SUFFIX, "TextureRemap", "Global", str(ctx))
-	ix.cmds.SetTexture([str(ao_remap_tx) + ".input"], str(ao_tx))
+def create_ao_selector(ctx, name, name_suffix, ix, commands=None):
+	if commands is None:
+		commands = CommandBuffer(ix)
+	with commands:
+		ao_tx = ix.cmds.CreateObject(name + name_suffix + AO_BLEND_SUFFIX, "TextureOcclusion", "Global", str(ctx))
+		commands.set_values(str(ao_tx) + ".color", [0.0, 0.0, 0.0])
+		commands.set_values(str(ao_tx) + ".occlusion_color", [1.0, 1.0, 1.0])
+		commands.set_value(str(ao_tx) + ".sample_count", 16)
+		ao_remap_tx = ix.cmds.CreateObject(name + name_suffix + AO_BLEND_REMAP_SUFFIX, "TextureRemap", "Global",
+										   str(ctx))
+		commands.set_texture(str(ao_remap_tx) + ".input", ao_tx)
 	return ao_remap_tx
 
 
-def create_triplanar_selector(ctx, name, name_suffix, ix, invert=False, blend_ratio=0.5):
-	triplanar_tx = ix.cmds.CreateObject(name + name_suffix + TRIPLANAR_BLEND_SUFFIX, "TextureTriplanar",
-										"Global", str(ctx))
-	start_color = str(0)
-	end_color = str(1)
-	if invert:
-		start_color = str(1)
-		end_color = str(0)
-	ix.cmds.SetValues([str(triplanar_tx) + ".right"], [start_color, start_color, start_color])
-	ix.cmds.SetValues([str(triplanar_tx) + ".left"], [start_color, start_color, start_color])
-	ix.cmds.SetValues([str(triplanar_tx) + ".top"], [end_color, end_color, end_color])
-	ix.cmds.SetValues([str(triplanar_tx) + ".bottom"], [start_color, start_color, start_color])
-	ix.cmds.SetValues([str(triplanar_tx) + ".front"], [start_color, start_color, start_color])
-	ix.cmds.SetValues([str(triplanar_tx) + ".back"], [start_color, start_color, start_color])
-	triplanar_tx.attrs.object_space = 2
-	triplanar_tx.attrs.blend = blend_ratio
+def create_triplanar_selector(ctx, name, name_suffix, ix, invert=False, blend_ratio=0.5, commands=None):
+	if commands is None:
+		commands = CommandBuffer(ix)
+	with commands:
+		triplanar_tx = ix.cmds.CreateObject(name + name_suffix + TRIPLANAR_BLEND_SUFFIX, "TextureTriplanar",
+											"Global", str(ctx))
+		start_color = str(0)
+		end_color = str(1)
+		if invert:
+			start_color = str(1)
+			end_color = str(0)
+		commands.set_values(str(triplanar_tx) + ".right", [start_color, start_color, start_color])
+		commands.set_values(str(triplanar_tx) + ".left", [start_color, start_color, start_color])
+		commands.set_values(str(triplanar_tx) + ".top", [end_color, end_color, end_color])
+		commands.set_values(str(triplanar_tx) + ".bottom", [start_color, start_color, start_color])
+		commands.set_values(str(triplanar_tx) + ".front", [start_color, start_color, start_color])
+		commands.set_values(str(triplanar_tx) + ".back", [start_color, start_color, start_color])
+		commands.set_value(str(triplanar_tx) + ".object_space", 2)
+		commands.set_value(str(triplanar_tx) + ".blend", blend_ratio)
 	return triplanar_tx
 
 
-def create_fractal_selector(ctx, name, name_suffix, ix):
-	# Setup fractal noise
-	fractal_tx = ix.cmds.CreateObject(name + name_suffix + FRACTAL_BLEND_SUFFIX, "TextureFractalNoise", "Global",
-									  str(ctx))
-	fractal_tx.attrs.color1[0] = 1.0
-	fractal_tx.attrs.color1[1] = 1.0
-	fractal_tx.attrs.color1[2] = 1.0
-	fractal_tx.attrs.contrast = .5
-	fractal_tx.attrs.projection = 0
-	fractal_tx.attrs.axis = 1
-	random_offset = random.randrange(-123456, 123456)
-	fractal_tx.attrs.uv_translate[0] = random_offset
-	fractal_tx.attrs.uv_translate[1] = random_offset
-	fractal_tx.attrs.uv_translate[2] = random_offset
-
-	fractal_tx.attrs.uv_scale[0] = .5
-	fractal_tx.attrs.uv_scale[1] = .5
-	fractal_tx.attrs.uv_scale[2] = .5
-	# Let's balance the noise a bit
-	fractal_tx.attrs.turbulent = False
-	fractal_tx.attrs.normalize = False
-	fractal_clamp_tx = ix.cmds.CreateObject(name + name_suffix + FRACTAL_BLEND_CLAMP_SUFFIX, "TextureClamp", "Global",
-											str(ctx))
-	ix.cmds.SetTexture([str(fractal_clamp_tx) + ".input"], str(fractal_tx))
-	fractal_remap_tx = ix.cmds.CreateObject(name + name_suffix + FRACTAL_BLEND_REMAP_SUFFIX, "TextureRemap", "Global",
-											str(ctx))
-	ix.cmds.SetTexture([str(fractal_remap_tx) + ".input"], str(fractal_clamp_tx))
+def create_fractal_selector(ctx, name, name_suffix, ix, commands=None):
+	if commands is None:
+		commands = CommandBuffer(ix)
+	with commands:
+		# Setup fractal noise
+		fractal_tx = ix.cmds.CreateObject(name + name_suffix + FRACTAL_BLEND_SUFFIX, "TextureFractalNoise", "Global",
+										  str(ctx))
+		commands.set_values(str(fractal_tx) + ".color1", [1.0, 1.0, 1.0])
+		commands.set_value(str(fractal_tx) + ".contrast", .5)
+		commands.set_value(str(fractal_tx) + ".projection", 0)
+		commands.set_value(str(fractal_tx) + ".axis", 1)
+		random_offset = random.randrange(-123456, 123456)
+		commands.set_values(str(fractal_tx) + ".uv_translate", [random_offset, random_offset, random_offset])
+
+		commands.set_values(str(fractal_tx) + ".uv_scale", [.5, .5, .5])
+		# Let's balance the noise a bit
+		commands.set_value(str(fractal_tx) + ".turbulent", False)
+		commands.set_value(str(fractal_tx) + ".normalize", False)
+		fractal_clamp_tx = ix.cmds.CreateObject(name + name_suffix + FRACTAL_BLEND_CLAMP_SUFFIX, "TextureClamp",
+												"Global", str(ctx))
+		commands.set_texture(str(fractal_clamp_tx) + ".input", fractal_tx)
+		fractal_remap_tx = ix.cmds.CreateObject(name + name_suffix + FRACTAL_BLEND_REMAP_SUFFIX, "TextureRemap",
+												"Global", str(ctx))
+		commands.set_texture(str(fractal_remap_tx) + ".input", fractal_clamp_tx)
 	return fractal_remap_tx
+
+
+SELECTOR_CREATORS = {
+	'ao': create_ao_selector,
+	'height': create_height_selector,
+	'slope': create_slope_selector,
+	'triplanar': create_triplanar_selector,
+	'scope': create_scope_selector,
+	'fractal': create_fractal_selector,
+}
+SELECTOR_LABELS = {
+	'ao': "Ambient Occlusion Blend",
+	'height': "Height Blend",
+	'slope': "Slope Blend",
+	'triplanar': "Triplanar Blend",
+	'scope': "Scope Blend",
+	'fractal': "Fractal Blend",
+}
+# Layer of the TextureMultiBlend each selector is attached to. Mixes use layer 2 for the displacement blend.
+SELECTOR_LAYERS = collections.OrderedDict([('ao', 2), ('height', 4), ('slope', 5), ('triplanar', 6), ('scope', 7),
+										   ('fractal', 8)])
+MIX_SELECTOR_LAYERS = collections.OrderedDict(SELECTOR_LAYERS, ao=3)
+# The fractal selector multiplies these selectors if any of them is enabled.
+FRACTAL_MULTIPLIED_SELECTORS = ('ao', 'height', 'slope', 'scope')
+
+
+def setup_selector_layers(multi_blend_tx, ctx, name, name_suffix, ix, enabled=None, layers=SELECTOR_LAYERS,
+						  options=None, commands=None):
+	"""Labels the selector layers of a TextureMultiBlend and only creates the selectors that are enabled in the
+	enabled dict. The others can be added later with add_selector_layer, which the mask tool does through
+	add_selectors. Options holds keyword arguments per selector."""
+	enabled = enabled or {}
+	options = options or {}
+	if commands is None:
+		commands = CommandBuffer(ix)
+	with commands:
+		commands.set_value(str(multi_blend_tx) + ".layer_1_label[0]", "Base intensity")
+		for selector, layer in layers.items():
+			commands.set_value(str(multi_blend_tx) + ".layer_%i_label[0]" % layer, SELECTOR_LABELS[selector])
+			commands.set_value(str(multi_blend_tx) + ".layer_%i_mode" % layer, 1)
+		for selector, layer in layers.items():
+			if enabled.get(selector):
+				add_selector_layer(multi_blend_tx, selector, ctx, name, name_suffix, ix, layers=layers,
+								   options=options.get(selector), commands=commands)
+			else:
+				commands.set_value(str(multi_blend_tx) + ".enable_layer_%i" % layer, False)
+
+
+def get_selector_layers(multi_blend_tx):
+	"""Returns the selector layers of a TextureMultiBlend that was set up by setup_selector_layers. The layers are found
+	by their labels, so mixes and masks are told apart."""
+	selectors = dict((label, selector) for selector, label in SELECTOR_LABELS.items())
+	layers = collections.OrderedDict()
+	for layer in range(2, 9):
+		label = multi_blend_tx.get_attribute("layer_%i_label" % layer).get_string()
+		if label in selectors:
+			layers[selectors[label]] = layer
+	return layers
+
+
+def add_selector_layer(multi_blend_tx, selector, ctx, name, name_suffix, ix, layers=SELECTOR_LAYERS, options=None,
+					   commands=None):
+	"""Creates a selector in ctx and enables its layer of the TextureMultiBlend. An existing selector is reused."""
+	if commands is None:
+		commands = CommandBuffer(ix)
+	layer = layers[selector]
+	with commands:
+		selector_tx = ix.get_item(str(multi_blend_tx) + ".layer_%i_color" % layer).get_texture()
+		if not selector_tx:
+			selector_tx = SELECTOR_CREATORS[selector](ctx, name, name_suffix, ix, commands=commands,
+													  **(options or {}))
+			commands.set_texture(str(multi_blend_tx) + ".layer_%i_color" % layer, selector_tx)
+		commands.set_value(str(multi_blend_tx) + ".enable_layer_%i" % layer, True)
+		if selector in FRACTAL_MULTIPLIED_SELECTORS:
+			commands.set_value(str(multi_blend_tx) + ".layer_%i_mode" % layers['fractal'], 4)
+	return selector_tx
@@ -3,6 +3,9 @@ import collections
 
 # File handling. If multiple extensions exist in the folder the most left extension will be picked.
 IMAGE_FORMATS = ('tx', 'tex', 'exr', 'sxr', 'hdr', 'tif', 'tiff', 'tga', 'png', 'jpg', 'jpeg')
+GEOMETRY_FORMATS = ('obj', 'abc', 'lwo')
+# Image formats of which the header can be read without decoding the pixels.
+IMAGE_HEADER_FORMATS = ('tx', 'exr', 'hdr', 'tif', 'tiff', 'tga', 'png', 'jpg', 'jpeg')
 
 
 FILENAME_MATCH_TEMPLATE = {'diffuse': r'(?:_Diffuse|_Albedo|_baseColor|_color|albedo|^diffuse$|^color$|_diff_|Diffuse_)',
@@ -25,6 +28,49 @@ FILENAME_MATCH_TEMPLATE = {'diffuse': r'(?:_Diffuse|_Albedo|_baseColor|_color|al
 
 LOD_MATCH_TEMPLATE = r'_LOD(?P<lod>[0-9]*)'
 
+# Scan index. Directory listings are cached in the user path and only rescanned when a directory changes.
+SCAN_INDEX_ENABLED = True
+SCAN_INDEX_FILENAME = 'scan_index.json'
+SCAN_INDEX_SAVE_INTERVAL = 30
+SCAN_INDEX_MTIME_RESOLUTION = 2
+# Directory walking. A max depth of 0 is infinite. Excluded directory names are matched as wildcard patterns.
+SCAN_MAX_DEPTH = 0
+SCAN_EXCLUDE_DIRS = ('__MACOSX',)
+# Megascans libraries never store assets in hidden directories, so those are skipped there.
+MEGASCANS_SCAN_EXCLUDE_DIRS = SCAN_EXCLUDE_DIRS + ('.*', 'Var*')
+MEGASCANS_LOD_MATCH_TEMPLATE = r'(?:_LOD(?P<lod>[0-9]*)|_NormalBump$)'
+# Number of threads scanning asset directories ahead of the import.
+MEGASCANS_PRESCAN_THREADS = 8
+# Texture conversion. A max job count of 0 runs one converter per CONVERSION_THREADS_PER_JOB threads.
+CONVERSION_MAX_JOBS = 0
+CONVERSION_THREADS_PER_JOB = 4
+CONVERSION_MAX_THREADS = 32
+# Converted files get a sidecar record of their source hash, converter and arguments in a hidden directory.
+# Conversions are skipped when the record shows that an identical result already exists.
+CONVERSION_CACHE_ENABLED = True
+CONVERSION_CACHE_DIRNAME = '.csk_conversions'
+# Library manifest. Indexed assets are imported from the SQLite manifest in the user path instead of the file system.
+LIBRARY_MANIFEST_ENABLED = True
+# Library imports build the first surface of every map set once and instance it for the other surfaces of that set.
+# Instanced surfaces keep the node names of their template and follow edits to it, so this is meant for libraries
+# that are browsed rather than edited and is off by default.
+SURFACE_TEMPLATES_ENABLED = False
+# String attribute of the surface material that describes the surface so it can be loaded without crawling its context.
+SURFACE_DESCRIPTOR_ATTRIBUTE = 'csk_surface'
+SURFACE_DESCRIPTOR_VERSION = 2
+# Seconds of import work that run between event pumps when imports run as jobs from an importer window.
+IMPORT_JOB_TIME_SLICE = 0.1
+LIBRARY_MANIFEST_FILENAME = 'library_manifest.sqlite'
+UDIM_MATCH_TEMPLATE = r'(?:^|[._])(1[0-9]{3})$'
+# Minimum number of seconds between event pumps that only keep the interface responsive.
+EVENT_PUMP_INTERVAL = 0.1
+# Longest sleep in seconds between event checks while a tool window is open and idle.
+MODAL_LOOP_MAX_SLEEP = 0.05
+# An event check that takes longer than this many seconds ran callbacks, so the next checks follow without sleeping.
+MODAL_LOOP_ACTIVITY_TIME = 0.01
+# Write the wall time per phase and the command counts of imports, mixes and terrains to the log.
+PROFILING_ENABLED = False
+
 PROVIDERS = ['megascans', 'generic']
 
 IMAGE_RESOLUTIONS = ['8K', '4K', '2K', '1K']
@@ -187,6 +233,7 @@ ATLAS_LOD_DISPLACEMENT_LEVELS = [0]
 SHADING_LAYER_SUFFIX = "_shading_layer"
 GROUP_SUFFIX = "_grp"
 MEGASCANS_LIBRARY_CATEGORY_PREFIX = "megascans_"
+MEGASCANS_LIBRARY_CATEGORIES = ("3d", "3dplant", "surface", "surfaces", "atlas", "atlases")
 LIBRARY_MIXER_CTX = "mixer"
 IMPORTER_PATH_DELIMITER = "|"
 DECIMATE_SUFFIX = "_decimate"
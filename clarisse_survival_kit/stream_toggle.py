@@ -9,15 +9,17 @@ def toggle_tx_stream_gui():
     new_selection = []
     if check_selection(selection_copy, is_kindof=["TextureMapFile", "TextureStreamedMapFile", "OfContext"]):
         ix.begin_command_batch("Toggle texture stream")
+        dependency_index = DependencyIndex(ix)
         for selected in selection_copy:
             if selected.is_context():
                 texture_maps = get_items(selected, kind=["TextureMapFile", "TextureStreamedMapFile"], ix=ix)
+                dependency_index.index(texture_maps)
                 for texture_map in texture_maps:
-                    tx = toggle_map_file_stream(tx=texture_map, ix=ix)
+                    tx = toggle_map_file_stream(tx=texture_map, dependency_index=dependency_index, ix=ix)
                     if tx:
                         new_selection.append(tx)
             else:
-                tx = toggle_map_file_stream(tx=selected, ix=ix)
+                tx = toggle_map_file_stream(tx=selected, dependency_index=dependency_index, ix=ix)
                 if tx:
                     new_selection.append(tx)
         ix.end_command_batch()
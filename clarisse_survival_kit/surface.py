@@ -1,8 +1,44 @@
 from clarisse_survival_kit.utility import *
+from clarisse_survival_kit.image_info import is_single_channel
+from clarisse_survival_kit.scan_index import get_image_info
+import json
 
 PROJECTIONS = ['planar', 'cylindrical', 'spherical', 'cubic', 'camera', 'parametric', 'uv']
 
 
+class SuffixIndex:
+    """Classifies the names of surface members by their suffix. Triplanar and single channel nodes are matched by the
+    texture suffix followed by TRIPLANAR_SUFFIX or SINGLE_CHANNEL_SUFFIX.
+    Names are matched with one dictionary lookup per suffix length instead of an endswith check per suffix."""
+
+    def __init__(self, suffixes):
+        self.tails = {}
+        for key, suffix in suffixes.items():
+            self.tails.setdefault(suffix, []).append((key, None))
+            self.tails.setdefault(suffix + TRIPLANAR_SUFFIX, []).append((key, 'triplanar'))
+            self.tails.setdefault(suffix + SINGLE_CHANNEL_SUFFIX, []).append((key, 'reorder'))
+        self.lengths = sorted(set(len(tail) for tail in self.tails))
+
+    def classify(self, name):
+        """Returns a list of (key, variant) tuples for every suffix the name ends with. The variant is None for the
+        texture itself, 'triplanar' or 'reorder'."""
+        matches = []
+        for length in self.lengths:
+            if length > len(name):
+                break
+            matches.extend(self.tails.get(name[-length:], ()))
+        return matches
+
+
+SURFACE_SUFFIX_INDEX = SuffixIndex(SUFFIXES)
+
+
+def get_stream_filename(filename):
+    """Replaces the first UDIM tile number of the filename with the <UDIM> tag used by streamed maps."""
+    udim_file = re.sub(r"((?<!\d)\d{4}(?!\d))", "<UDIM>", os.path.split(filename)[-1], count=1)
+    return os.path.join(os.path.split(filename)[0], udim_file)
+
+
 class Surface:
     def __init__(self, ix, **kwargs):
         self.ix = ix
@@ -22,6 +58,7 @@ class Surface:
         self.textures = {}
         self.streamed_maps = []
         self.displacement_offset = kwargs.get('displacement_offset', 0.5)
+        self.commands = CommandBuffer(ix)
 
     def create_mtl(self, name, target_ctx):
         """Creates a new PhysicalStandard material and context."""
@@ -30,10 +67,11 @@ class Surface:
         ctx = self.ix.cmds.CreateContext(name, "Global", str(target_ctx))
         self.ctx = ctx
         mtl = self.ix.cmds.CreateObject(name + MATERIAL_SUFFIX, "MaterialPhysicalStandard", "Global", str(ctx))
-        if mtl.attribute_exists('sidedness') and self.double_sided:
-            self.ix.cmds.SetValues([str(mtl) + ".sidedness"], ["1"])
-        self.ix.cmds.SetValue(str(mtl) + ".specular_1_index_of_refraction", [str(self.ior)])
-        self.ix.cmds.SetValue(str(mtl) + ".specular_1_strength", [str(self.specular_strength)])
+        with self.commands as commands:
+            if mtl.attribute_exists('sidedness') and self.double_sided:
+                commands.set_value(str(mtl) + ".sidedness", 1)
+            commands.set_value(str(mtl) + ".specular_1_index_of_refraction", self.ior)
+            commands.set_value(str(mtl) + ".specular_1_strength", self.specular_strength)
         self.mtl = mtl
         logging.debug("...done creating material")
         return mtl
@@ -41,17 +79,74 @@ class Surface:
     def create_textures(self, textures, color_spaces, streamed_maps=(), clip_opacity=True):
         """Creates all textures from a index:filename dict."""
         logging.debug("Creating textures...")
-        for index, texture_settings in list(TEXTURE_SETTINGS.items()):
-            if index in textures:
-                if index == 'opacity' and clip_opacity:
-                    texture_settings['connection'] = None
-                logging.debug("Using these settings for texture: " + str(texture_settings))
-                color_space = color_spaces.get(index)
-                filename = textures[index]
-                tx = self.create_tx(index, filename, color_space=color_space,
-                                    streamed=index in streamed_maps, **texture_settings)
+        # All attribute writes of the surface are sent together once every texture has been created.
+        with self.commands:
+            for index, texture_settings in list(TEXTURE_SETTINGS.items()):
+                if index in textures:
+                    if index == 'opacity' and clip_opacity:
+                        texture_settings['connection'] = None
+                    logging.debug("Using these settings for texture: " + str(texture_settings))
+                    color_space = color_spaces.get(index)
+                    filename = textures[index]
+                    tx = self.create_tx(index, filename, color_space=color_space,
+                                        streamed=index in streamed_maps, **texture_settings)
         logging.debug("...done creating textures")
 
+    def get_signature(self, textures, color_spaces, streamed_maps=(), clip_opacity=True):
+        """Returns a key of everything that decides the nodes of the surface and the values they share. Surfaces with
+        the same signature only differ in their names, filenames, scan area and displacement height."""
+        indices = sorted(textures)
+        grey = tuple(index for index in indices if index not in streamed_maps and
+                     self.get_single_channel_file_behavior(textures[index],
+                                                           TEXTURE_SETTINGS.get(index, {}).get('single_channel')))
+        return (tuple(indices), tuple(sorted(streamed_maps)), grey,
+                tuple(color_spaces.get(index) for index in indices), self.projection, self.object_space,
+                self.triplanar_blend, self.tile, self.double_sided, self.ior, self.metallic_ior,
+                self.specular_strength, clip_opacity)
+
+    def create_from_template(self, template, name, target_ctx, textures):
+        """Creates the surface as an instance of a template surface with the same signature. Only the filenames, the
+        scan area and the displacement height are localized and changed, so no nodes have to be created. The nodes keep the
+        names of the template and everything that isn't localized follows the template."""
+        logging.debug("Creating surface from template: " + str(template.ctx))
+        self.name = name
+        ctx = self.ix.cmds.Instantiate([str(template.ctx)])[0]
+        if str(ctx.get_context()) != str(target_ctx):
+            self.ix.cmds.MoveItemsTo([str(ctx)], str(target_ctx))
+        self.ix.cmds.RenameItem(str(ctx), name)
+        self.ctx = ctx
+
+        def get_instance_path(item):
+            return str(ctx) + str(item)[len(str(template.ctx)):]
+
+        self.mtl = self.ix.get_item(get_instance_path(template.mtl))
+        self.textures = dict((index, self.ix.get_item(get_instance_path(tx)))
+                             for index, tx in template.textures.items() if tx)
+        self.streamed_maps = list(template.streamed_maps)
+        values = []
+        uv_scale = [self.uv_scale[0], (self.uv_scale[0] + self.uv_scale[1]) / 2, self.uv_scale[1]]
+        for index, filename in textures.items():
+            tx = self.get(index)
+            if not tx:
+                continue
+            values.append((str(tx) + ".filename", [get_stream_filename(filename)
+                                                   if index in self.streamed_maps else filename]))
+            if self.projection != 'uv' and index != 'preview':
+                values.append((str(tx) + ".uv_scale", uv_scale))
+        if self.get('displacement_map'):
+            displacement_ctx = get_instance_path(template.get_sub_ctx('displacement') or template.ctx)
+            values.append((str(self.get('displacement_map')) + ".bound", [self.height] * 3))
+            values.append((displacement_ctx + "/" + template.name + DISPLACEMENT_OFFSET_SUFFIX + ".input2",
+                           [self.displacement_offset] * 3))
+            values.append((displacement_ctx + "/" + template.name + DISPLACEMENT_HEIGHT_SCALE_SUFFIX + ".input2",
+                           [self.height] * 3))
+        self.ix.cmds.LocalizeAttributes([attr for attr, attr_values in values], True)
+        with self.commands as commands:
+            for attr, attr_values in values:
+                commands.set_values(attr, attr_values)
+        logging.debug("...done creating surface from template")
+        return self.mtl
+
     def update_textures(self, textures, color_spaces, streamed_maps=()):
         logging.debug("Updating textures...")
         for index, texture_settings in list(TEXTURE_SETTINGS.items()):
@@ -63,11 +158,103 @@ class Surface:
                                     streamed=index in streamed_maps, **texture_settings)
         logging.debug("...done updating textures")
 
+    def save_descriptor(self):
+        """Stores the textures, projection and scan area of the surface as a JSON string on the material. Importers
+        call it once the asset is complete. Tools that change the nodes don't, load notices it and crawls instead."""
+        if not self.mtl or not self.ctx:
+            return
+        ctx_path = str(self.ctx) + "/"
+        descriptor = {
+            'version': SURFACE_DESCRIPTOR_VERSION,
+            'mtl': str(self.mtl)[len(ctx_path):],
+            'textures': dict((key, str(tx)[len(ctx_path):]) for key, tx in self.textures.items()
+                             if tx and str(tx).startswith(ctx_path)),
+            'classes': dict((key, tx.get_class_name()) for key, tx in self.textures.items()
+                            if tx and str(tx).startswith(ctx_path)),
+            'projection': self.projection,
+            'object_space': self.object_space,
+            'uv_scale': list(self.uv_scale) if self.uv_scale else None,
+            'height': self.height,
+            'streamed_maps': list(self.streamed_maps)
+        }
+        attr = str(self.mtl) + "." + SURFACE_DESCRIPTOR_ATTRIBUTE
+        if not self.mtl.attribute_exists(SURFACE_DESCRIPTOR_ATTRIBUTE):
+            self.ix.cmds.CreateCustomAttribute([str(self.mtl)], SURFACE_DESCRIPTOR_ATTRIBUTE, 3,
+                                               ["container", "vhint", "group", "count", "allow_expression"],
+                                               ["CONTAINER_SINGLE", "VISUAL_HINT_DEFAULT", "Surface", "1", "0"])
+        elif not self.mtl.get_attribute(SURFACE_DESCRIPTOR_ATTRIBUTE).is_local():
+            self.ix.cmds.LocalizeAttributes([attr], True)
+        with self.commands as commands:
+            commands.set_value(attr + "[0]", json.dumps(descriptor, sort_keys=True, separators=(',', ':')))
+
+    def load_descriptor(self, ctx):
+        """Loads the surface from the descriptor on its material without changing the scene. Returns None if there is
+        no descriptor and False if it doesn't match the nodes of the context anymore."""
+        descriptor = None
+        for mtl in get_items(ctx, kind=["MaterialPhysicalStandard"], max_depth=1, ix=self.ix):
+            if mtl.attribute_exists(SURFACE_DESCRIPTOR_ATTRIBUTE):
+                try:
+                    descriptor = json.loads(mtl.get_attribute(SURFACE_DESCRIPTOR_ATTRIBUTE).get_string())
+                except ValueError:
+                    pass
+                break
+        if not descriptor:
+            logging.debug("No surface descriptor found in ctx: " + str(ctx))
+            return None
+        if descriptor.get('version') != SURFACE_DESCRIPTOR_VERSION:
+            logging.debug("Surface descriptor has an old version in ctx: " + str(ctx))
+            return False
+        ctx_path = str(ctx) + "/"
+        mtl = self.ix.item_exists(ctx_path + str(descriptor['mtl']))
+        textures = {}
+        for key, path in descriptor['textures'].items():
+            textures[str(key)] = self.ix.item_exists(ctx_path + str(path))
+            if not textures[str(key)]:
+                logging.debug("Surface descriptor is stale. Missing texture: " + str(path))
+                return False
+        if not mtl or not textures or not self.is_descriptor_current(descriptor, textures):
+            return False
+        self.mtl = mtl
+        self.textures = textures
+        self.projection = str(descriptor['projection']) if descriptor['projection'] else None
+        self.object_space = descriptor['object_space']
+        self.uv_scale = descriptor['uv_scale']
+        self.height = descriptor['height']
+        self.streamed_maps = [str(key) for key in descriptor['streamed_maps']]
+        logging.debug("Surface loaded from descriptor: " + str(ctx))
+        return True
+
+    def is_descriptor_current(self, descriptor, textures):
+        """Checks the descriptor against the nodes that tools like the triplanar and stream toggles replace or add
+        without saving it: the class of each texture and the triplanar and reorder nodes next to each map."""
+        classes = descriptor['classes']
+        for key, tx in textures.items():
+            if tx.get_class_name() != classes.get(key):
+                logging.debug("Surface descriptor is stale. Class changed: " + str(tx))
+                return False
+            if key not in SUFFIXES:
+                continue
+            for suffix, variant_key in ((TRIPLANAR_SUFFIX, key + '_triplanar'),
+                                        (SINGLE_CHANNEL_SUFFIX, key + '_reorder')):
+                if bool(self.ix.item_exists(str(tx) + suffix)) != (variant_key in textures):
+                    logging.debug("Surface descriptor is stale. Node changed: " + str(tx) + suffix)
+                    return False
+        triplanar = any(key.endswith('_triplanar') for key in textures)
+        if triplanar != (descriptor['projection'] == 'triplanar'):
+            logging.debug("Surface descriptor is stale. Projection changed.")
+            return False
+        return True
+
     def load(self, ctx):
-        """Loads and setups the material from an existing context."""
+        """Loads and setups the material from an existing context. The descriptor on the material is used if it's
+        still valid. Otherwise the context is crawled and a stale descriptor is written again. Surfaces without a
+        descriptor only get one when save_descriptor is called."""
         logging.debug("Loading surface...")
         self.ctx = ctx
         self.name = os.path.basename(str(ctx))
+        loaded = self.load_descriptor(ctx)
+        if loaded:
+            return self.mtl
         textures = {}
 
         ctx_members = get_items(ctx, ix=self.ix)
@@ -76,6 +263,7 @@ class Surface:
         triplanar = False
         for ctx_member in ctx_members:
             logging.debug("Checking ctx member" + str(ctx_member))
+            name = ctx_member.get_contextual_name()
             if (ctx_member.is_kindof("TextureMapFile") or ctx_member.is_kindof("TextureStreamedMapFile")) \
                     and ctx_member.is_local():
                 self.projection = PROJECTIONS[ctx_member.attrs.projection[0]]
@@ -85,25 +273,22 @@ class Surface:
                 if ctx_member.is_local() or not mtl:
                     mtl = ctx_member
                     logging.debug("Material found:" + str(mtl))
-            for key, suffix in list(SUFFIXES.items()):
-                if ctx_member.get_contextual_name().endswith(suffix):
+            for key, variant in SURFACE_SUFFIX_INDEX.classify(name):
+                if variant == 'triplanar':
+                    textures[key + '_triplanar'] = ctx_member
+                elif variant == 'reorder':
+                    textures[key + '_reorder'] = ctx_member
+                    self.streamed_maps.append(key)
+                    logging.debug("Reorder node for stream maps found:" + str(ctx_member))
+                else:
                     textures[key] = ctx_member
                     logging.debug("Texture found with index:" + str(key))
             if ctx_member.is_kindof("Displacement"):
                 self.height = ctx_member.attrs.front_value[0]
                 logging.debug("Displacement found:" + str(ctx_member))
-            if ctx_member.get_contextual_name().endswith(TRIPLANAR_SUFFIX):
+            if name.endswith(TRIPLANAR_SUFFIX):
                 triplanar = True
                 logging.debug("Triplanar tx found:" + str(ctx_member))
-                for key, suffix in list(SUFFIXES.items()):
-                    if ctx_member.get_contextual_name().endswith(suffix + TRIPLANAR_SUFFIX):
-                        textures[key + '_triplanar'] = ctx_member
-            if ctx_member.get_contextual_name().endswith(SINGLE_CHANNEL_SUFFIX):
-                for key, suffix in list(SUFFIXES.items()):
-                    if ctx_member.get_contextual_name().endswith(suffix + SINGLE_CHANNEL_SUFFIX):
-                        textures[key + '_reorder'] = ctx_member
-                        self.streamed_maps.append(key)
-                        logging.debug("Reorder node for stream maps found:" + str(ctx_member))
         if not mtl or not textures:
             self.ix.log_warning("No valid material found.")
             logging.debug("No material or textures found.")
@@ -113,6 +298,8 @@ class Surface:
         self.textures = textures
         logging.debug("Textures found:" + str(textures))
         self.mtl = mtl
+        if loaded is False:
+            self.save_descriptor()
         return mtl
 
     def update_projection(self, projection="triplanar", uv_scale=DEFAULT_UV_SCALE,
@@ -120,6 +307,13 @@ class Surface:
         """Updates the projections in each TextureMapFile."""
         print("PROJECTION SET TO: " + projection)
         logging.debug("Projection set to:" + projection)
+        # The consumers of all textures that get swapped are looked up once.
+        dependency_index = DependencyIndex(self.ix)
+        if self.projection != "triplanar" and projection == "triplanar":
+            dependency_index.index([tx for tx in self.textures.values() if
+                                    tx.is_kindof("TextureMapFile") or tx.is_kindof("TextureStreamedMapFile")])
+        elif projection != "triplanar":
+            dependency_index.index([tx for tx in self.textures.values() if tx.is_kindof("TextureTriplanar")])
         for key, tx in list(self.textures.items()):
             if (tx.is_kindof("TextureMapFile") or tx.is_kindof("TextureStreamedMapFile")) and tx.is_local():
                 if key == "preview":
@@ -154,11 +348,18 @@ class Surface:
                     self.ix.cmds.SetValues(attrs, values)
             if (tx.is_kindof("TextureMapFile") or tx.is_kindof("TextureStreamedMapFile")) and \
                     self.projection != "triplanar" and projection == "triplanar":
-                tx_to_triplanar(tx, blend=triplanar_blend, object_space=object_space, ix=self.ix)
+                self.textures[key + '_triplanar'] = tx_to_triplanar(tx, blend=triplanar_blend,
+                                                                    object_space=object_space,
+                                                                    dependency_index=dependency_index, ix=self.ix)
             if tx.is_kindof("TextureTriplanar") and projection != "triplanar":
                 input_tx = self.ix.get_item(str(tx) + ".right").get_texture()
-                replace_connections(input_tx, tx, ignored_attributes=['runtime_materials', ], ix=self.ix)
-                self.ix.cmds.DeleteItems([str(tx)])
+                replace_connections(input_tx, tx, ignored_attributes=['runtime_materials', ],
+                                    dependency_index=dependency_index, ix=self.ix)
+                # The name is kept since the item can't be used anymore once it's deleted.
+                tx_name = str(tx)
+                self.ix.cmds.DeleteItems([tx_name])
+                dependency_index.remove(tx_name)
+                del self.textures[key]
         self.projection = projection
         self.object_space = object_space
         self.uv_scale = uv_scale
@@ -190,10 +391,10 @@ class Surface:
                 self.ix.cmds.SetValue(str(self.mtl) + ".specular_1_fresnel_mode", [str(0)])
         if index == "emissive":
             self.ix.cmds.SetValue(str(self.mtl) + ".emission_weight", [str(1)])
-            self.ix.application.check_for_events()
+            pump_events(force=True, ix=self.ix)
         if index == 'translucency':
             self.ix.cmds.SetValue(str(self.mtl) + ".diffuse_back_strength", [str(1)])
-            self.ix.application.check_for_events()
+            pump_events(force=True, ix=self.ix)
         return True
 
     def create_sub_ctx(self, index):
@@ -232,91 +433,75 @@ class Surface:
                       "\n".join(
                           [index, filename, suffix, str(color_space), str(streamed), str(single_channel),
                            str(connection)]))
-        target_ctx = self.create_sub_ctx(index)
-        if streamed:
-            logging.debug("Setting up TextureStreamedMapFile...")
-            tx = self.ix.cmds.CreateObject(self.name + suffix, "TextureStreamedMapFile", "Global", str(target_ctx))
-            udim_file = re.sub(r"((?<!\d)\d{4}(?!\d))", "<UDIM>", os.path.split(filename)[-1], count=1)
-            filename = os.path.join(os.path.split(filename)[0], udim_file)
-            self.streamed_maps.append(index)
-            if single_channel:
-                logging.debug("Creating reorder node...")
-                reorder_tx = self.ix.cmds.CreateObject(self.name + suffix + SINGLE_CHANNEL_SUFFIX, "TextureReorder",
-                                                       "Global", str(target_ctx))
-                self.ix.cmds.SetValue(str(reorder_tx) + ".channel_order[0]", ["rrr1"])
-                self.ix.cmds.SetTexture([str(reorder_tx) + ".input"], str(tx))
-                self.textures[index + '_reorder'] = reorder_tx
-        else:
-            logging.debug("Setting up TextureMapFile...")
-            tx = self.ix.cmds.CreateObject(self.name + suffix, "TextureMapFile", "Global", str(target_ctx))
-            if index == 'preview':
-                logging.debug("Done creating preview tx: " + str(tx))
-                self.ix.cmds.SetValue(str(tx) + ".filename", [filename])
-                self.textures[index] = tx
-                return tx
-        if self.projection != 'uv':
-            attrs = self.ix.api.CoreStringArray(6)
-            attrs[0] = str(tx) + ".projection"
-            attrs[1] = str(tx) + ".axis"
-            attrs[2] = str(tx) + ".object_space"
-            attrs[3] = str(tx) + ".uv_scale[0]"
-            attrs[4] = str(tx) + ".uv_scale[1]"
-            attrs[5] = str(tx) + ".uv_scale[2]"
-            values = self.ix.api.CoreStringArray(6)
-            values[0] = str(
-                PROJECTIONS.index('cubic') if self.projection == "triplanar" else PROJECTIONS.index(self.projection))
-            values[1] = str(1)
-            values[2] = str(self.object_space)
-            values[3] = str(self.uv_scale[0])
-            values[4] = str((self.uv_scale[0] + self.uv_scale[1]) / 2)
-            values[5] = str(self.uv_scale[1])
-            self.ix.cmds.SetValues(attrs, values)
-        if self.projection == "triplanar":
-            logging.debug("Set up triplanar...")
-            triplanar_tx = self.ix.cmds.CreateObject(tx.get_contextual_name() + TRIPLANAR_SUFFIX, "TextureTriplanar",
-                                                     "Global", str(target_ctx))
-            self.ix.cmds.SetTexture([str(triplanar_tx) + ".right"], str(reorder_tx if reorder_tx else tx))
-            self.ix.cmds.SetTexture([str(triplanar_tx) + ".left"], str(reorder_tx if reorder_tx else tx))
-            self.ix.cmds.SetTexture([str(triplanar_tx) + ".top"], str(reorder_tx if reorder_tx else tx))
-            self.ix.cmds.SetTexture([str(triplanar_tx) + ".bottom"], str(reorder_tx if reorder_tx else tx))
-            self.ix.cmds.SetTexture([str(triplanar_tx) + ".front"], str(reorder_tx if reorder_tx else tx))
-            self.ix.cmds.SetTexture([str(triplanar_tx) + ".back"], str(reorder_tx if reorder_tx else tx))
-            self.ix.cmds.SetValue(str(triplanar_tx) + ".blend", [str(self.triplanar_blend)])
-            self.ix.cmds.SetValue(str(triplanar_tx) + ".object_space", [str(self.object_space)])
-            self.textures[index + '_triplanar'] = triplanar_tx
-        default_repeat_mode = 3 if streamed else 0
-        attrs = self.ix.api.CoreStringArray(5 if streamed else 6)
-        attrs[0] = str(tx) + ".color_space_auto_detect"
-        attrs[1] = str(tx) + ".filename"
-        attrs[2] = str(tx) + ".invert"
-        attrs[3] = str(tx) + ".u_repeat_mode"
-        attrs[4] = str(tx) + ".v_repeat_mode"
-        values = self.ix.api.CoreStringArray(5 if streamed else 6)
-        values[0] = '0'
-        values[1] = str(filename)
-        values[2] = str(1 if invert else 0)
-        values[3] = str((2 if not self.tile else default_repeat_mode))
-        values[4] = str((2 if not self.tile else default_repeat_mode))
-        if not streamed:
-            attrs[5] = str(tx) + ".single_channel_file_behavior"
-            values[5] = str((1 if single_channel else 0))
-        self.ix.cmds.SetValues(attrs, values)
-        self.ix.application.check_for_events()
-        extension = os.path.splitext(filename)[-1].strip('.')
-        if not color_space or single_channel:
-            self.ix.cmds.SetValue(str(tx) + ".use_raw_data", [str(1)])
-        else:
-            self.ix.cmds.SetValue(str(tx) + ".file_color_space", [str(color_space)])
-        self.textures[index] = tx
-        if connection:
+        with self.commands as commands:
+            target_ctx = self.create_sub_ctx(index)
+            if streamed:
+                logging.debug("Setting up TextureStreamedMapFile...")
+                tx = self.ix.cmds.CreateObject(self.name + suffix, "TextureStreamedMapFile", "Global", str(target_ctx))
+                filename = get_stream_filename(filename)
+                self.streamed_maps.append(index)
+                if single_channel:
+                    logging.debug("Creating reorder node...")
+                    reorder_tx = self.ix.cmds.CreateObject(self.name + suffix + SINGLE_CHANNEL_SUFFIX,
+                                                           "TextureReorder", "Global", str(target_ctx))
+                    commands.set_value(str(reorder_tx) + ".channel_order[0]", "rrr1")
+                    commands.set_texture(str(reorder_tx) + ".input", tx)
+                    self.textures[index + '_reorder'] = reorder_tx
+            else:
+                logging.debug("Setting up TextureMapFile...")
+                tx = self.ix.cmds.CreateObject(self.name + suffix, "TextureMapFile", "Global", str(target_ctx))
+                if index == 'preview':
+                    logging.debug("Done creating preview tx: " + str(tx))
+                    commands.set_value(str(tx) + ".filename", filename)
+                    self.textures[index] = tx
+                    return tx
+            if self.projection != 'uv':
+                commands.set_value(str(tx) + ".projection",
+                                   PROJECTIONS.index('cubic') if self.projection == "triplanar" else
+                                   PROJECTIONS.index(self.projection))
+                commands.set_value(str(tx) + ".axis", 1)
+                commands.set_value(str(tx) + ".object_space", self.object_space)
+                commands.set_values(str(tx) + ".uv_scale",
+                                    [self.uv_scale[0], (self.uv_scale[0] + self.uv_scale[1]) / 2, self.uv_scale[1]])
             if self.projection == "triplanar":
-                self.ix.cmds.SetTexture([str(self.mtl) + '.' + connection], str(triplanar_tx))
+                logging.debug("Set up triplanar...")
+                triplanar_tx = self.ix.cmds.CreateObject(tx.get_contextual_name() + TRIPLANAR_SUFFIX,
+                                                         "TextureTriplanar", "Global", str(target_ctx))
+                for side in ('right', 'left', 'top', 'bottom', 'front', 'back'):
+                    commands.set_texture(str(triplanar_tx) + "." + side, reorder_tx if reorder_tx else tx)
+                commands.set_value(str(triplanar_tx) + ".blend", self.triplanar_blend)
+                commands.set_value(str(triplanar_tx) + ".object_space", self.object_space)
+                self.textures[index + '_triplanar'] = triplanar_tx
+            default_repeat_mode = 3 if streamed else 0
+            commands.set_value(str(tx) + ".color_space_auto_detect", 0)
+            commands.set_value(str(tx) + ".filename", filename)
+            commands.set_value(str(tx) + ".invert", 1 if invert else 0)
+            commands.set_value(str(tx) + ".u_repeat_mode", 2 if not self.tile else default_repeat_mode)
+            commands.set_value(str(tx) + ".v_repeat_mode", 2 if not self.tile else default_repeat_mode)
+            if not streamed:
+                commands.set_value(str(tx) + ".single_channel_file_behavior",
+                                   self.get_single_channel_file_behavior(filename, single_channel))
+            pump_events(ix=self.ix)
+            if not color_space or single_channel:
+                commands.set_value(str(tx) + ".use_raw_data", 1)
             else:
-                self.ix.cmds.SetTexture([str(self.mtl) + '.' + connection], str(reorder_tx if reorder_tx else tx))
-        self.post_create_tx(index, tx)
+                commands.set_value(str(tx) + ".file_color_space", color_space)
+            self.textures[index] = tx
+            if connection:
+                if self.projection == "triplanar":
+                    commands.set_texture(str(self.mtl) + '.' + connection, triplanar_tx)
+                else:
+                    commands.set_texture(str(self.mtl) + '.' + connection, reorder_tx if reorder_tx else tx)
+            self.post_create_tx(index, tx)
         logging.debug("Done creating tx: " + str(tx))
         return tx
 
+    @staticmethod
+    def get_single_channel_file_behavior(filename, single_channel=False):
+        """Returns 1 to expand the red channel to grey for single channel maps and files that only hold one channel.
+        Streamed map files don't have the attribute and use a reorder node instead."""
+        return 1 if single_channel or is_single_channel(filename, read_function=get_image_info) else 0
+
     def post_create_tx(self, index, tx):
         """Creates certain files at the end of the create_tx function call."""
         logging.debug("Post create function called for: " + index)
@@ -351,28 +536,20 @@ class Surface:
                 disp_tx = self.get('displacement_reorder')
             else:
                 disp_tx = self.get('displacement')
-        disp_offset_tx = self.ix.cmds.CreateObject(self.name + DISPLACEMENT_OFFSET_SUFFIX, "TextureSubtract",
-                                                   "Global", str(self.get_sub_ctx('displacement')))
-        self.ix.cmds.SetTexture([str(disp_offset_tx) + ".input1"], str(disp_tx))
-        self.ix.cmds.SetValues([str(disp_offset_tx) + ".input2"], [str(self.displacement_offset)])
-        disp_height_scale_tx = self.ix.cmds.CreateObject(self.name + DISPLACEMENT_HEIGHT_SCALE_SUFFIX,
-                                                         "TextureMultiply", "Global",
-                                                         str(self.get_sub_ctx('displacement')))
-        self.ix.cmds.SetTexture([str(disp_height_scale_tx) + ".input1"], str(disp_offset_tx))
-        self.ix.cmds.SetValues([str(disp_height_scale_tx) + ".input2"],
-                               [str(self.height)])
-        disp = self.ix.cmds.CreateObject(self.name + DISPLACEMENT_MAP_SUFFIX, "Displacement",
-                                         "Global", str(self.ctx))
-        attrs = self.ix.api.CoreStringArray(3)
-        attrs[0] = str(disp) + ".bound[0]"
-        attrs[1] = str(disp) + ".bound[1]"
-        attrs[2] = str(disp) + ".bound[2]"
-        values = self.ix.api.CoreStringArray(3)
-        values[0] = str(self.height)
-        values[1] = str(self.height)
-        values[2] = str(self.height)
-        self.ix.cmds.SetValues(attrs, values)
-        self.ix.cmds.SetTexture([str(disp) + ".front_value"], str(disp_height_scale_tx))
+        with self.commands as commands:
+            disp_offset_tx = self.ix.cmds.CreateObject(self.name + DISPLACEMENT_OFFSET_SUFFIX, "TextureSubtract",
+                                                       "Global", str(self.get_sub_ctx('displacement')))
+            commands.set_texture(str(disp_offset_tx) + ".input1", disp_tx)
+            commands.set_value(str(disp_offset_tx) + ".input2", self.displacement_offset)
+            disp_height_scale_tx = self.ix.cmds.CreateObject(self.name + DISPLACEMENT_HEIGHT_SCALE_SUFFIX,
+                                                             "TextureMultiply", "Global",
+                                                             str(self.get_sub_ctx('displacement')))
+            commands.set_texture(str(disp_height_scale_tx) + ".input1", disp_offset_tx)
+            commands.set_value(str(disp_height_scale_tx) + ".input2", self.height)
+            disp = self.ix.cmds.CreateObject(self.name + DISPLACEMENT_MAP_SUFFIX, "Displacement",
+                                             "Global", str(self.ctx))
+            commands.set_values(str(disp) + ".bound", [self.height] * 3)
+            commands.set_texture(str(disp) + ".front_value", disp_height_scale_tx)
         self.textures['displacement_map'] = disp
         return disp
 
@@ -388,8 +565,9 @@ class Surface:
             normal_tx = self.get('normal')
         normal_map = self.ix.cmds.CreateObject(self.name + NORMAL_MAP_SUFFIX, "TextureNormalMap",
                                                "Global", str(self.get_sub_ctx('normal')))
-        self.ix.cmds.SetTexture([str(normal_map) + ".input"], str(normal_tx))
-        self.ix.cmds.SetTexture([str(self.mtl) + ".normal_input"], str(normal_map))
+        with self.commands as commands:
+            commands.set_texture(str(normal_map) + ".input", normal_tx)
+            commands.set_texture(str(self.mtl) + ".normal_input", normal_map)
         self.textures['normal_map'] = normal_map
         return normal_map
 
@@ -408,9 +586,10 @@ class Surface:
         logging.debug('Hooking ao to: ' + str(diffuse_tx))
         ao_blend_tx = self.ix.cmds.CreateObject(self.name + OCCLUSION_BLEND_SUFFIX, "TextureMultiply", "Global",
                                                 str(self.get_sub_ctx('diffuse')))
-        self.ix.cmds.SetTexture([str(ao_blend_tx) + ".input2"], str(diffuse_tx))
-        self.ix.cmds.SetTexture([str(ao_blend_tx) + ".input1"], str(ao_tx))
-        self.ix.cmds.SetTexture([str(self.mtl) + ".diffuse_front_color"], str(ao_blend_tx))
+        with self.commands as commands:
+            commands.set_texture(str(ao_blend_tx) + ".input2", diffuse_tx)
+            commands.set_texture(str(ao_blend_tx) + ".input1", ao_tx)
+            commands.set_texture(str(self.mtl) + ".diffuse_front_color", ao_blend_tx)
         self.textures["ao_blend"] = ao_blend_tx
         return ao_blend_tx
 
@@ -427,15 +606,16 @@ class Surface:
             return False
         diffuse_tx = self.get_out_tx('diffuse')
         logging.debug('Hooking cavity to: ' + str(diffuse_tx))
-        cavity_remap_tx = self.ix.cmds.CreateObject(self.name + CAVITY_REMAP_SUFFIX, "TextureRemap",
-                                                    "Global", str(self.get_sub_ctx('diffuse')))
-        self.ix.cmds.SetTexture([str(cavity_remap_tx) + ".input"], str(cavity_tx))
-        cavity_blend_tx = self.ix.cmds.CreateObject(self.name + CAVITY_BLEND_SUFFIX, "TextureMultiply", "Global",
-                                                    str(self.get_sub_ctx('diffuse')))
-        self.ix.cmds.SetTexture([str(cavity_blend_tx) + ".input2"], str(diffuse_tx))
-        self.ix.cmds.SetTexture([str(cavity_blend_tx) + ".input1"], str(cavity_remap_tx))
-        self.ix.cmds.SetTexture([str(self.mtl) + ".diffuse_front_color"], str(cavity_blend_tx))
-        self.ix.cmds.SetValues([str(cavity_remap_tx) + ".pass_through"], ["1"])
+        with self.commands as commands:
+            cavity_remap_tx = self.ix.cmds.CreateObject(self.name + CAVITY_REMAP_SUFFIX, "TextureRemap",
+                                                        "Global", str(self.get_sub_ctx('diffuse')))
+            commands.set_texture(str(cavity_remap_tx) + ".input", cavity_tx)
+            cavity_blend_tx = self.ix.cmds.CreateObject(self.name + CAVITY_BLEND_SUFFIX, "TextureMultiply", "Global",
+                                                        str(self.get_sub_ctx('diffuse')))
+            commands.set_texture(str(cavity_blend_tx) + ".input2", diffuse_tx)
+            commands.set_texture(str(cavity_blend_tx) + ".input1", cavity_remap_tx)
+            commands.set_texture(str(self.mtl) + ".diffuse_front_color", cavity_blend_tx)
+            commands.set_value(str(cavity_remap_tx) + ".pass_through", 1)
         self.textures["cavity_remap"] = cavity_remap_tx
         self.textures["cavity_blend"] = cavity_blend_tx
         return cavity_blend_tx
@@ -454,8 +634,9 @@ class Surface:
 
         bump_map = self.ix.cmds.CreateObject(self.name + BUMP_MAP_SUFFIX, "TextureBumpMap",
                                              "Global", str(self.get_sub_ctx('bump')))
-        self.ix.cmds.SetTexture([str(bump_map) + ".input"], str(bump_tx))
-        self.ix.cmds.SetTexture([str(self.mtl) + ".normal_input"], str(bump_map))
+        with self.commands as commands:
+            commands.set_texture(str(bump_map) + ".input", bump_tx)
+            commands.set_texture(str(self.mtl) + ".normal_input", bump_map)
         self.textures['bump_map'] = bump_map
         return bump_map
 
@@ -474,17 +655,16 @@ class Surface:
         logging.debug("Using following texture as input2 for divide: " + str(ior_tx))
         ior_divide_tx = self.ix.cmds.CreateObject(self.name + IOR_DIVIDE_SUFFIX, "TextureDivide",
                                                   "Global", str(self.get_sub_ctx('ior')))
-        ior_divide_tx.attrs.input1[0] = 1.0
-        ior_divide_tx.attrs.input1[1] = 1.0
-        ior_divide_tx.attrs.input1[2] = 1.0
-        self.ix.cmds.SetTexture([str(ior_divide_tx) + ".input2"], str(ior_tx))
-        self.ix.application.check_for_events()
-        self.textures['ior_divide'] = ior_divide_tx
-        if self.mtl.get_attribute('specular_1_index_of_refraction').is_editable():
-            self.ix.cmds.SetTexture([str(self.mtl) + ".specular_1_index_of_refraction"], str(ior_divide_tx))
-            self.ix.application.check_for_events()
-        else:
-            logging.debug("IOR was locked")
+        with self.commands as commands:
+            commands.set_values(str(ior_divide_tx) + ".input1", [1.0] * 3)
+            commands.set_texture(str(ior_divide_tx) + ".input2", ior_tx)
+            pump_events(ix=self.ix)
+            self.textures['ior_divide'] = ior_divide_tx
+            if self.mtl.get_attribute('specular_1_index_of_refraction').is_editable():
+                commands.set_texture(str(self.mtl) + ".specular_1_index_of_refraction", ior_divide_tx)
+                pump_events(ix=self.ix)
+            else:
+                logging.debug("IOR was locked")
         return ior_divide_tx
 
     def create_metallic_blend_tx(self):
@@ -501,20 +681,17 @@ class Surface:
 
         metallic_blend_tx = self.ix.cmds.CreateObject(self.name + METALLIC_BLEND_SUFFIX, "TextureBlend",
                                                       "Global", str(self.get_sub_ctx('ior')))
-        metallic_blend_tx.attrs.input2[0] = self.ior
-        metallic_blend_tx.attrs.input2[1] = self.ior
-        metallic_blend_tx.attrs.input2[2] = self.ior
-        metallic_blend_tx.attrs.input1[0] = self.metallic_ior
-        metallic_blend_tx.attrs.input1[1] = self.metallic_ior
-        metallic_blend_tx.attrs.input1[2] = self.metallic_ior
-        self.ix.cmds.SetTexture([str(metallic_blend_tx) + ".mix"], str(self.get('metallic')))
-        self.ix.application.check_for_events()
-        self.textures['metallic_blend'] = metallic_blend_tx
-        if self.mtl.get_attribute('specular_1_index_of_refraction').is_editable():
-            self.ix.cmds.SetTexture([str(self.mtl) + ".specular_1_index_of_refraction"], str(metallic_blend_tx))
-            self.ix.application.check_for_events()
-        else:
-            logging.debug("IOR was locked")
+        with self.commands as commands:
+            commands.set_values(str(metallic_blend_tx) + ".input2", [self.ior] * 3)
+            commands.set_values(str(metallic_blend_tx) + ".input1", [self.metallic_ior] * 3)
+            commands.set_texture(str(metallic_blend_tx) + ".mix", self.get('metallic'))
+            pump_events(ix=self.ix)
+            self.textures['metallic_blend'] = metallic_blend_tx
+            if self.mtl.get_attribute('specular_1_index_of_refraction').is_editable():
+                commands.set_texture(str(self.mtl) + ".specular_1_index_of_refraction", metallic_blend_tx)
+                pump_events(ix=self.ix)
+            else:
+                logging.debug("IOR was locked")
         return metallic_blend_tx
 
     def update_ior(self, ior, metallic_ior=DEFAULT_METALLIC_IOR):
@@ -524,7 +701,7 @@ class Surface:
         logging.debug("Updating IOR...")
         if self.mtl.get_attribute('specular_1_index_of_refraction').is_editable():
             self.ix.cmds.SetValue(str(self.mtl) + ".specular_1_index_of_refraction", [str(ior)])
-            self.ix.application.check_for_events()
+            pump_events(ix=self.ix)
             self.ior = ior
         else:
             logging.debug("IOR was locked")
@@ -562,14 +739,14 @@ class Surface:
         extension = os.path.splitext(filename)[-1].strip('.')
         if not streamed:
             attrs[2] = str(tx) + ".single_channel_file_behavior"
-            values[2] = str((1 if single_channel else 0))
+            values[2] = str(self.get_single_channel_file_behavior(filename, single_channel))
         self.ix.cmds.SetValues(attrs, values)
 
         if not color_space or single_channel:
             self.ix.cmds.SetValue(str(tx) + ".use_raw_data", [str(1)])
         else:
             self.ix.cmds.SetValue(str(tx) + ".use_raw_data", [str(0)])
-            self.ix.application.check_for_events()
+            pump_events(force=True, ix=self.ix)
             self.ix.cmds.SetValues([str(color_space)], [str(tx) + ".file_color_space"])
 
         if connection:
@@ -240,10 +240,7 @@ def terrain_gui(heightmap=''):
                          event_rewire.run)
 
     # Send all info to clarisse to generate window
-    window.show()
-    while window.is_shown():
-        ix.application.check_for_events()
-    window.destroy()
+    run_modal(window, ix=ix)
 
 
 terrain_gui()
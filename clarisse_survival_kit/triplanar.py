@@ -1,4 +1,4 @@
-from clarisse_survival_kit.utility import check_selection, tx_to_triplanar
+from clarisse_survival_kit.utility import check_selection, tx_to_triplanar, DependencyIndex, run_modal
 
 
 def textures_to_triplanar_gui():
@@ -27,10 +27,11 @@ def textures_to_triplanar_gui():
                     ix.log_warning("One or more selected items are not texture objects.")
             ix.begin_command_batch("Textures to Triplanar")
             triplanar_textures = []
+            dependency_index = DependencyIndex(ix, textures)
             for tx in textures:
                 triplanar_textures.append(tx_to_triplanar(tx, blend=ratio_field.get_value(),
                                                           object_space=result.get('object_space'),
-                                                          ix=ix))
+                                                          dependency_index=dependency_index, ix=ix))
             if triplanar_textures:
                 ix.selection.deselect_all()
                 for tx in triplanar_textures:
@@ -81,9 +82,7 @@ def textures_to_triplanar_gui():
                          event_rewire.os_world_refresh)
 
     # Send all info to clarisse to generate window
-    window.show()
-    while window.is_shown():    ix.application.check_for_events()
-    window.destroy()
+    run_modal(window, ix=ix)
 
 
 textures_to_triplanar_gui()
@@ -2,13 +2,19 @@ import os
 import re
 import logging
 import random
-import subprocess
-import platform
 import glob
 import bisect
+import itertools
+import collections
 import datetime
+import time
+import json
 
 from clarisse_survival_kit.settings import *
+from clarisse_survival_kit.scan_index import walk_directory, get_image_info
+from clarisse_survival_kit.image_info import get_resolution_name, is_valid_image
+from clarisse_survival_kit.obj_info import read_obj_info, get_shading_group_names
+from clarisse_survival_kit.profiling import profile_phase
 
 
 def add_gradient_key(attr, position, color, **kwargs):
@@ -59,65 +65,262 @@ def get_ix(ix_local):
         return ix
 
 
+_event_clock = getattr(time, 'monotonic', time.time)
+_last_event_pump = [0.0]
+
+
+def pump_events(force=False, **kwargs):
+    """Processes pending application events.
+    Calls that only keep the interface responsive are skipped if the last pump was less than EVENT_PUMP_INTERVAL
+    seconds ago. Use force when the following code depends on the events being processed."""
+    ix = get_ix(kwargs.get("ix"))
+    if not force and _event_clock() - _last_event_pump[0] < EVENT_PUMP_INTERVAL:
+        return False
+    with profile_phase('events'):
+        ix.application.check_for_events()
+    _last_event_pump[0] = _event_clock()
+    return True
+
+
+def run_modal(window, work=None, **kwargs):
+    """Shows the window and processes events until it's closed, then destroys it.
+    Sleeps between event checks while nothing happens, up to MODAL_LOOP_MAX_SLEEP, instead of spinning a core.
+    The optional work callable is called before every event check and returns whether it has work left. The loop
+    doesn't sleep while it does and keeps going after the window was closed until the work is done."""
+    ix = get_ix(kwargs.get("ix"))
+    delay = 0.0
+    window.show()
+    try:
+        while True:
+            busy = bool(work and work())
+            if not busy and not window.is_shown():
+                break
+            start = _event_clock()
+            ix.application.check_for_events()
+            if busy or _event_clock() - start > MODAL_LOOP_ACTIVITY_TIME:
+                delay = 0.0
+            else:
+                time.sleep(delay)
+                delay = min(delay * 2 or 0.001, MODAL_LOOP_MAX_SLEEP)
+    finally:
+        window.destroy()
+
+
+class CommandBuffer:
+    """Collects attribute writes and texture connections and flushes them as one SetValues call and one SetTexture
+    call per connected texture. Writes to the same attribute are coalesced so only the last one is sent.
+    Can be used as a (nested) context manager, in which case it flushes when the outermost block exits."""
+
+    def __init__(self, ix):
+        self.ix = ix
+        self.values = collections.OrderedDict()
+        self.textures = collections.OrderedDict()
+        self.depth = 0
+
+    def __enter__(self):
+        self.depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.depth -= 1
+        if self.depth == 0:
+            self.flush()
+        return False
+
+    def set_value(self, attr, value):
+        """Sets a single attribute value like `texture.uv_scale[0]`."""
+        if isinstance(value, bool):
+            value = int(value)
+        self.values.pop(str(attr), None)
+        self.values[str(attr)] = str(value)
+
+    def set_values(self, attr, values):
+        """Sets each component of an attribute like `texture.color` to the given values."""
+        for i, value in enumerate(values):
+            self.set_value(str(attr) + "[%d]" % i, value)
+
+    def set_texture(self, attr, texture):
+        """Connects the texture to the attribute. Replaces a pending connection of the same attribute."""
+        self.textures.pop(str(attr), None)
+        self.textures[str(attr)] = str(texture)
+
+    def flush(self):
+        """Sends all pending writes to Clarisse. Values go first since connections may depend on them."""
+        if self.values:
+            logging.debug("Flushing %d attribute values..." % len(self.values))
+            attrs = self.ix.api.CoreStringArray(len(self.values))
+            values = self.ix.api.CoreStringArray(len(self.values))
+            for i, (attr, value) in enumerate(self.values.items()):
+                attrs[i] = attr
+                values[i] = value
+            self.values.clear()
+            self.ix.cmds.SetValues(attrs, values)
+        if self.textures:
+            logging.debug("Flushing %d texture connections..." % len(self.textures))
+            connections = collections.OrderedDict()
+            for attr, texture in self.textures.items():
+                connections.setdefault(texture, []).append(attr)
+            self.textures.clear()
+            for texture, attrs in connections.items():
+                self.ix.cmds.SetTexture(attrs, texture)
+
+
+class FilenameClassifier:
+    """Classifies texture filenames against a match template in a single pass.
+
+    All template patterns are folded into one compiled expression of optional lookaheads so every key that matches
+    is reported by one match call. Extension priorities are looked up in a precomputed rank table.
+    """
+    # Numbered backreferences and conditionals, which would point at another pattern's group once combined.
+    backreference_regex = re.compile(r'(?<!\\)(?:\\\\)*(?:\\[1-9]|\\g<\d|\(\?\(\d)')
+
+    def __init__(self, filename_match_template, lod_match_template, image_formats):
+        self.keys = list(filename_match_template.keys())
+        self.lod_regex = re.compile(lod_match_template, re.IGNORECASE)
+        self.extension_ranks = {}
+        for rank, image_format in enumerate(image_formats):
+            self.extension_ranks.setdefault(image_format, rank)
+        self.regex = None
+        # (key, group index in the combined expression, separately compiled pattern) in template order.
+        self.matchers = []
+        combined = [key for key in self.keys if not self.backreference_regex.search(filename_match_template[key])]
+        try:
+            self.regex = re.compile(''.join(['(?:(?=.*?(?P<k%i>%s)))?' % (i, filename_match_template[key])
+                                             for i, key in enumerate(combined)]), re.IGNORECASE)
+        except re.error:
+            # Patterns with inline flags or clashing group names can't be combined. Fall back to compiling each.
+            logging.debug("Could not combine filename match template. Compiling patterns separately.")
+            combined = []
+        for key in self.keys:
+            if key in combined:
+                # Each template pattern may contain groups of its own so only the named group per key is checked.
+                self.matchers.append((key, self.regex.groupindex['k%i' % combined.index(key)] - 1, None))
+            else:
+                self.matchers.append((key, None, re.compile(filename_match_template[key], re.IGNORECASE)))
+        if not combined:
+            self.regex = None
+
+    def classify(self, filename):
+        """Returns all template keys that match the filename in template order."""
+        groups = self.regex.match(filename).groups() if self.regex else ()
+        return [key for key, group_index, regex in self.matchers
+                if (regex.search(filename) if regex else groups[group_index] is not None)]
+
+    def get_lod_level(self, filename):
+        """Returns None if the filename has no LOD, otherwise the LOD level or -1 if the level is unspecified."""
+        lod_match = self.lod_regex.search(filename)
+        if not lod_match:
+            return None
+        if lod_match.groupdict().get('lod'):
+            return int(lod_match.group('lod'))
+        return -1
+
+    def get_extension_rank(self, extension):
+        """Returns the priority of the extension. Lower is preferred."""
+        return self.extension_ranks.get(extension, len(self.extension_ranks))
+
+
+_filename_classifiers = {}
+
+
+def get_filename_classifier(filename_match_template=FILENAME_MATCH_TEMPLATE, lod_match_template=LOD_MATCH_TEMPLATE,
+                            image_formats=IMAGE_FORMATS):
+    """Returns a cached FilenameClassifier for the given templates."""
+    cache_key = (tuple(filename_match_template.items()), lod_match_template, tuple(image_formats))
+    classifier = _filename_classifiers.get(cache_key)
+    if classifier is None:
+        classifier = FilenameClassifier(filename_match_template, lod_match_template, image_formats)
+        _filename_classifiers[cache_key] = classifier
+    return classifier
+
+
+def scan_asset_directory(directory, image_formats=IMAGE_FORMATS, geometry_formats=GEOMETRY_FORMATS,
+                         max_depth=SCAN_MAX_DEPTH, exclude=SCAN_EXCLUDE_DIRS):
+    """Walks the directory once and returns the image files and geometry files as two lists of paths."""
+    image_files = []
+    geometry_files = []
+    for root, dirs, files in walk_directory(directory, max_depth=max_depth, exclude=exclude):
+        for f in files:
+            extension = os.path.splitext(f)[-1].lower().lstrip('.')
+            if extension in image_formats:
+                image_files.append(os.path.join(root, f))
+            elif extension in geometry_formats:
+                geometry_files.append(os.path.join(root, f))
+    return image_files, geometry_files
+
+
+def get_assets_from_directory(directory, max_depth=SCAN_MAX_DEPTH, exclude=SCAN_EXCLUDE_DIRS, **kwargs):
+    """Returns the textures and geometry files of the specified directory from a single traversal."""
+    image_formats = kwargs.get('image_formats', IMAGE_FORMATS)
+    image_files, geometry_files = scan_asset_directory(directory, image_formats=image_formats,
+                                                       max_depth=max_depth, exclude=exclude)
+    textures = get_textures_from_directory(directory, image_files=image_files, **kwargs)
+    meshes = get_geometry_from_directory(directory, geometry_files=geometry_files)
+    return textures, meshes
+
+
 def get_textures_from_directory(directory, filename_match_template=FILENAME_MATCH_TEMPLATE,
                                 lod_match_template=LOD_MATCH_TEMPLATE, image_formats=IMAGE_FORMATS,
-                                resolution=None, lod=None, lod_keys=('normal',)):
-    """Returns texture files which exist in the specified directory."""
+                                resolution=None, lod=None, lod_keys=('normal',), max_depth=SCAN_MAX_DEPTH,
+                                exclude=SCAN_EXCLUDE_DIRS, image_files=None):
+    """Returns texture files which exist in the specified directory.
+    Already scanned image files can be passed with image_files to skip walking the directory."""
     logging.debug("Searching for textures inside: " + str(directory))
     logging.debug('Resolution: ' + str(resolution))
     logging.debug('LOD: ' + str(lod))
+    classifier = get_filename_classifier(filename_match_template, lod_match_template, image_formats)
     textures = {}
+    texture_ranks = {}
     lod_files = {}
     for lod_key in lod_keys:
         lod_files[lod_key] = {}
-    for root, dirs, files in os.walk(directory):
-        for f in files:
-            filename, extension = os.path.splitext(f)
-            extension = extension.lower().lstrip('.')
+    if image_files is None:
+        image_files = scan_asset_directory(directory, image_formats=image_formats, geometry_formats=(),
+                                           max_depth=max_depth, exclude=exclude)[0]
+    for image_file in image_files:
+        filename, extension = os.path.splitext(os.path.basename(image_file))
+        extension = extension.lower().lstrip('.')
+        if extension not in classifier.extension_ranks:
+            continue
+        logging.debug("Found image: " + str(image_file))
+        keys = classifier.classify(filename)
+        if not keys:
+            continue
+        if resolution and resolution not in filename and not 'preview' in filename.lower():
+            # Files without a resolution in their name are checked by their image size instead.
+            if [name for name in IMAGE_RESOLUTIONS if name in filename] or \
+                    get_resolution_name(get_image_info(image_file)) != resolution:
+                logging.debug("Found texture but without specified resolution: " + str(filename))
+                continue
+        path = os.path.normpath(image_file)
+        rank = classifier.get_extension_rank(extension)
+        lod_level = classifier.get_lod_level(filename)
+        if lod_level is not None:
+            logging.debug('Texture has LOD level: ' + str(lod_level))
+        for key in keys:
+            logging.debug("Image matches with: " + str(key))
             lod_check = True
-            if extension in image_formats:
-                logging.debug("Found image: " + str(f))
-                path = os.path.normpath(os.path.join(root, f))
-                for key, pattern in list(filename_match_template.items()):
-                    match = re.search(pattern, filename, re.IGNORECASE)
-                    if match:
-                        logging.debug("Image matches with: " + str(key))
-                        if resolution and resolution not in filename and not 'preview' in filename.lower():
-                            logging.debug("Found texture but without specified resolution: " + str(filename))
-                            continue
-                        lod_match = re.search(lod_match_template, filename, re.IGNORECASE)
-                        if lod_match:
-                            if lod_match.group('lod'):
-                                lod_level = int(lod_match.group('lod'))
-                            else:
-                                lod_level = -1
-                            logging.debug('Texture has LOD level: ' + str(lod_level))
-                        if key in lod_keys:
-                            logging.debug("LOD texture found: " + str(filename))
-                            if lod is not None:
-                                logging.debug("Checking if LOD {} matches with filename".format(str(lod)))
-                                if lod == -1:
-                                    if lod_match:
-                                        lod_check = False
-                                else:
-                                    if lod_match and lod_level != lod:
-                                        logging.debug("Texture did not match with LOD level {}".format(str(lod)))
-                                        lod_check = False
-                                logging.debug("Texture is a LOD normal: " + str(filename))
-                        # Check if another file extension exists.
-                        # If so use the first that occurs in the image_formats list.
-                        if key in textures:
-                            previous_extension = os.path.splitext(textures[key])[-1].lstrip('.')
-                            if image_formats.index(previous_extension) > image_formats.index(extension):
-                                if lod_check:
-                                    textures[key] = path
-                                else:
-                                    lod_files[key][lod_level] = path
-                        else:
-                            if lod_check:
-                                textures[key] = path
-                            else:
-                                lod_files[key][lod_level] = path
+            if key in lod_keys:
+                logging.debug("LOD texture found: " + str(filename))
+                if lod is not None:
+                    logging.debug("Checking if LOD {} matches with filename".format(str(lod)))
+                    if lod == -1:
+                        if lod_level is not None:
+                            lod_check = False
+                    else:
+                        if lod_level is not None and lod_level != lod:
+                            logging.debug("Texture did not match with LOD level {}".format(str(lod)))
+                            lod_check = False
+                    logging.debug("Texture is a LOD normal: " + str(filename))
+            # Check if another file extension exists.
+            # If so use the first that occurs in the image_formats list.
+            if key in textures and texture_ranks[key] <= rank:
+                continue
+            if lod_check:
+                textures[key] = path
+                texture_ranks[key] = rank
+            else:
+                lod_files[key][lod_level] = path
     logging.debug(str(lod_files))
     for lod_key in lod_keys:
         if textures.get(lod_key):
@@ -143,17 +346,16 @@ def get_textures_from_directory(directory, filename_match_template=FILENAME_MATC
     return textures
 
 
-def get_geometry_from_directory(directory):
-    """Returns texture files which exist in the specified directory."""
+def get_geometry_from_directory(directory, max_depth=SCAN_MAX_DEPTH, exclude=SCAN_EXCLUDE_DIRS, geometry_files=None):
+    """Returns geometry files which exist in the specified directory.
+    Already scanned geometry files can be passed with geometry_files to skip walking the directory."""
     logging.debug("Searching for meshes inside: " + str(directory))
+    if geometry_files is None:
+        geometry_files = scan_asset_directory(directory, image_formats=(), max_depth=max_depth, exclude=exclude)[1]
     meshes = []
-    for root, dirs, files in os.walk(directory):
-        for filename in files:
-            if filename.lower().endswith(('.obj', '.abc', '.lwo')):
-                logging.debug("Found mesh file: " + str(filename))
-                path = os.path.join(root, filename)
-                path = os.path.normpath(path)
-                meshes.append(path)
+    for geometry_file in geometry_files:
+        logging.debug("Found mesh file: " + str(geometry_file))
+        meshes.append(os.path.normpath(geometry_file))
     if meshes:
         logging.debug("Meshes found in directory: " + directory)
         logging.debug(str(meshes))
@@ -321,56 +523,99 @@ def get_aces_installed(**kwargs):
     return installed
 
 
-def get_sub_contexts(ctx, name="", max_depth=0, current_depth=0, **kwargs):
-    """Gets all subcontexts."""
-    ix = get_ix(kwargs.get("ix"))
-    current_depth += 1
-    results = []
-    for i in range(ctx.get_context_count()):
-        sub_context = ctx.get_context(i)
-        results.append(sub_context)
+def iter_sub_contexts(ctx, max_depth=0, current_depth=0):
+    """Yields the subcontexts depth first. Contexts that can be reached more than once are only yielded once."""
+    visited = set()
+    stack = [(ctx.get_context(i), current_depth + 1) for i in reversed(range(ctx.get_context_count()))]
+    while stack:
+        sub_ctx, depth = stack.pop()
+        full_name = str(sub_ctx)
+        if full_name in visited:
+            continue
+        visited.add(full_name)
+        yield sub_ctx
         # 0 is infinite
-        if current_depth < max_depth or max_depth == 0:
-            for result in get_sub_contexts(sub_context, name, max_depth, current_depth, ix=ix):
-                if result not in results:
-                    results.append(result)
+        if depth < max_depth or max_depth == 0:
+            stack.extend((sub_ctx.get_context(i), depth + 1) for i in reversed(range(sub_ctx.get_context_count())))
+
+
+def get_sub_contexts(ctx, name="", max_depth=0, current_depth=0, **kwargs):
+    """Gets all subcontexts. With a name the first subcontext with that name is returned."""
+    sub_ctxs = iter_sub_contexts(ctx, max_depth=max_depth, current_depth=current_depth)
     if name:
-        for sub_ctx in results:
+        for sub_ctx in sub_ctxs:
             if os.path.basename(str(sub_ctx)) == name:
                 return sub_ctx
         return []
-    return results
+    return list(sub_ctxs)
 
 
-def get_items(ctx, kind=(), max_depth=0, return_first_hit=False, **kwargs):
-    """Gets all items recursively."""
+def iter_items(ctx, kind=(), max_depth=0, **kwargs):
+    """
+    Yields the objects of the context and its subcontexts that are of one of the kinds.
+    """
     ix = get_ix(kwargs.get("ix"))
-    result = []
-    current_depth = 1
-    items = ix.api.OfItemVector()
     sub_ctxs = [ctx]
     if max_depth > 1 or max_depth == 0:
-        sub_ctxs.extend(get_sub_contexts(ctx, max_depth=max_depth, current_depth=current_depth, ix=ix))
+        sub_ctxs = itertools.chain(sub_ctxs, iter_sub_contexts(ctx, max_depth=max_depth, current_depth=1))
+    # Whether a class matches the kinds is only checked once per class.
+    class_matches = {}
+    flags = ix.api.CoreBitFieldHelper()
     for sub_ctx in sub_ctxs:
-        if sub_ctx.get_object_count():
-            objects_array = ix.api.OfObjectArray(sub_ctx.get_object_count())
-            flags = ix.api.CoreBitFieldHelper()
-            sub_ctx.get_all_objects(objects_array, flags, False)
-            for i_obj in range(sub_ctx.get_object_count()):
-                if kind:
-                    for k in kind:
-                        if objects_array[i_obj].is_kindof(k):
-                            if return_first_hit:
-                                return objects_array[i_obj]
-                            items.add(objects_array[i_obj])
-                else:
-                    items.add(objects_array[i_obj])
-    for item in items:
-        result.append(item)
-    return result
+        object_count = sub_ctx.get_object_count()
+        if not object_count:
+            continue
+        objects_array = ix.api.OfObjectArray(object_count)
+        sub_ctx.get_all_objects(objects_array, flags, False)
+        for i_obj in range(object_count):
+            obj = objects_array[i_obj]
+            if kind:
+                class_name = obj.get_class_name()
+                if class_name not in class_matches:
+                    class_matches[class_name] = any(obj.is_kindof(k) for k in kind)
+                if not class_matches[class_name]:
+                    continue
+            yield obj
 
 
-def tx_to_triplanar(tx, blend=0.5, object_space=0, **kwargs):
+def get_items(ctx, kind=(), max_depth=0, return_first_hit=False, **kwargs):
+    """Gets all items recursively."""
+    items = iter_items(ctx, kind=kind, max_depth=max_depth, **kwargs)
+    if return_first_hit:
+        return next(items, [])
+    return list(items)
+
+
+def assign_shading_groups(geometry, filename=None, material=None, clip_map=None, displacement=None, commands=None,
+                          **kwargs):
+    """Assigns the material, clip map and displacement to all shading groups of the geometry.
+    For OBJ files the shading groups are read from the file and assigned through attribute writes, so Clarisse
+    doesn't have to load the geometry during import. Other geometry is assigned through its module."""
+    ix = get_ix(kwargs.get("ix"))
+    obj_info = None
+    if filename and os.path.splitext(filename)[-1].lower() == '.obj':
+        obj_info = read_obj_info(filename)
+    if obj_info is None:
+        geo = geometry.get_module()
+        for i in range(geo.get_shading_group_count()):
+            if material:
+                geo.assign_material(material.get_module(), i)
+            if clip_map:
+                geo.assign_clip_map(clip_map.get_module(), i)
+            if displacement:
+                geo.assign_displacement(displacement.get_module(), i)
+        return
+    shading_group_count = len(get_shading_group_names(obj_info))
+    logging.debug("Assigning %i shading groups of: %s" % (shading_group_count, filename))
+    if commands is None:
+        commands = CommandBuffer(ix)
+    with commands:
+        for attr, item in (('materials', material), ('clip_maps', clip_map), ('displacements', displacement)):
+            if item:
+                commands.set_values(str(geometry) + '.' + attr, [str(item)] * shading_group_count)
+
+
+def tx_to_triplanar(tx, blend=0.5, object_space=0, dependency_index=None, **kwargs):
     """Converts the texture to triplanar."""
     logging.debug("Converting texture to triplanar: " + str(tx))
     ix = get_ix(kwargs.get("ix"))
@@ -378,28 +623,29 @@ def tx_to_triplanar(tx, blend=0.5, object_space=0, **kwargs):
     triplanar_tx = ix.cmds.CreateObject(tx.get_contextual_name() + TRIPLANAR_SUFFIX,
                                         "TextureTriplanar", "Global", str(ctx))
 
-    replace_connections(triplanar_tx, tx, ignored_attributes=['runtime_materials', ], ix=ix)
+    replace_connections(triplanar_tx, tx, ignored_attributes=['runtime_materials', ],
+                        dependency_index=dependency_index, ix=ix)
 
-    ix.cmds.SetTexture([str(triplanar_tx) + ".right"], str(tx))
-    ix.cmds.SetTexture([str(triplanar_tx) + ".left"], str(tx))
-    ix.cmds.SetTexture([str(triplanar_tx) + ".top"], str(tx))
-    ix.cmds.SetTexture([str(triplanar_tx) + ".bottom"], str(tx))
-    ix.cmds.SetTexture([str(triplanar_tx) + ".front"], str(tx))
-    ix.cmds.SetTexture([str(triplanar_tx) + ".back"], str(tx))
+    for side in ['right', 'left', 'top', 'bottom', 'front', 'back']:
+        ix.cmds.SetTexture([str(triplanar_tx) + "." + side], str(tx))
+        if dependency_index:
+            dependency_index.add(str(triplanar_tx) + "." + side, tx)
     ix.cmds.SetValues([str(triplanar_tx) + '.blend', str(triplanar_tx) + '.object_space'],
                       [str(blend), str(object_space)])
     return triplanar_tx
 
 
-def blur_tx(tx, radius=0.01, quality=DEFAULT_BLUR_QUALITY, **kwargs):
+def blur_tx(tx, radius=0.01, quality=DEFAULT_BLUR_QUALITY, dependency_index=None, **kwargs):
     """Blurs the texture."""
     logging.debug("Blurring selected texture: " + str(tx))
     ix = get_ix(kwargs.get("ix"))
     ctx = tx.get_context()
     blur = ix.cmds.CreateObject(tx.get_contextual_name() + BLUR_SUFFIX, "TextureBlur", "Global", str(ctx))
 
-    replace_connections(blur, tx, ignored_attributes=['runtime_materials', ], ix=ix)
+    replace_connections(blur, tx, ignored_attributes=['runtime_materials', ], dependency_index=dependency_index, ix=ix)
     ix.cmds.SetTexture([str(blur) + ".color"], str(tx))
+    if dependency_index:
+        dependency_index.add(str(blur) + ".color", tx)
     blur.attrs.radius = radius
     blur.attrs.quality = quality
     return blur
@@ -420,7 +666,7 @@ def quick_blend(items, **kwargs):
         blend_tx = ix.cmds.CreateObject(item_a.get_contextual_name() + MULTI_BLEND_SUFFIX, "TextureMultiBlend",
                                         "Global", str(ctx))
         ix.cmds.SetValue(str(blend_tx) + ".enable_layer_1", [str(1)])
-        ix.application.check_for_events()
+        pump_events(force=True, ix=ix)
         normal_tx_value = ix.get_item(str(item_a) + ".input")
         if normal_tx_value:
             normal_tx = normal_tx_value.get_texture()
@@ -430,7 +676,7 @@ def quick_blend(items, **kwargs):
             item_index = items.index(item) + 1
             ix.cmds.SetValue(str(blend_tx) + ".enable_layer_{}".format(str(item_index)), [str(1)])
             ix.cmds.SetValue(str(blend_tx) + ".layer_{}_mode".format(str(item_index)), [str(10)])
-            ix.application.check_for_events()
+            pump_events(force=True, ix=ix)
             item_normal_tx_value = ix.get_item(str(item) + ".input")
             if item_normal_tx_value:
                 item_normal_tx = item_normal_tx_value.get_texture()
@@ -456,12 +702,12 @@ def quick_blend(items, **kwargs):
             ix.cmds.SetTexture([str(blend_tx) + ".input2"], str(item_b))
         else:
             ix.cmds.SetValue(str(blend_tx) + ".enable_layer_1", [str(1)])
-            ix.application.check_for_events()
+            pump_events(force=True, ix=ix)
             ix.cmds.SetTexture([str(blend_tx) + ".layer_1_color"], str(item_a))
             for item in items[1:]:
                 item_index = items.index(item) + 1
                 ix.cmds.SetValue(str(blend_tx) + ".enable_layer_{}".format(str(item_index)), [str(1)])
-                ix.application.check_for_events()
+                pump_events(force=True, ix=ix)
                 ix.cmds.SetTexture([str(blend_tx) + ".layer_{}_color".format(str(item_index))], str(item))
         return blend_tx
     elif check_selection(items, ['MaterialPhysical'], min_num=2):
@@ -485,7 +731,7 @@ def quick_blend(items, **kwargs):
             for item in items:
                 item_index = items.index(item) + 1
                 ix.cmds.SetValue(str(blend_mtl) + ".enable_layer_{}".format(str(item_index)), [str(1)])
-                ix.application.check_for_events()
+                pump_events(force=True, ix=ix)
                 ix.cmds.SetValues([str(blend_mtl) + ".layer_{}".format(str(item_index))], [str(item)])
 
         return blend_mtl
@@ -529,12 +775,12 @@ def quick_blend(items, **kwargs):
             ix.cmds.SetTexture([str(blend_tx) + ".input2"], str(item_disp_offset_txs[1]))
         else:
             ix.cmds.SetValue(str(blend_tx) + ".enable_layer_1", [str(1)])
-            ix.application.check_for_events()
+            pump_events(force=True, ix=ix)
             ix.cmds.SetTexture([str(blend_tx) + ".layer_1_color"], str(item_disp_offset_txs[0]))
             for item in items[1:]:
                 item_index = items.index(item) + 1
                 ix.cmds.SetValue(str(blend_tx) + ".enable_layer_{}".format(str(item_index)), [str(1)])
-                ix.application.check_for_events()
+                pump_events(force=True, ix=ix)
                 ix.cmds.SetTexture([str(blend_tx) + ".layer_{}_color".format(str(item_index))],
                                    str(item_disp_offset_txs[items.index(item)]))
 
@@ -601,54 +847,179 @@ def get_attrs_connected_to_item(item, **kwargs):
     return connected_attrs
 
 
-def replace_connections(new_item, old_item, source_item=None, ignored_attributes=(), ignored_classes=(), **kwargs):
-    """Swap existing material/texture connections with another."""
+class DependencyIndex:
+    """Maps items to the exact attributes and shading layer rule cells that consume them.
+    Consumers are looked up with a single get_items_outputs call per batch of items and each consumer is only scanned
+    once, so build one index per batch operation and pass it to every replace_connections call of that operation.
+    Connections that are made, swapped, renamed or deleted during the batch need to be reported to keep it current.
+    Attribute connections are paths like `texture.input` or `geometry.materials[0]`, rule cells are tuples of the
+    shading layer, the row and the column."""
+
+    RULE_COLUMNS = ("material", "clip_map", "displacement")
+
+    def __init__(self, ix, items=()):
+        self.ix = ix
+        self.connections = {}
+        self.references = {}
+        self.consumers = {}
+        self.indexed = set()
+        self.scanned = set()
+        if items:
+            self.index(items)
+
+    def index(self, items):
+        """Looks up the consumers of the items that aren't indexed yet."""
+        items = [item for item in items if item and str(item) not in self.indexed]
+        if not items:
+            return
+        item_array = self.ix.api.OfItemArray(len(items))
+        for i, item in enumerate(items):
+            item_array[i] = item
+            self.indexed.add(str(item))
+        output_items = self.ix.api.OfItemVector()
+        self.ix.application.get_factory().get_items_outputs(item_array, output_items, False)
+        logging.debug('Indexing {} consumers of {} items'.format(output_items.get_count(), len(items)))
+        for i_output in range(0, output_items.get_count()):
+            out_item = output_items[i_output]
+            if out_item.is_object() and str(out_item) not in self.scanned:
+                self.scan(out_item.to_object())
+
+    def scan(self, obj):
+        """Records every item the object references through its attributes or shading layer rules."""
+        self.scanned.add(str(obj))
+        # You mustn't fetch shading layer inputs directly via attributes. You need to use get_rule_value
+        if obj.is_kindof('ShadingLayer'):
+            sl_module = obj.get_module()
+            for row in range(0, sl_module.get_rules().get_count()):
+                for column in self.RULE_COLUMNS:
+                    value = str(sl_module.get_rule_value(row, column))
+                    if value:
+                        self.add((str(obj), row, column), value, 'rule')
+            return
+        for i_attr in range(0, obj.get_attribute_count()):
+            attr = obj.get_attribute(i_attr)
+            attr_type = attr.get_type()
+            # Object references
+            if attr_type in [5, 6]:
+                if attr.get_container() in [1, 2]:
+                    objects = self.ix.api.OfObjectVector()
+                    attr.get_values(objects)
+                    for i_obj in range(0, objects.get_count()):
+                        self.add(str(attr) + '[{}]'.format(str(i_obj)), objects[i_obj], 'value')
+                elif attr.get_object():
+                    self.add(str(attr), attr.get_object(), 'value')
+            # String references
+            elif attr_type in [3, 4]:
+                if attr.get_string():
+                    self.add(str(attr), attr.get_string(), 'value')
+            # Texture inputs
+            elif attr.is_textured():
+                self.add(str(attr), attr.get_texture(), 'texture')
+
+    def add(self, connection, item, kind='texture'):
+        """Records that the connection (an attribute path or a rule cell) now consumes the item."""
+        self.discard(connection)
+        self.references[connection] = (str(item), kind)
+        self.connections.setdefault(str(item), []).append(connection)
+        self.consumers.setdefault(self.get_consumer(connection), set()).add(connection)
+
+    def discard(self, connection):
+        if connection in self.references:
+            item_name = self.references.pop(connection)[0]
+            self.connections[item_name].remove(connection)
+            self.consumers.get(self.get_consumer(connection), set()).discard(connection)
+
+    def get_consumer(self, connection):
+        if isinstance(connection, tuple):
+            return connection[0]
+        return connection.rsplit('.', 1)[0]
+
+    def get_connections(self, item):
+        """Returns the connections consuming the item as a list of (connection, kind) tuples."""
+        self.index([item])
+        return [(connection, self.references[connection][1]) for connection in self.connections.get(str(item), [])]
+
+    def move(self, connection, new_item):
+        """Points a recorded connection to another item."""
+        self.add(connection, new_item, self.references[connection][1] if connection in self.references else 'texture')
+
+    def rename(self, old_name, new_name):
+        """Updates the index after an item was renamed or moved."""
+        old_name = str(old_name)
+        new_name = str(new_name)
+        for connection in list(self.connections.get(old_name, [])):
+            self.move(connection, new_name)
+        for connection in list(self.consumers.pop(old_name, ())):
+            item_name, kind = self.references[connection]
+            self.discard(connection)
+            if isinstance(connection, tuple):
+                connection = (new_name,) + connection[1:]
+            else:
+                connection = new_name + connection[len(old_name):]
+            self.add(connection, item_name, kind)
+        for names in (self.indexed, self.scanned):
+            if old_name in names:
+                names.discard(old_name)
+                names.add(new_name)
+
+    def remove(self, item):
+        """Forgets a deleted item and everything it consumed."""
+        item_name = str(item)
+        for connection in list(self.connections.pop(item_name, [])):
+            self.references.pop(connection, None)
+            self.consumers.get(self.get_consumer(connection), set()).discard(connection)
+        for connection in list(self.consumers.pop(item_name, ())):
+            self.discard(connection)
+        self.indexed.discard(item_name)
+        self.scanned.discard(item_name)
+
+
+def replace_connections(new_item, old_item, source_item=None, ignored_attributes=(), ignored_classes=(),
+                        dependency_index=None, **kwargs):
+    """
+    Swap existing material/texture connections with another.
+    Pass the same DependencyIndex to every call of a batch operation so consumers are only searched once.
+    """
     ix = get_ix(kwargs.get("ix"))
 
     if not source_item:
         source_item = old_item
+    if dependency_index is None:
+        dependency_index = DependencyIndex(ix)
 
-    connected_attrs = get_attrs_connected_to_item(source_item, ix=ix)
-    logging.debug('Swapping {} item connections'.format(str(len(connected_attrs))))
-    for connected_attr in connected_attrs:
-        logging.debug(str(connected_attr))
-        attr = ix.get_item(connected_attr)
+    connections = dependency_index.get_connections(source_item)
+    logging.debug('Swapping {} item connections'.format(str(len(connections))))
+    for connection, kind in connections:
+        logging.debug(str(connection))
         # Ignore object if in ignored classes
-        if hasattr(connected_attr, 'get_class_name') and connected_attr.get_class_name() in ignored_classes:
+        if ignored_classes and \
+                ix.get_item(dependency_index.get_consumer(connection)).get_class_name() in ignored_classes:
             continue
-        # You mustn't fetch shading layer inputs directly via attributes. You need to use get_rule_value
-        elif hasattr(connected_attr, 'is_kindof') and connected_attr.is_kindof('ShadingLayer'):
-            logging.debug('Attribute is Shading Layer')
-            columns = ["material", "clip_map", "displacement"]
-            sl_module = connected_attr.get_module()
-            rules = sl_module.get_rules()
-            for row in range(0, rules.get_count()):
-                for column in columns:
-                    if str(sl_module.get_rule_value(row, column)) == str(old_item):
-                        logging.debug('Swapping rule value index: {}, column: {}'.format(row, column))
-                        sl_module.set_rule_value(row, column, str(new_item))
-                        ix.application.check_for_events()
+        # Shading layer rules are set with set_rule_value
+        if kind == 'rule':
+            shading_layer, row, column = connection
+            logging.debug('Swapping rule value index: {}, column: {}'.format(row, column))
+            ix.get_item(shading_layer).get_module().set_rule_value(row, column, str(new_item))
+            pump_events(ix=ix)
         # Attributes
         else:
-            attr_name = attr.get_name()
+            attr_name = connection.rsplit('.', 1)[-1].split('[')[0]
             logging.debug('Attribute name: ' + attr_name)
-            # parent_obj = attr.get_parent_object()
-            # logging.debug('Parent node: ' + str(parent_obj))
-            # logging.debug('Parent class: ' + parent_obj.get_class_name())
             if attr_name in ignored_attributes:
                 logging.debug('Ignoring attribute')
                 continue
             # Object references
-            if attr.get_type() in [5, 6]:
+            if kind == 'value':
                 logging.debug('Type: Object reference')
-                ix.cmds.SetValues([str(connected_attr)], [str(new_item)])
+                ix.cmds.SetValues([connection], [str(new_item)])
             # Texture connections
             else:
                 logging.debug('Type: Texture')
-                ix.cmds.SetTexture([str(connected_attr)], str(new_item))
+                ix.cmds.SetTexture([connection], str(new_item))
+        dependency_index.move(connection, new_item)
 
 
-def toggle_map_file_stream(tx, **kwargs):
+def toggle_map_file_stream(tx, dependency_index=None, **kwargs):
     """Switches from TextureMapFile to TextureStreamedMapFile and vice versa."""
     ix = get_ix(kwargs.get("ix"))
     ctx = tx.get_context()
@@ -664,7 +1035,7 @@ def toggle_map_file_stream(tx, **kwargs):
         new_tx = ix.cmds.CreateObject(temp_name, "TextureStreamedMapFile", "Global", str(ctx))
         default_color_space = ix.api.ColorIO.get_color_space_names()[0]
         ix.cmds.SetValue(str(new_tx) + '.color_space_auto_detect', [str(0)])
-        ix.application.check_for_events()
+        pump_events(force=True, ix=ix)
         ix.cmds.SetValue(str(new_tx) + '.file_color_space', [default_color_space])
 
         single_channel = tx.attrs.single_channel_file_behavior[0] == 1
@@ -678,7 +1049,7 @@ def toggle_map_file_stream(tx, **kwargs):
             out_tx = reorder_tx
     elif tx.is_kindof('TextureStreamedMapFile'):
         new_tx = ix.cmds.CreateObject(temp_name, "TextureMapFile", "Global", str(ctx))
-        ix.application.check_for_events()
+        pump_events(ix=ix)
         out_tx = new_tx
 
         connected_textures = get_textures_connected_to_texture(tx, ix=ix)
@@ -696,7 +1067,8 @@ def toggle_map_file_stream(tx, **kwargs):
 
     source_item = reorder_tx if tx.is_kindof('TextureStreamedMapFile') else None
 
-    replace_connections(out_tx, tx, source_item=source_item, ignored_attributes=['runtime_materials', ], ix=ix)
+    replace_connections(out_tx, tx, source_item=source_item, ignored_attributes=['runtime_materials', ],
+                        dependency_index=dependency_index, ix=ix)
 
     # Transfer all attributes
     filename_sys_value = []
@@ -762,14 +1134,21 @@ def toggle_map_file_stream(tx, **kwargs):
     if new_tx.is_kindof('TextureStreamedMapFile'):
         ix.cmds.SetValue(str(new_tx) + '.interpolation_mode', [str(3)])
         ix.cmds.SetValue(str(new_tx) + '.mipmap_mode', [str(3)])
-    ix.application.check_for_events()
-    ix.cmds.RenameItem(str(new_tx), tx_name)
+    pump_events(ix=ix)
+    new_tx_name = str(new_tx)
+    ix.cmds.RenameItem(new_tx_name, tx_name)
+    if dependency_index:
+        for delete_item in delete_items:
+            dependency_index.remove(delete_item)
+        dependency_index.rename(new_tx_name, new_tx)
     return new_tx
 
 
-def convert_tx(tx, extension, target_folder=None, replace=True, update=False, convert_srgb_to_linear=True, **kwargs):
-    """Converts the selected texture. Update argument will force newer files to be reconverted."""
-    logging.debug("Converting texture: {} to .{}".format(str(tx), extension))
+def prepare_conversion(tx, extension, target_folder=None, replace=True, update=False, convert_srgb_to_linear=True,
+                       **kwargs):
+    """Collects the files of the texture that need to be converted. Doesn't change the texture node yet."""
+    import platform
+    logging.debug("Preparing conversion of texture: {} to .{}".format(str(tx), extension))
     ix = get_ix(kwargs.get("ix"))
 
     file_path = tx.attrs.filename.attr.get_string()
@@ -781,52 +1160,34 @@ def convert_tx(tx, extension, target_folder=None, replace=True, update=False, co
     new_file_path = os.path.normpath(
         os.path.join(target_folder, source_filename + '.' + extension))
 
-    thread_count = ix.application.get_max_thread_count()
-    if thread_count > 32:
-        thread_count = 32
-
     convert_srgb_to_linear_arg = ""
     srgb_color_space = "Utility|Utility - sRGB - Texture" if get_aces_installed(ix=ix) else "sRGB"
     if convert_srgb_to_linear and tx.attrs.file_color_space.attr.get_string() == srgb_color_space:
         convert_srgb_to_linear_arg = " --colorconvert sRGB linear"
 
-    command_arguments = {'threads': thread_count, 'convert_srgb_to_linear': convert_srgb_to_linear_arg}
+    command_arguments = {'convert_srgb_to_linear': convert_srgb_to_linear_arg}
     clarisse_dir = ix.application.get_factory().get_vars().get("CLARISSE_BIN_DIR").get_string()
 
+    toggle_stream = False
     if extension == 'tx':
         executable_name = 'maketx'
-        if platform.system().lower() == "windows":
-            executable_name += '.exe'
-        elif platform.system().lower().startswith("linux"):
-            os.environ['LD_LIBRARY_PATH'] = os.path.normpath(clarisse_dir)
-        elif platform.system().lower() == "darwin":
-            os.environ['DYLD_LIBRARY_PATH'] = os.path.normpath(clarisse_dir)
-
         if not tx.is_kindof('TextureStreamedMapFile') and replace:
-            linear_color_space = r"Utility|Utility - Linear - sRGB" if get_aces_installed(ix=ix) else "linear"
-            if not tx.attrs.color_space_auto_detect.attr.get_bool():
-                tx.attrs.file_color_space.attr.set_string(linear_color_space)
-            tx = toggle_map_file_stream(tx, ix=ix)
-        converter_path = os.path.normpath(os.path.join(clarisse_dir, executable_name))
-        command_arguments['converter'] = converter_path
+            toggle_stream = True
         command_string = r'"{converter}" -v -u --oiio --resize --threads {threads}{convert_srgb_to_linear} "{old_file}" -o "{new_file}"'
-        logging.debug('Command string:')
-        logging.debug(command_string)
     else:
         executable_name = 'iconvert'
         if tx.is_kindof('TextureStreamedMapFile') and source_ext in ['.tx', '.tex'] and replace:
-            tx = toggle_map_file_stream(tx, ix=ix)
-        if platform.system() == "Windows":
-            executable_name += '.exe'
-        elif platform.system().lower().startswith("linux"):
-            os.environ['LD_LIBRARY_PATH'] = os.path.normpath(clarisse_dir)
-        elif platform.system().lower() == "darwin":
-            os.environ['DYLD_LIBRARY_PATH'] = os.path.normpath(clarisse_dir)
-        converter_path = os.path.normpath(os.path.join(clarisse_dir, executable_name))
-        command_arguments['converter'] = converter_path
-        command_string = r'"{converter}" --threads 0 "{old_file}" "{new_file}"'
-        logging.debug('Command string:')
-        logging.debug(command_string)
+            toggle_stream = True
+        command_string = r'"{converter}" --threads {threads} "{old_file}" "{new_file}"'
+    if platform.system().lower() == "windows":
+        executable_name += '.exe'
+    elif platform.system().lower().startswith("linux"):
+        os.environ['LD_LIBRARY_PATH'] = os.path.normpath(clarisse_dir)
+    elif platform.system().lower() == "darwin":
+        os.environ['DYLD_LIBRARY_PATH'] = os.path.normpath(clarisse_dir)
+    command_arguments['converter'] = os.path.normpath(os.path.join(clarisse_dir, executable_name))
+    logging.debug('Command string:')
+    logging.debug(command_string)
 
     # Search for source and newer files that need to be updated
     conversion_files = []
@@ -853,40 +1214,235 @@ def convert_tx(tx, extension, target_folder=None, replace=True, update=False, co
     logging.debug('Conversion files:')
     logging.debug('\n'.join(conversion_files))
 
+    commands = []
     for conversion_file in conversion_files:
-        conversion_file_arguments = command_arguments
-        command_arguments['old_file'] = conversion_file
-        command_arguments['new_file'] = os.path.splitext(conversion_file)[0] + '.' + extension
+        conversion_file_arguments = dict(command_arguments)
+        conversion_file_arguments['old_file'] = conversion_file
+        conversion_file_arguments['new_file'] = os.path.splitext(conversion_file)[0] + '.' + extension
         if target_folder != file_dir:
-            command_arguments['new_file'] = os.path.join(target_folder, os.path.basename(command_arguments['new_file']))
-        else:
-            pass
-        if command_arguments['old_file'] == command_arguments['new_file']:
+            conversion_file_arguments['new_file'] = os.path.join(target_folder,
+                                                                 os.path.basename(conversion_file_arguments['new_file']))
+        if conversion_file_arguments['old_file'] == conversion_file_arguments['new_file']:
             logging.debug('File ignored because input same as output: ' + conversion_file)
             continue
-        formatted_command_string = command_string.format(**conversion_file_arguments)
-        logging.debug(formatted_command_string)
+        commands.append({'command_string': command_string, 'arguments': conversion_file_arguments})
+    return {'tx': tx, 'extension': extension, 'replace': replace, 'new_file_path': new_file_path,
+            'toggle_stream': toggle_stream, 'commands': commands, 'results': [], 'errors': []}
+
+
+def get_file_hash(path, block_size=1024 * 1024):
+    """Returns the SHA-1 hex digest of the file contents."""
+    import hashlib
+    file_hash = hashlib.sha1()
+    with open(path, 'rb') as f:
+        block = f.read(block_size)
+        while block:
+            file_hash.update(block)
+            block = f.read(block_size)
+    return file_hash.hexdigest()
+
+
+def get_conversion_record_path(new_file):
+    """Returns the path of the sidecar record of a converted file. Records live in a hidden directory next to the
+    converted files so they travel along when the library is copied."""
+    directory, filename = os.path.split(new_file)
+    return os.path.join(directory, CONVERSION_CACHE_DIRNAME, filename + '.json')
+
+
+def get_conversion_key(command):
+    """Returns what identifies a conversion besides its source file: the converter binary, its arguments and the
+    color space conversion flag. Input, output and thread count don't change the result so they're left out."""
+    arguments = command['arguments']
+    converter = arguments['converter']
+    try:
+        converter_size = os.path.getsize(converter)
+    except OSError:
+        converter_size = None
+    template = command['command_string'].replace('{old_file}', '').replace('{new_file}', '').replace('{threads}', '')
+    template_arguments = dict(arguments, converter=os.path.basename(converter), old_file='', new_file='', threads='')
+    return {'converter': os.path.basename(converter), 'converter_size': converter_size,
+            'arguments': template.format(**template_arguments),
+            'convert_srgb_to_linear': bool(arguments.get('convert_srgb_to_linear'))}
+
+
+def read_conversion_record(new_file):
+    try:
+        with open(get_conversion_record_path(new_file)) as record_file:
+            return json.load(record_file)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def write_conversion_record(new_file, record):
+    record_path = get_conversion_record_path(new_file)
+    try:
+        if not os.path.isdir(os.path.dirname(record_path)):
+            os.makedirs(os.path.dirname(record_path))
+        with open(record_path, 'w') as record_file:
+            json.dump(record, record_file)
+    except (IOError, OSError) as e:
+        logging.debug('Could not write conversion record: ' + str(e))
+
+
+def is_conversion_current(command, **kwargs):
+    """Checks if the converted file already is the result of converting the current source with the same converter
+    and arguments. Source mtime and size are compared first, the content hash only when the mtime changed.
+    Returns the updated record if the conversion can be skipped, None otherwise."""
+    old_file = command['arguments']['old_file']
+    new_file = command['arguments']['new_file']
+    record = read_conversion_record(new_file)
+    if not record or record.get('key') != kwargs.get('key', get_conversion_key(command)):
+        return None
+    try:
+        source_stat = os.stat(old_file)
+        if os.path.getsize(new_file) != record.get('output_size'):
+            return None
+    except OSError:
+        return None
+    if source_stat.st_size != record.get('source_size'):
+        return None
+    if source_stat.st_mtime != record.get('source_mtime'):
+        if get_file_hash(old_file) != record.get('source_hash'):
+            return None
+        record['source_mtime'] = source_stat.st_mtime
+    return record
+
+
+def run_conversion(command, threads=1):
+    """Runs a single converter command and checks its output. Doesn't touch Clarisse so it's thread safe.
+    Conversions whose result already exists are skipped when the conversion cache is enabled."""
+    import subprocess
+    arguments = dict(command['arguments'], threads=threads)
+    result = {'old_file': arguments['old_file'], 'new_file': arguments['new_file'], 'output': '', 'error': None,
+              'skipped': False}
+    if CONVERSION_CACHE_ENABLED:
+        key = get_conversion_key(command)
+        record = is_conversion_current(command, key=key)
+        if record:
+            logging.debug('Conversion skipped, converted file is up to date: ' + arguments['new_file'])
+            write_conversion_record(arguments['new_file'], record)
+            result['skipped'] = True
+            return result
+    formatted_command_string = command['command_string'].format(**arguments)
+    logging.debug(formatted_command_string)
+    try:
         conversion = subprocess.Popen(formatted_command_string, stdout=subprocess.PIPE, shell=True)
         out, err = conversion.communicate()
-        if out.strip():
-            logging.debug(str(out))
-            print(out)
-        if err:
-            logging.debug(str(err))
-            print(err)
-        if err or not os.path.exists(command_arguments['new_file']) or \
-                        os.path.getsize(command_arguments['new_file']) < 10:
-            error_msg = 'ERROR: File has not been converted. Failed to find new converted file: ' + \
-                        command_arguments['new_file']
-            print(error_msg)
-            ix.log_error(error_msg)
-            return tx
+    except (OSError, ValueError) as e:
+        result['error'] = str(e)
+        return result
+    if out.strip():
+        result['output'] = out
+    if err:
+        result['error'] = str(err)
+    elif not is_valid_image(arguments['new_file']):
+        result['error'] = 'Failed to find new converted file: ' + arguments['new_file']
+    else:
         try:
-            os.utime(command_arguments['new_file'], None)
+            os.utime(arguments['new_file'], None)
         except Exception:
             logging.debug('******ERROR couldn\'t set utime in file******')
-            pass
+        if CONVERSION_CACHE_ENABLED:
+            try:
+                source_stat = os.stat(arguments['old_file'])
+                write_conversion_record(arguments['new_file'], {
+                    'key': key, 'source_hash': get_file_hash(arguments['old_file']),
+                    'source_size': source_stat.st_size, 'source_mtime': source_stat.st_mtime,
+                    'output_size': os.path.getsize(arguments['new_file'])})
+            except (IOError, OSError) as e:
+                logging.debug('Could not record conversion: ' + str(e))
+    return result
+
 
-    if replace:
-        tx.attrs.filename = os.path.normpath(new_file_path)
+def finish_conversion(job, dependency_index=None, **kwargs):
+    """Updates the texture node after all of its files were converted. Nodes with failed files are left untouched."""
+    ix = get_ix(kwargs.get("ix"))
+    tx = job['tx']
+    for result in job['results']:
+        if result['output']:
+            logging.debug(str(result['output']))
+            print(result['output'])
+    if job['errors']:
+        for result in job['errors']:
+            error_msg = 'ERROR: File has not been converted. ' + str(result['error'])
+            print(error_msg)
+            ix.log_error(error_msg)
+        return tx
+    if job['toggle_stream']:
+        if job['extension'] == 'tx':
+            linear_color_space = r"Utility|Utility - Linear - sRGB" if get_aces_installed(ix=ix) else "linear"
+            if not tx.attrs.color_space_auto_detect.attr.get_bool():
+                tx.attrs.file_color_space.attr.set_string(linear_color_space)
+        tx = toggle_map_file_stream(tx, dependency_index=dependency_index, ix=ix)
+        job['tx'] = tx
+    if job['replace']:
+        tx.attrs.filename = os.path.normpath(job['new_file_path'])
     return tx
+
+
+def get_conversion_threads(job_count, max_jobs=CONVERSION_MAX_JOBS, **kwargs):
+    """Balances the number of parallel jobs against the threads per job so the total doesn't exceed the thread count
+    of the application. Returns a tuple of the job count and the threads per job."""
+    ix = get_ix(kwargs.get("ix"))
+    thread_count = min(ix.application.get_max_thread_count(), CONVERSION_MAX_THREADS)
+    if not max_jobs:
+        max_jobs = max(1, thread_count // CONVERSION_THREADS_PER_JOB)
+    jobs = max(1, min(job_count, max_jobs, thread_count))
+    return jobs, max(1, thread_count // jobs)
+
+
+def convert_textures(textures, extension=None, target_folder=None, replace=True, update=False,
+                     convert_srgb_to_linear=True, max_jobs=CONVERSION_MAX_JOBS, callback=None, **kwargs):
+    """Converts the textures and their UDIM tiles on a bounded pool of converter processes.
+    Without an extension every texture is converted to its own file format. Texture nodes are updated as soon as all
+    of their files finished. The callback is called with every finished job. Returns the list of jobs."""
+    ix = get_ix(kwargs.get("ix"))
+    jobs = []
+    for tx in textures:
+        tx_extension = extension
+        if not tx_extension:
+            tx_extension = os.path.splitext(tx.attrs.filename.attr.get_string())[-1].lstrip('.')
+        jobs.append(prepare_conversion(tx, tx_extension, target_folder=target_folder, replace=replace, update=update,
+                                       convert_srgb_to_linear=convert_srgb_to_linear, ix=ix))
+    tasks = [(job, command) for job in jobs for command in job['commands']]
+    remaining = dict((id(job), len(job['commands'])) for job in jobs)
+    # Toggled texture nodes swap their connections, so their consumers are looked up once for all jobs.
+    dependency_index = DependencyIndex(ix, [job['tx'] for job in jobs if job['toggle_stream']])
+    for job in jobs:
+        if not job['commands']:
+            finish_conversion(job, dependency_index=dependency_index, ix=ix)
+            if callback:
+                callback(job)
+    if not tasks:
+        return jobs
+    pool_size, threads = get_conversion_threads(len(tasks), max_jobs=max_jobs, ix=ix)
+    logging.debug("Converting %i files with %i jobs of %i threads" % (len(tasks), pool_size, threads))
+    # Only texture conversions need the thread pool so it isn't imported at startup.
+    import multiprocessing.dummy as mp
+    pool = mp.Pool(pool_size)
+    try:
+        for index, result in pool.imap_unordered(
+                lambda task: (task[0], run_conversion(task[1][1], threads=threads)), enumerate(tasks)):
+            job = tasks[index][0]
+            if result['error']:
+                job['errors'].append(result)
+            else:
+                job['results'].append(result)
+            remaining[id(job)] -= 1
+            if not remaining[id(job)]:
+                finish_conversion(job, dependency_index=dependency_index, ix=ix)
+                if callback:
+                    callback(job)
+    finally:
+        pool.close()
+        pool.join()
+    return jobs
+
+
+def convert_tx(tx, extension, target_folder=None, replace=True, update=False, convert_srgb_to_linear=True, **kwargs):
+    """Converts the selected texture. Update argument will force newer files to be reconverted."""
+    logging.debug("Converting texture: {} to .{}".format(str(tx), extension))
+    ix = get_ix(kwargs.get("ix"))
+    jobs = convert_textures([tx], extension=extension, target_folder=target_folder, replace=replace, update=update,
+                            convert_srgb_to_linear=convert_srgb_to_linear, ix=ix)
+    return jobs[0]['tx']